@@ -1,22 +1,20 @@
 import streamlit as st
 from uuid import uuid4
-# import time
+import time
 import os
 import subprocess
-from backend.RAG import initialize_milvus, query_rag, get_corpus
-from collections import defaultdict
+import sys
 import pandas as pd
 from metrics.chatbot_statistics import DatabaseClient  # Import the DatabaseClient class
 from backend.ddos_protection import handle_rate_limiting  # Importing the rate-limiting function
+# backend.RAG and backend.async_engine are imported where they are used: loading them takes seconds,
+# so the warmup thread imports them in the background while the page renders
+from backend.warmup import start_warmup
 
-
-def initialize_vector_store():
-    """
-    Initialize the vector store for storing the embeddings of the questions.
-    """
-    if not hasattr(os.environ, "vector_store_initialized"):
-        initialize_milvus()
-        os.environ.vector_store_initialized = True
+# Stream the answer into the chat as it is generated; set to 0 to wait for the complete answer instead
+STREAMING_ENABLED = os.environ.get("STREAMING_ENABLED", "1") == "1"
+# Answer through the shared async query engine; set to 0 to run each query on the session's script thread instead
+QUERY_ENGINE_ENABLED = os.environ.get("QUERY_ENGINE_ENABLED", "1") == "1"
 
 def remove_special_characters(input_string):
     """
@@ -48,16 +46,12 @@ class StreamlitApp:
         if "app_initialized" not in st.session_state:
             st.session_state.app_initialized = False
         if not st.session_state.app_initialized:
-            with st.spinner("Initializing ITS Support Chatbot: May take up to 2 minutes..."):
-                if 'user_requests' not in st.session_state:
-                    st.session_state.user_requests = defaultdict(list)
+            with st.spinner("Initializing ITS Support Chatbot..."):
+                if 'current_user' not in st.session_state:
                     st.session_state.current_user = None
-                if 'lockout_time' not in st.session_state:
-                    st.session_state.lockout_time = defaultdict(lambda: 0)
                 if "messages" not in st.session_state:
                     self.db_client.create_performance_metrics_table()
                     self.db_client.insert_default_performance_metrics()
-                    initialize_vector_store()
                     st.session_state.messages = {}
                     st.session_state.app_initialized = True
         # Answerable and Unanswerable questions
@@ -186,6 +180,100 @@ class StreamlitApp:
             self.db_client.reset_performance_metrics()
             # st.rerun()
 
+    @staticmethod
+    @st.fragment(run_every=1)
+    def display_warmup_status(warmup):
+        """
+        Show what the background warmup is doing, refreshing every second, and rerun the app once it is done.
+
+        Args:
+            warmup (Warmup): The process-wide warmup.
+        """
+        status = warmup.status()
+        if status["state"] != "running":
+            st.rerun()
+        step = status["message"] or status["step"] or "Starting"
+        st.info(f"Warming up the chatbot ({status['elapsed']:.0f}s): {step}...")
+
+    @staticmethod
+    def display_startup_report(warmup):
+        """
+        Show the startup timing report in the sidebar, and the errors of a failed warmup.
+
+        Args:
+            warmup (Warmup): The process-wide warmup.
+        """
+        if warmup.state == "failed":
+            st.error("The chatbot could not be initialized: " + "; ".join(warmup.errors.values()))
+        with st.sidebar.expander("Startup timings"):
+            st.code(warmup.report(), language=None)
+
+    @staticmethod
+    def display_refresh_metrics():
+        """
+        Show the duration and diff size of the background corpus refreshes in the sidebar.
+        """
+        import backend.refresh
+
+        refresher = backend.refresh.CORPUS_REFRESHER
+        if refresher is None or refresher.next_refresh is None:
+            return
+        stats = refresher.stats()
+        with st.sidebar.expander("Corpus refresh"):
+            last_refresh = stats["last_refresh"]
+            if last_refresh is not None:
+                st.markdown(
+                    f"Last refresh {(time.time() - last_refresh['finished_at']) / 60:.0f} min ago took {last_refresh['duration']:.1f}s: "
+                    f"{last_refresh['changed_pages']} changed and {last_refresh['removed_pages']} removed pages, "
+                    f"{last_refresh['inserted']} chunks inserted, {last_refresh['deleted']} deleted"
+                )
+            st.markdown(
+                f"{stats['refreshes']} refreshes ({stats['switches']} switched the collection), {stats['failures']} failed; "
+                f"next in {max(0.0, stats['next_refresh'] - time.time()) / 3600:.1f} h"
+            )
+
+    @staticmethod
+    def display_latency_metrics():
+        """
+        Show the p50/p95/p99 latency of each traced stage of answering a query and loading the vector store in the sidebar.
+        When answers are streamed, the headline is the time to the first token, which is what users wait for.
+        """
+        from backend.tracing import get_tracer
+
+        summary = get_tracer().summary()
+        headlines = [("query.total", "Response time")]
+        if STREAMING_ENABLED:
+            headlines.insert(0, ("query.first_token", "Time to first token"))
+        for name, label in headlines:
+            stats = summary.get(name)
+            if stats is not None:
+                st.sidebar.markdown(
+                    f"<div class='normal-metrics'>{label} p50/p95/p99: {stats['p50']:.2f}s / {stats['p95']:.2f}s / {stats['p99']:.2f}s</div>",
+                    unsafe_allow_html=True,
+                )
+        from backend.context_packing import CONTEXT_PACKING_STATS
+
+        packing = CONTEXT_PACKING_STATS.snapshot()
+        if packing["queries"]:
+            st.sidebar.markdown(
+                f"<div class='normal-metrics'>Context tokens per query: {packing['tokens_before'] / packing['queries']:.0f} retrieved, "
+                f"{packing['tokens_after'] / packing['queries']:.0f} sent</div>",
+                unsafe_allow_html=True,
+            )
+        if not summary:
+            return
+        with st.sidebar.expander("Latency by stage"):
+            st.dataframe(
+                pd.DataFrame(
+                    [
+                        [name, stats["count"], stats["p50"] * 1000, stats["p95"] * 1000, stats["p99"] * 1000]
+                        for name, stats in summary.items()
+                    ],
+                    columns=["stage", "count", "p50 ms", "p95 ms", "p99 ms"],
+                ).round(1),
+                hide_index=True,
+            )
+
     def handle_feedback(self, assistant_message_id):
         """
         Handle feedback for a message.
@@ -262,6 +350,33 @@ class StreamlitApp:
             else:
                 st.markdown(f"<div class='user-message'>{message['content']}</div>", unsafe_allow_html=True)
 
+    @staticmethod
+    def stream_response(prompt):
+        """
+        Render the response to a query incrementally as the LLM generates it.
+
+        Args:
+            prompt (str): The user query.
+
+        Returns:
+            tuple: The final answer and its source, as returned by query_rag.
+        """
+        from backend.RAG import query_rag_stream
+        from backend.async_engine import get_query_engine
+
+        stream = get_query_engine().stream(prompt) if QUERY_ENGINE_ENABLED else query_rag_stream(prompt)
+        tokens = iter(stream)
+        with st.spinner('Generating Response...'):
+            text = next(tokens, "")
+        message_placeholder = st.empty()
+        message_placeholder.markdown(f"<div class='assistant-message'>{text}</div>", unsafe_allow_html=True)
+        for token in tokens:
+            text += token
+            message_placeholder.markdown(f"<div class='assistant-message'>{text}</div>", unsafe_allow_html=True)
+        if stream.source is None:
+            message_placeholder.empty()
+        return stream.answer, stream.source
+
     @staticmethod
     def run_query(prompt=None, user_message_id=None, assistant_message_id=None):
         """
@@ -273,6 +388,9 @@ class StreamlitApp:
         Returns:
             str: The response to the user query.
         """
+        from backend.RAG import get_corpus, query_rag
+        from backend.async_engine import get_query_engine
+
         # Generate a response based on the user query
         if user_message_id is None:
             user_message_id = st.session_state.get("QUERY_RUNNING")
@@ -283,12 +401,15 @@ class StreamlitApp:
         print(prompt)
         response_placeholder = st.empty()
         with response_placeholder.container():
-            with st.spinner('Generating Response...'):
-                # answer, source = None, None
-                # if not st.session_state.get("QUERY_RUNNING", None):
-                if len(st.session_state.messages) > 1:
-                    st.session_state["QUERY_RUNNING"] = user_message_id
-                answer, source = query_rag(prompt)
+            # answer, source = None, None
+            # if not st.session_state.get("QUERY_RUNNING", None):
+            if len(st.session_state.messages) > 1:
+                st.session_state["QUERY_RUNNING"] = user_message_id
+            if STREAMING_ENABLED:
+                answer, source = StreamlitApp.stream_response(prompt)
+            else:
+                with st.spinner('Generating Response...'):
+                    answer, source = get_query_engine().query(prompt) if QUERY_ENGINE_ENABLED else query_rag(prompt)
 
             if source is None:
                 st.error(f"{answer}")
@@ -324,6 +445,16 @@ class StreamlitApp:
         
         # displays the performance metrics in the sidebar   
         self.display_performance_metrics()
+        self.display_latency_metrics()
+
+        # The model and vector store load in the background; the page is usable except for asking questions until they are ready
+        warmup = start_warmup()
+        if warmup.is_running():
+            self.display_warmup_status(warmup)
+            st.chat_input("Please wait, the chatbot is starting up.", disabled=True)
+            st.stop()
+        self.display_startup_report(warmup)
+        self.display_refresh_metrics()
 
         # Check if a query is currently running
         if st.session_state.get("QUERY_RUNNING"):
@@ -367,7 +498,8 @@ if __name__ == "__main__":
         os.environ["STREAMLIT_RUNNING"] = "1"
         with open('/app/logs/app.log', 'w') as file:
             file.write('')
-        subprocess.Popen(["streamlit", "run", __file__, "--server.port=5001", "--server.address=0.0.0.0", "--server.baseUrlPath=/team1"])
+        # Runs Streamlit in-process with the backend warmup started before the first session connects
+        subprocess.Popen([sys.executable, "-m", "backend.server", __file__, "--server.port=5001", "--server.address=0.0.0.0", "--server.baseUrlPath=/team1"])
         subprocess.run(["jupyter", "notebook", "--ip=0.0.0.0", "--port=6001", "--no-browser", "--allow-root", "--NotebookApp.base_url=/team1/jupyter"])
     else:
         app = StreamlitApp(st.session_state)
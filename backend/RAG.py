@@ -1,26 +1,30 @@
 CORPUS_SOURCE = 'https://www.csusb.edu/its'
 
 import hashlib
+import json
 import os
 import streamlit as st
 import time
 import re
 import numpy as np
 import hashlib
-import asyncio
-from langchain_groq.chat_models import ChatGroq
-from concurrent.futures import ThreadPoolExecutor
+import threading
 from dotenv import load_dotenv
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.schema import Document
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.document_loaders import RecursiveUrlLoader, WebBaseLoader
-from bs4 import BeautifulSoup
-from sentence_transformers import SentenceTransformer
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
 from httpx import HTTPStatusError
 from backend.retriever import ScoreThresholdRetriever
+from backend.answer_cache import SemanticAnswerCache
+from backend.context_packing import CONTEXT_MMR_LAMBDA, CONTEXT_TOKEN_BUDGET, ContextPacker
+from backend.embedding_cache import QueryEmbeddingCache
+from backend.embedding_server import EmbeddingBatcher
+from backend.embedding_backends import load_embedding_model
+from backend.crawler import CrawlManifest, IncrementalCrawler
+from backend.html_cleaning import clean_html_stream
+from backend.intent_router import FILTERED_QUERY_PATTERN, INTENT_ROUTER_ENABLED, IntentRouter
+from backend.ingestion import INGESTION_QUEUE_SIZE, IngestionManifest, batched, run_in_background
+from backend.tracing import get_tracer, span, traced
+from backend.vector_index import ensure_index, get_index_params, get_search_params
 
 #from selenium import webdriver
 #from selenium.webdriver.common.by import By
@@ -32,9 +36,67 @@ load_dotenv()
 #MISTRAL_API_KEY = os.environ.get("MISTRAL_API_KEY")
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
 MILVUS_URI = "/app/milvus/milvus_vector.db"
+CRAWL_MANIFEST_PATH = os.path.join(os.path.dirname(MILVUS_URI), "crawl_manifest.json")
+INGESTION_MANIFEST_PATH = os.path.join(os.path.dirname(MILVUS_URI), "ingestion_manifest.json")
+# Bump when the collection schema or the way pages are cleaned and split changes, so the collection is rebuilt
+COLLECTION_SCHEMA_VERSION = 1
+# A collection crawled more than this many seconds ago is re-synced with the website: in the background by backend.refresh,
+# or at startup when background refreshes are disabled; 0 disables background refreshes and re-syncs on every start
+CORPUS_MAX_AGE = float(os.environ.get("CORPUS_MAX_AGE", 24 * 3600))
+# Set to 1 to re-sync the collection at startup even if it is fresh
+CORPUS_REFRESH_ON_START = os.environ.get("CORPUS_REFRESH_ON_START", "0") == "1"
+CRAWL_EXCLUDE_DIRS = ['https://www.csusb.edu/its/support/it-knowledge-base',
+                      'https://www.csusb.edu/its/support/knowledge-base']
 MODEL_NAME = "sentence-transformers/all-MiniLM-L12-v2"
 MAX_TEXT_LENGTH = 5000
+EMBEDDING_DIMENSION = 384
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 64))
+# Inference backend of the embedding model: torch, onnx or onnx-int8 (see backend.embedding_backends)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL_CACHE_DIR = os.environ.get("EMBEDDING_MODEL_CACHE_DIR", os.path.join(os.path.dirname(MILVUS_URI), "models"))
 EMBEDDING_MODEL = None
+EMBEDDING_MODEL_LOCK = threading.Lock()
+# Query embeddings go through a micro-batching embedding server; set to 0 to encode each query on the calling thread
+EMBEDDING_SERVER_ENABLED = os.environ.get("EMBEDDING_SERVER_ENABLED", "1") == "1"
+EMBEDDING_SERVER_MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_SERVER_MAX_BATCH_SIZE", 32))
+EMBEDDING_SERVER_MAX_WAIT_MS = float(os.environ.get("EMBEDDING_SERVER_MAX_WAIT_MS", 2))
+EMBEDDING_SERVER = None
+EMBEDDING_SERVER_LOCK = threading.Lock()
+INSERT_BATCH_SIZE = int(os.environ.get("INSERT_BATCH_SIZE", 1000))
+DELETE_BATCH_SIZE = int(os.environ.get("DELETE_BATCH_SIZE", 1000))
+COLLECTION_NAME = re.sub(r'\W+', '', CORPUS_SOURCE)
+# Background refreshes build the next version of the corpus in the other of two collections, COLLECTION_NAME
+# and COLLECTION_NAME + SHADOW_COLLECTION_SUFFIX, and then switch queries over to it
+SHADOW_COLLECTION_SUFFIX = "_shadow"
+# The collection queries currently go to; None means COLLECTION_NAME
+ACTIVE_COLLECTION_NAME = None
+# Held while the vector store is synced, so a startup sync and a background refresh never overlap
+VECTOR_STORE_LOCK = threading.Lock()
+LLM_MODEL = os.environ.get("LLM_MODEL", "llama-3.1-70b-versatile")
+LLM_TEMPERATURE = float(os.environ.get("LLM_TEMPERATURE", 0))
+# Minimum normalized score, (1 + cosine similarity) / 2, of a retrieved chunk; a query with no chunk above it gets
+# the insufficient information response without calling the LLM (see benchmarks/threshold_eval.py to tune it)
+RETRIEVER_SCORE_THRESHOLD = float(os.environ.get("RETRIEVER_SCORE_THRESHOLD", 0.7))
+RETRIEVER_K = 5
+# Where queries are searched: "milvus", or "numpy" for exact search of an in-memory copy of the embeddings,
+# which is faster and exact for small corpora (see backend.exact_search)
+RETRIEVER_BACKEND = os.environ.get("RETRIEVER_BACKEND", "milvus").lower()
+RETRIEVER_BACKENDS = ["milvus", "numpy"]
+EXACT_SEARCH_CACHE_DIR = os.environ.get("EXACT_SEARCH_CACHE_DIR", os.path.join(os.path.dirname(MILVUS_URI), "exact_search"))
+RAG_PIPELINE = None
+RAG_PIPELINE_LOCK = threading.Lock()
+ANSWER_CACHE = SemanticAnswerCache(
+    max_entries=int(os.environ.get("ANSWER_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("ANSWER_CACHE_TTL", 3600)),
+    similarity_threshold=float(os.environ.get("ANSWER_CACHE_SIMILARITY", 0.95)),
+)
+INTENT_ROUTER = None
+INTENT_ROUTER_LOCK = threading.Lock()
+QUERY_EMBEDDING_CACHE = QueryEmbeddingCache(
+    max_entries=int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 1024)),
+    path=os.environ.get("QUERY_EMBEDDING_CACHE_PATH") or None,
+    model=f"{MODEL_NAME} ({EMBEDDING_BACKEND})",
+)
 
 def get_embedding_model():
     """
@@ -45,25 +107,257 @@ def get_embedding_model():
     """
     global EMBEDDING_MODEL
     if EMBEDDING_MODEL is None:
-        EMBEDDING_MODEL = SentenceTransformer(MODEL_NAME)
+        with EMBEDDING_MODEL_LOCK:
+            if EMBEDDING_MODEL is None:
+                EMBEDDING_MODEL = load_embedding_model(MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_MODEL_CACHE_DIR)
     return EMBEDDING_MODEL
 
+def embed_texts(texts, batch_size=EMBEDDING_BATCH_SIZE, progress_callback=None):
+    """
+    Embed a list of texts in batches
+
+    Args:
+        texts (list): The texts to embed
+        batch_size (int, optional): The number of texts encoded per model call. Defaults to EMBEDDING_BATCH_SIZE.
+        progress_callback (callable, optional): Called with (done, total) after every batch. Defaults to None.
+
+    Returns:
+        np.ndarray: A contiguous float32 matrix of shape (len(texts), EMBEDDING_DIMENSION) with L2-normalized rows
+    """
+    model = get_embedding_model()
+    number_of_texts = len(texts)
+    embeddings = np.empty((number_of_texts, EMBEDDING_DIMENSION), dtype=np.float32)
+    for start in range(0, number_of_texts, batch_size):
+        batch = texts[start:start + batch_size]
+        embeddings[start:start + len(batch)] = model.encode(
+            batch,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        if progress_callback is not None:
+            progress_callback(start + len(batch), number_of_texts)
+    return embeddings
+
+def encode_queries(queries):
+    """
+    Encode a batch of queries in one model call
+
+    Args:
+        queries (list): The queries to encode
+
+    Returns:
+        np.ndarray: One L2-normalized embedding per query
+    """
+    return get_embedding_model().encode(
+        queries,
+        batch_size=len(queries),
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+
+def get_embedding_server():
+    """
+    Get the process-wide embedding server that micro-batches the queries of concurrent sessions
+
+    Returns:
+        EmbeddingBatcher: The shared embedding server
+    """
+    global EMBEDDING_SERVER
+    if EMBEDDING_SERVER is None:
+        with EMBEDDING_SERVER_LOCK:
+            if EMBEDDING_SERVER is None:
+                EMBEDDING_SERVER = EmbeddingBatcher(
+                    encode_queries,
+                    max_batch_size=EMBEDDING_SERVER_MAX_BATCH_SIZE,
+                    max_wait_ms=EMBEDDING_SERVER_MAX_WAIT_MS,
+                )
+    return EMBEDDING_SERVER
+
+def embed_query(query):
+    """
+    Embed a query, reusing the embedding of a previously seen (normalized) identical query
+
+    Args:
+        query (str): The query to embed
+
+    Returns:
+        list: The normalized query embedding
+    """
+    if EMBEDDING_SERVER_ENABLED:
+        encode = get_embedding_server().encode
+    else:
+        encode = lambda text: get_embedding_model().encode(text, normalize_embeddings=True)
+    embedding = QUERY_EMBEDDING_CACHE.get_or_compute(query, encode)
+    return embedding.tolist()
+
+class RAGPipeline:
+    """
+    The query-independent components of the RAG model: chat model, prompt, retriever,
+    document chain and collection handle. Built once per process and shared across sessions.
+
+    Attributes:
+        config (dict): The configuration the pipeline was built with.
+        build_timings (dict): Seconds spent constructing each component.
+    """
+
+    def __init__(self, config):
+        """
+        Build the pipeline components.
+
+        Args:
+            config (dict): The configuration returned by get_pipeline_config.
+        """
+        # Imported here rather than at module level: langchain_groq pulls in transformers and torch,
+        # which would otherwise make every import of this module take seconds
+        from langchain.chains.combine_documents import create_stuff_documents_chain
+        from langchain_groq.chat_models import ChatGroq
+
+        self.config = config
+        self.build_timings = {}
+        self.chat_model = self._timed("chat_model", lambda: ChatGroq(model=config["llm_model"], temperature=config["llm_temperature"]))
+        self.prompt = self._timed("prompt", create_prompt)
+        self.document_chain = self._timed("document_chain", lambda: create_stuff_documents_chain(self.chat_model, self.prompt))
+        self.collection = self._timed("collection", lambda: Collection(config["collection_name"]))
+        self.retriever = self._timed("retriever", lambda: create_retriever(config, self.collection))
+        self.context_packer = None
+        if config["context_token_budget"]:
+            self.context_packer = ContextPacker(token_budget=config["context_token_budget"], mmr_lambda=config["context_mmr_lambda"])
+
+    def _timed(self, name, factory):
+        start = time.perf_counter()
+        component = factory()
+        self.build_timings[name] = time.perf_counter() - start
+        return component
+
+def get_pipeline_config():
+    """
+    Get the configuration that the shared RAG pipeline depends on
+
+    Returns:
+        dict: The current pipeline configuration
+    """
+    return {
+        "llm_model": LLM_MODEL,
+        "llm_temperature": LLM_TEMPERATURE,
+        "score_threshold": RETRIEVER_SCORE_THRESHOLD,
+        "k": RETRIEVER_K,
+        "collection_name": get_active_collection_name(),
+        "search_params": get_search_params(),
+        "retriever_backend": RETRIEVER_BACKEND,
+        "context_token_budget": CONTEXT_TOKEN_BUDGET,
+        "context_mmr_lambda": CONTEXT_MMR_LAMBDA,
+    }
+
+def create_retriever(config, collection):
+    """
+    Create the retriever of the configured backend
+
+    Args:
+        config (dict): The configuration returned by get_pipeline_config
+        collection (Collection): The active collection
+
+    Returns:
+        ScoreThresholdRetriever: A retriever searching Milvus, or an ExactSearchRetriever searching a memory-mapped
+            copy of the collection's embeddings
+
+    Raises:
+        ValueError: If the retriever backend is not one of RETRIEVER_BACKENDS
+    """
+    if config["retriever_backend"] not in RETRIEVER_BACKENDS:
+        raise ValueError(f"Unsupported retriever backend {config['retriever_backend']}, expected one of {RETRIEVER_BACKENDS}")
+    # The context packer compares the retrieved chunks by their embeddings
+    return_embeddings = bool(config["context_token_budget"])
+    if config["retriever_backend"] == "milvus":
+        return ScoreThresholdRetriever(
+            score_threshold=config["score_threshold"], k=config["k"], search_params=config["search_params"], return_embeddings=return_embeddings,
+        )
+    from backend.exact_search import ExactSearchRetriever, get_embedding_matrix
+
+    # The ingestion manifest changes whenever the collection does, so the exported matrix is reused until then
+    ingestion_manifest = IngestionManifest(INGESTION_MANIFEST_PATH).data
+    stamp = None
+    if ingestion_manifest.get("active_collection", COLLECTION_NAME) == collection.name:
+        stamp = {field: ingestion_manifest.get(field) for field in ["crawled_at", "chunk_count", "active_collection"]}
+    collection.load()
+    matrix = get_embedding_matrix(collection, EXACT_SEARCH_CACHE_DIR, stamp=stamp if stamp and stamp["crawled_at"] else None)
+    return ExactSearchRetriever(score_threshold=config["score_threshold"], k=config["k"], matrix=matrix, return_embeddings=return_embeddings)
+
+def get_rag_pipeline():
+    """
+    Get the process-wide RAG pipeline, building it on first use or when its configuration changed
+
+    Returns:
+        RAGPipeline: The shared pipeline
+    """
+    global RAG_PIPELINE
+    config = get_pipeline_config()
+    pipeline = RAG_PIPELINE
+    if pipeline is not None and pipeline.config == config:
+        return pipeline
+    with RAG_PIPELINE_LOCK:
+        if RAG_PIPELINE is None or RAG_PIPELINE.config != config:
+            RAG_PIPELINE = RAGPipeline(config)
+            print("RAG Pipeline Built", RAG_PIPELINE.build_timings)
+        return RAG_PIPELINE
+
+def invalidate_rag_pipeline():
+    """
+    Drop the shared RAG pipeline so the next query rebuilds it, e.g. after the corpus changed
+    """
+    global RAG_PIPELINE
+    with RAG_PIPELINE_LOCK:
+        RAG_PIPELINE = None
+
+def invalidate_corpus_caches():
+    """
+    Invalidate everything derived from the corpus after chunks were inserted or deleted
+    """
+    invalidate_rag_pipeline()
+    ANSWER_CACHE.clear()
+
 def is_filtered_query(query):
-    patterns = [
-        r"\b(hi|hello|hey|hiya|howdy|greetings|yo)\b", # Common greetings
-        r"who (are|r) you\??", # Identity questions
-        r"what('?s| is) your name\??", # Name questions
-        r"what('?s| is) your role\??", # Role questions
-        r"(hi|hello|hey|yo),? (who are you|what('?s| is) your name)\??", # Greeting + identity
-        r"(hi|hello|hey|yo),? (what do you do|what can you do)\??", # Greeting + capability
-        r"good (morning|afternoon|evening),? (who are you|what('?s| is) your role)\??", # Polite intros
-        r"(what can you do for me)\??" # Informal assistance questions
-    ]
-    normalized = query.strip().lower()
-    for pattern in patterns:
-        if re.search(pattern, normalized):
-            return True
-    return False
+    return FILTERED_QUERY_PATTERN.search(query.strip().lower()) is not None
+
+def get_intent_router():
+    """
+    Get the process-wide intent router, embedding the intent examples on first use
+
+    Returns:
+        IntentRouter: The shared intent router
+    """
+    global INTENT_ROUTER
+    if INTENT_ROUTER is None:
+        with INTENT_ROUTER_LOCK:
+            if INTENT_ROUTER is None:
+                INTENT_ROUTER = IntentRouter(encode_queries)
+    return INTENT_ROUTER
+
+def route_query(query_embedding):
+    """
+    Answer a query without retrieval or the LLM if the intent router can: greetings and off-topic
+    questions get a canned response and near duplicates of an answered query its cached answer
+
+    Args:
+        query_embedding (list): The normalized query embedding
+
+    Returns:
+        tuple: The answer and its source, or None if the query goes on to retrieval
+    """
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    router = get_intent_router()
+    route, intent, similarity = router.classify(query_embedding)
+    if route == "rag":
+        answer = ANSWER_CACHE.lookup_similar(query_embedding, router.faq_similarity)
+        if answer is not None:
+            route = "faq"
+            print("Answer Cache Hit before retrieval")
+    else:
+        answer = greeting_response() if route == "greeting" else insufficient_information_response()
+        print(f"Query routed to {route} (intent: {intent}, similarity: {similarity:.2f})")
+    router.count(route)
+    return answer
 
 def format_source(response, default_url="https://www.csusb.edu/its", title="ITS Knowledge Base"):
     """
@@ -87,12 +381,144 @@ def format_source(response, default_url="https://www.csusb.edu/its", title="ITS
         formatted_response = response + f"\n\nSource: [{title}]({default_url})"
     return formatted_response
 
+def greeting_response():
+    """
+    Get the canned response to greetings and identity questions
+
+    Returns:
+        tuple: The answer and its source
+    """
+    if CORPUS_SOURCE == 'https://www.csusb.edu/its':
+        return f"Hi there! I am an <a href={CORPUS_SOURCE}>ITS Support Chatbot</a>. I can help you with your ITS related queries. How can I assist you today?", "Unknown"
+    return f"Hi there! I'm an AI assistant powered by <a href={CORPUS_SOURCE}>link</a>. I'm here to help with any questions you might have. How can I assist you today?", "Unknown"
+
+def insufficient_information_response():
+    """
+    Get the canned response to questions the corpus cannot answer
+
+    Returns:
+        tuple: The answer and its source
+    """
+    if CORPUS_SOURCE == 'https://www.csusb.edu/its':
+        return f"I don't have enough information to answer this question. I'm an AI assistant powered by <a href={CORPUS_SOURCE}>CSUSB ITS Knowledge Base</a>. \nI can only answer questions based on this information. Please ask another question.", "Unknown"
+    return f"I don't have enough information to answer this question. I'm an AI assistant powered by <a href={CORPUS_SOURCE}>link</a>. \nI can only answer questions based on this information. Please ask another question.", "Unknown"
+
+def http_error_response(error):
+    """
+    Get the response to an HTTP error raised by the LLM provider
+
+    Args:
+        error (HTTPStatusError): The error
+
+    Returns:
+        tuple: The answer and a None source
+    """
+    print(f"HTTPStatusError: {error}")
+    if error.response.status_code == 429:
+        return "I am currently experiencing high traffic. Please try again later.", None
+    return f"I am unable to answer this question at the moment. Please try again later. Error: {error}", None
+
+def prepare_query(query):
+    """
+    Run the steps of query_rag that come before generation: filtering, embedding, intent routing, retrieval and the answer cache
+
+    Args:
+        query (str): The query string
+
+    Returns:
+        tuple: (answer, None) when the query is answered without the LLM, where answer is an (answer, source) tuple,
+            otherwise (None, context) where context holds what generation and finalize_response need
+    """
+    # Check if the query is a filtered query and it is the first or second message
+    with span("query.filter"):
+        filtered = is_filtered_query(query)
+    if filtered:
+        return greeting_response(), None
+
+    with span("query.pipeline"):
+        pipeline = get_rag_pipeline()
+    with span("query.embed"):
+        query_embedding = embed_query(query)
+    with span("query.route"):
+        answer = route_query(query_embedding)
+    if answer is not None:
+        return answer, None
+    # Retrieve the most relevant document based on the query
+    with span("query.retrieve"):
+        retrieved_documents = pipeline.retriever.get_related_documents(query_embedding, collection=pipeline.collection)
+    return build_query_context(query, query_embedding, retrieved_documents, pipeline)
+
+def build_query_context(query, query_embedding, retrieved_documents, pipeline):
+    """
+    Run the steps of prepare_query that come after retrieval: the no-documents response and the answer cache
+
+    Args:
+        query (str): The query string
+        query_embedding (list): The normalized query embedding
+        retrieved_documents (list): The documents returned by the retriever
+        pipeline (RAGPipeline): The pipeline the documents were retrieved with
+
+    Returns:
+        tuple: (answer, None) or (None, context), as returned by prepare_query
+    """
+    if not retrieved_documents:
+        print("No Relevant Documents Retrieved, so sending default response")
+        return insufficient_information_response(), None
+
+    # Serve a cached answer if a similar query retrieved the same chunks
+    hash_ids = [document.metadata.get("hash_id") for document in retrieved_documents]
+    with span("query.answer_cache"):
+        cached_answer = ANSWER_CACHE.lookup(query_embedding, hash_ids)
+    if cached_answer is not None:
+        print("Answer Cache Hit")
+        return cached_answer, None
+
+    # Extract metadata from the most relevant document
+    most_relevant_document = retrieved_documents[0]
+    print("Most Relevant Document Retrieved")
+    context_documents = retrieved_documents
+    if pipeline.context_packer is not None:
+        # Fit the chunks into the token budget: merge overlapping neighbours and leave out redundant ones
+        with span("query.pack"):
+            context_documents, report = pipeline.context_packer.pack(retrieved_documents)
+        print(f"Context packed: {report['chunks_before']} chunks, ~{report['tokens_before']} tokens -> "
+              f"{report['chunks_after']} chunks, ~{report['tokens_after']} tokens")
+    return None, {
+        "pipeline": pipeline,
+        "inputs": {"input": query, "context": context_documents},
+        "query_embedding": query_embedding,
+        "hash_ids": hash_ids,
+        "source": most_relevant_document.metadata.get("source", "Unknown"),
+        "title": most_relevant_document.metadata.get("title", "Untitled").replace("\n", " "),
+    }
+
+def finalize_response(response, context):
+    """
+    Turn the raw LLM response into the answer shown to the user and cache it
+
+    Args:
+        response (str): The complete LLM response
+        context (dict): The context returned by prepare_query
+
+    Returns:
+        tuple: The answer and its source
+    """
+    with span("query.finalize"):
+        # Add the source to the response if available
+        if response.lower().strip() == "the context does not contain enough information to answer this question.":
+            answer = insufficient_information_response()
+        else:
+            answer = format_source(response, context["source"], context["title"]), context["source"]
+            print("Response Generated", answer[0])
+        ANSWER_CACHE.store(context["query_embedding"], context["hash_ids"], *answer)
+    return answer
+
 def query_rag(query):
     """
     Entry point for the RAG model to generate an answer to a given query
 
-    This function initializes the RAG model, sets up the necessary components such as the prompt template, vector store, 
-    retriever, document chain, and retrieval chain, and then generates a response to the provided query.
+    This function embeds the query, retrieves the most relevant documents using the shared RAG pipeline
+    (see get_rag_pipeline) and then generates a response to the provided query.
 
     Args:
         query (str): The query string for which an answer is to be generated.
@@ -101,67 +527,92 @@ def query_rag(query):
         str: The answer to the query
         str: The source of the information
     """
-    try:
-        # Check if the query is a filtered query and it is the first or second message
-        if is_filtered_query(query):
-            if CORPUS_SOURCE == 'https://www.csusb.edu/its':
-                return f"Hi there! I am an <a href={CORPUS_SOURCE}>ITS Support Chatbot</a>. I can help you with your ITS related queries. How can I assist you today?", "Unknown"
-            return f"Hi there! I'm an AI assistant powered by <a href={CORPUS_SOURCE}>link</a>. I'm here to help with any questions you might have. How can I assist you today?", "Unknown"
-        
-        # Define the model
-        #chat_model = ChatMistralAI(model='open-mistral-7b', temperature = 0.2)
-        chat_model = ChatGroq(model='llama-3.1-70b-versatile', temperature = 0)
-        print("Model Loaded")
-
-        # Create the prompt and components for the RAG model
-        prompt = create_prompt()
-        print("Before embedding model")
-        model = get_embedding_model()
-        print("After embedding model")
-        retriever = ScoreThresholdRetriever(score_threshold=0.7, k=5)
-        document_chain = create_stuff_documents_chain(chat_model, prompt)
-        query_embedding = np.array(model.encode(query), dtype=np.float32).tolist()
-        collection = Collection(re.sub(r'\W+', '', CORPUS_SOURCE))
-        # Retrieve the most relevant document based on the query
-        retrieved_documents = retriever.get_related_documents(query_embedding, collection=collection)
-
-        if not retrieved_documents:
-            print("No Relevant Documents Retrieved, so sending default response")
-            if CORPUS_SOURCE == 'https://www.csusb.edu/its':
-                return f"I don't have enough information to answer this question. I'm an AI assistant powered by <a href={CORPUS_SOURCE}>CSUSB ITS Knowledge Base</a>. \nI can only answer questions based on this information. Please ask another question.", "Unknown"
-            return f"I don't have enough information to answer this question. I'm an AI assistant powered by <a href={CORPUS_SOURCE}>link</a>. \nI can only answer questions based on this information. Please ask another question.", "Unknown"
-
-        # Extract metadata from the most relevant document
-        most_relevant_document = retrieved_documents[0]
-        source = most_relevant_document.metadata.get("source", "Unknown")
-        title = most_relevant_document.metadata.get("title", "Untitled").replace("\n", " ")
-
-        print("Most Relevant Document Retrieved")
-
-        # Generate a response using retrieval chain
-        response = document_chain.invoke({
-            "input": query,
-            "context": retrieved_documents
-        })
+    with span("query.total"):
+        try:
+            answer, context = prepare_query(query)
+            if answer is not None:
+                return answer
+
+            # Generate a response using retrieval chain
+            response = context["pipeline"].document_chain.invoke(context["inputs"], config=get_tracer().llm_config("query"))
+            return finalize_response(response, context)
+        except HTTPStatusError as e:
+            return http_error_response(e)
+
+class StreamingAnswer:
+    """
+    The answer to a query, streamed token by token as the LLM produces it.
+
+    Iterating yields the raw tokens. Once exhausted, ``answer`` and ``source`` hold the same values
+    query_rag would have returned (format_source runs on the complete buffer).
+
+    Attributes:
+        query (str): The query being answered.
+        answer (str): The final answer, set once the stream is exhausted.
+        source (str): The source of the answer, None if the LLM request failed.
+        time_to_first_token (float): Seconds from the start of the stream to the first token.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.answer = None
+        self.source = None
+        self.time_to_first_token = None
+        self._start = None
+
+    def _first_token(self):
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self._start
+            get_tracer().record("query.first_token", self.time_to_first_token)
+            print(f"Time to first token: {self.time_to_first_token:.3f}s")
+
+    def _finish(self):
+        get_tracer().record("query.total", time.perf_counter() - self._start)
+
+    def __iter__(self):
+        self._start = time.perf_counter()
+        try:
+            answer, context = prepare_query(self.query)
+            if answer is not None:
+                self.answer, self.source = answer
+                self._first_token()
+                yield self.answer
+                return
+
+            buffer = []
+            try:
+                for token in context["pipeline"].document_chain.stream(context["inputs"], config=get_tracer().llm_config("query")):
+                    self._first_token()
+                    buffer.append(token)
+                    yield token
+            except HTTPStatusError:
+                raise
+            except Exception as e:
+                if buffer:
+                    raise
+                # Streaming is unavailable, fall back to a single non-streaming call
+                print(f"Streaming failed, falling back to invoke: {e}")
+                buffer.append(context["pipeline"].document_chain.invoke(context["inputs"], config=get_tracer().llm_config("query")))
+                self._first_token()
+                yield buffer[0]
+            self.answer, self.source = finalize_response("".join(buffer), context)
+        except HTTPStatusError as e:
+            self.answer, self.source = http_error_response(e)
+        finally:
+            self._finish()
+
+def query_rag_stream(query):
+    """
+    Streaming variant of query_rag
+
+    Args:
+        query (str): The query string for which an answer is to be generated.
+
+    Returns:
+        StreamingAnswer: Iterable of answer tokens, holding the final answer and source once exhausted
+    """
+    return StreamingAnswer(query)
 
-        # Add the source to the response if available
-        if response.lower().strip() == "the context does not contain enough information to answer this question.":
-            if CORPUS_SOURCE == 'https://www.csusb.edu/its':
-                return f"I don't have enough information to answer this question. I'm an AI assistant powered by <a href={CORPUS_SOURCE}>CSUSB ITS Knowledge Base</a>. \nI can only answer questions based on this information. Please ask another question.", "Unknown"
-            return f"I don't have enough information to answer this question. I'm an AI assistant powered by <a href={CORPUS_SOURCE}>link</a>. \nI can only answer questions based on this information. Please ask another question.", "Unknown"
-        formatted_response = format_source(response, source, title)
-        print("Response Generated", formatted_response)
-        # print("Response Generated")
-        
-        
-        return formatted_response, source
-            
-    except HTTPStatusError as e:
-        print(f"HTTPStatusError: {e}")
-        if e.response.status_code == 429:
-            return "I am currently experiencing high traffic. Please try again later.", None
-        return f"I am unable to answer this question at the moment. Please try again later. Error: {e}", None
-    
 def create_prompt():
     """
     Create a prompt template for the RAG model
@@ -169,6 +620,8 @@ def create_prompt():
     Returns:
         PromptTemplate: The prompt template for the RAG model
     """
+    from langchain_core.prompts import ChatPromptTemplate
+
     PROMPT_TEMPLATE = """
     <|begin_of_text|>
     <|start_header_id|>system<|end_header_id|>
@@ -191,6 +644,7 @@ def create_prompt():
 
     return prompt
 
+@traced("vector_store.existing_hashes")
 def get_existing_hashes_from_db(collection: Collection):
     """
     Get the existing hashed values from the database
@@ -202,6 +656,8 @@ def get_existing_hashes_from_db(collection: Collection):
         set: The set of existing hashed values
     """
     existing_hashes = set()
+    # A collection left by a previous process is released and cannot be queried until it is loaded again
+    collection.load()
     query_results = collection.query(expr="dynamically_generated == false", output_fields=["hash_id"])
 
     for results in query_results:
@@ -209,230 +665,432 @@ def get_existing_hashes_from_db(collection: Collection):
 
     return existing_hashes
 
-async def _load_documents_from_web_and_db(collection: Collection):
+def get_ingestion_fingerprint():
+    """
+    Get what the collection was built from; a collection recorded with different values cannot be reused
+
+    Returns:
+        dict: The corpus, collection name, embedding model and backend, and schema version
+    """
+    return {
+        "corpus": CORPUS_SOURCE,
+        "collection_name": COLLECTION_NAME,
+        "embedding_model": MODEL_NAME,
+        # The ONNX and int8 backends produce slightly different vectors than torch
+        "embedding_backend": EMBEDDING_BACKEND,
+        "schema_version": COLLECTION_SCHEMA_VERSION,
+    }
+
+def count_chunks(collection):
     """
-    Load the documents from the web and the database and the embedding model simultaneously
+    Count the chunks in a loaded collection
 
     Args:
-        collection (Collection): The collection to query
+        collection (Collection): The collection
 
     Returns:
-        list: The documents loaded from the web
-        set: The set of existing hashed values
+        int: The number of chunks
     """
-    with ThreadPoolExecutor() as pool:
-        loop = asyncio.get_event_loop()
-        documents_future = loop.run_in_executor(pool, load_documents_from_web)
+    return collection.query(expr="", output_fields=["count(*)"])[0]["count(*)"]
 
-        hashes_future = loop.run_in_executor(pool, get_existing_hashes_from_db, collection)
+@traced("vector_store.load_fresh")
+def load_fresh_vector_store(ingestion_manifest, progress, check_age=True):
+    """
+    Load the active collection if the ingestion manifest says it is fresh and it still holds the recorded chunks
 
-        model_future = loop.run_in_executor(pool, get_embedding_model)
+    Args:
+        ingestion_manifest (IngestionManifest): The manifest of the last ingestion
+        progress (callable): Called with a status message
+        check_age (bool, optional): Also require a crawl younger than CORPUS_MAX_AGE. Defaults to True.
 
-        documents, existing_hashes, _ = await asyncio.gather(documents_future, hashes_future, model_future)
+    Returns:
+        str: Why the collection must be synced with the website, or None if it was loaded as it is
+    """
+    fingerprint = get_ingestion_fingerprint()
+    stale_reason = ingestion_manifest.stale_reason(fingerprint)
+    active_collection = ingestion_manifest.data.get("active_collection", COLLECTION_NAME)
+    if stale_reason is None and not utility.has_collection(active_collection):
+        stale_reason = "the collection is missing"
+    if stale_reason is None and check_age:
+        stale_reason = ingestion_manifest.stale_reason(fingerprint, max_age=CORPUS_MAX_AGE)
+        if stale_reason is None and CORPUS_REFRESH_ON_START:
+            stale_reason = "CORPUS_REFRESH_ON_START is set"
+    if stale_reason is not None:
+        return stale_reason
+    progress("Loading the vector store...")
+    collection = Collection(active_collection)
+    ensure_index(collection)
+    with span("vector_store.load"):
+        collection.load()
+    chunk_count = count_chunks(collection)
+    if chunk_count != ingestion_manifest.data.get("chunk_count"):
+        return f"the collection has {chunk_count} chunks, the manifest records {ingestion_manifest.data.get('chunk_count')}"
+    set_active_collection(active_collection)
+    return None
 
-        return documents, existing_hashes
+def get_active_collection_name():
+    """
+    Get the name of the collection queries go to
 
-def initialize_milvus(uri: str=MILVUS_URI):
+    Returns:
+        str: The active collection name
     """
-    Initialize the Milvus database with the vector store
+    return ACTIVE_COLLECTION_NAME or COLLECTION_NAME
+
+def get_shadow_collection_name(active_collection):
+    """
+    Get the name of the collection the next background refresh is built in
 
     Args:
-        uri (str, optional): The URI of the Milvus database. Defaults to MILVUS_URI.
+        active_collection (str): The active collection name
+
+    Returns:
+        str: Whichever of the two collection names is not active
     """
-    connections.connect("default",uri=MILVUS_URI)
-    
-    if os.environ.get("vector_store_initialized", False):
-        # passing an empty list to just load the vector store
-        create_vector_store([])
-        return
-    if vector_store_check(uri):
-        spinner_placeholder = st.empty()
-        collection = Collection(re.sub(r'\W+', '', CORPUS_SOURCE))
+    if active_collection == COLLECTION_NAME:
+        return COLLECTION_NAME + SHADOW_COLLECTION_SUFFIX
+    return COLLECTION_NAME
 
-        spinner_placeholder.markdown("Retrieving documents from website...")
-        documents, existing_hashes = asyncio.run(_load_documents_from_web_and_db(collection))
-        spinner_placeholder.markdown(f"{len(documents)} documents loaded from the website")
-        time.sleep(0.3)
-        spinner_placeholder.markdown("Retrieving documents from website... Done")
+def set_active_collection(name):
+    """
+    Switch queries over to a loaded collection
 
-        # Split the documents into chunks
-        spinner_placeholder.markdown("Splitting documents into chunks...")
-        time.sleep(0.3)
-        docs = split_documents(documents=documents)
-        spinner_placeholder.markdown("Splitting documents into chunks... Done")
-        time.sleep(0.3)
+    The shared pipeline is rebuilt with the new collection by the next query, while queries already
+    running finish on the previous one, so no query ever sees a partially updated collection.
 
-        # Initialize sets to store common hashes and documents to insert
-        common_hashes = set()
-        documents_to_insert = []
-        # Check if the documents from the website are already in the database
-        spinner_placeholder.markdown("Checking for existing documents...")
-        for doc in docs:
-            text = doc.page_content[:MAX_TEXT_LENGTH]
-            hashed_text = hash_text(text)
-            if hashed_text in existing_hashes:
-                # Remove the hash from the existing hashes
-                common_hashes.add(hashed_text)
-            else:
-                # Add the document to the list of documents to insert
-                print("Hashed Text insert", hashed_text)
-                documents_to_insert.append(doc)
-        
-        existing_hashes = existing_hashes - common_hashes
-        print("Existing Hashes", existing_hashes)
-        print("Documents to Insert", documents_to_insert)
-        if existing_hashes:
-            number_of_existing_hashes = len(existing_hashes)
-            spinner_placeholder.markdown(f"Deleting {number_of_existing_hashes} outdated documents...")
-            time.sleep(0.3)
-            count = 1
-            for hash_to_delete in existing_hashes:
-                spinner_placeholder.markdown(f"Deleting {count}/{number_of_existing_hashes} outdated documents...")
-                collection.delete(expr = f"hash_id == '{hash_to_delete}'")
-                count += 1
-            print("Deleted outdated documents")
-            spinner_placeholder.markdown("Deleted outdated documents")
-            time.sleep(0.3)
-        spinner_placeholder.empty()
-        create_vector_store(documents_to_insert)
-    else:
-        spinner_placeholder = st.empty()
+    Args:
+        name (str): The collection name
+    """
+    global ACTIVE_COLLECTION_NAME
+    if name == get_active_collection_name():
+        return
+    ACTIVE_COLLECTION_NAME = name
+    invalidate_corpus_caches()
 
-        spinner_placeholder.markdown("Retrieving documents from website...")
-        documents = load_documents_from_web()
-        spinner_placeholder.markdown(f"{len(documents)} documents loaded from the website")
-        time.sleep(0.3)
-        spinner_placeholder.markdown("Retrieving documents from website... Done")
-        print("Documents Loaded")
+def reset_vector_store(collection_names=()):
+    """
+    Drop both collections and the crawl manifest, so the next sync crawls and embeds every page again
 
-        # Split the documents into chunks
-        spinner_placeholder.markdown("Splitting documents into chunks...")
-        docs = split_documents(documents=documents)
-        spinner_placeholder.markdown("Splitting documents into chunks... Done")
-        time.sleep(0.3)
-        spinner_placeholder.empty()
-        create_vector_store(docs)
+    Args:
+        collection_names (tuple, optional): Other collections to drop, e.g. the one recorded by an outdated manifest
+    """
+    for name in {COLLECTION_NAME, COLLECTION_NAME + SHADOW_COLLECTION_SUFFIX, *collection_names}:
+        if utility.has_collection(name):
+            utility.drop_collection(name)
+    set_active_collection(COLLECTION_NAME)
+    if os.path.exists(CRAWL_MANIFEST_PATH):
+        os.remove(CRAWL_MANIFEST_PATH)
+
+def save_ingestion_manifest(ingestion_manifest, collection, crawled_at, stats):
+    """
+    Record a completed sync in the ingestion manifest, unless the crawl reached no pages
 
+    Args:
+        ingestion_manifest (IngestionManifest): The manifest
+        collection (Collection): The loaded collection the sync produced, which is now active
+        crawled_at (float): When the crawl started, in seconds since the epoch
+        stats (dict): The sync statistics returned by sync_collection
+    """
+    if not stats["pages"]:
+        print("The crawl reached no pages, keeping the previous ingestion manifest")
+        return
+    ingestion_manifest.save(
+        crawled_at=crawled_at,
+        chunk_count=count_chunks(collection),
+        active_collection=collection.name,
+        **get_ingestion_fingerprint(),
+    )
 
-def load_documents_from_web():
+@traced("vector_store.copy")
+def copy_collection(source, target, batch_size=INSERT_BATCH_SIZE):
     """
-    Load the documents from the web and store the page contents
+    Copy every chunk, embedding included, from one collection into another
+
+    Args:
+        source (Collection): The loaded collection to copy
+        target (Collection): The collection to insert into
+        batch_size (int, optional): The number of chunks per query and insert call. Defaults to INSERT_BATCH_SIZE.
 
     Returns:
-        list: The documents loaded from the web
+        int: The number of chunks copied
     """
-    loader = RecursiveUrlLoader(
-        url=CORPUS_SOURCE,
-        prevent_outside=True,
-        base_url=CORPUS_SOURCE,
-        max_depth=2,
-        use_async=True,
-        exclude_dirs=['https://www.csusb.edu/its/support/it-knowledge-base',
-                      'https://www.csusb.edu/its/support/knowledge-base']
-        )
-    raw_documents = loader.load()
-    # print('SELENIUM')
-    # spinner_placeholder = st.empty()
-    # with open ('backend/links.txt', 'r') as f:
-    #     for line in f.readlines():
-    #         print(line.strip())
-    #         spinner_placeholder.markdown(f"Loading {line.strip()}...")
-    #         service = Service()
-    #         options = webdriver.ChromeOptions()
-    #         options.add_argument('--no-sandbox')
-    #         options.add_argument('--headless')
-    #         driver = webdriver.Chrome(service=service, options=options)
-    #         driver.get(line.strip())
-    #         WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'ng-scope')))
-    #         raw_documents.append(Document(page_content=driver.page_source, metadata={'source':line, 'content_type':'text/html; charset=UTF-8', 'title':driver.title, 'language':'en', 'dynamically_generated':True}))
-    #         driver.quit()
-    # print('SELENIUM END')
-    # spinner_placeholder.empty()
-    # Ensure documents are cleaned
-    cleaned_documents = []
-    for doc in raw_documents:
-        cleaned_text = clean_text_from_html(doc.page_content)
-        cleaned_documents.append(Document(page_content=cleaned_text, metadata=doc.metadata))
-
-    return cleaned_documents
-
-def clean_text_from_html(html_content):
-    """
-    Clean the text from the HTML content
+    fields = [field.name for field in get_collection_schema().fields]
+    iterator = source.query_iterator(batch_size=batch_size, expr="", output_fields=fields)
+    copied = 0
+    try:
+        while rows := iterator.next():
+            target.insert(rows)
+            copied += len(rows)
+    finally:
+        iterator.close()
+    return copied
+
+@traced("vector_store.refresh")
+def refresh_vector_store(progress=None):
+    """
+    Re-crawl the website into the shadow collection and switch queries over to it once it is complete
+
+    The shadow collection starts as a copy of the active one and receives the same diff the startup
+    sync would apply in place: chunks of changed pages are inserted and outdated chunks deleted. Queries
+    keep going to the active collection meanwhile and only see the new corpus once it is fully loaded.
+    The previous collection stays loaded until the next refresh replaces it, for queries still using it.
 
     Args:
-        html_content (str): The HTML content to clean
+        progress (callable, optional): Called with a status message at each step. Defaults to None.
 
     Returns:
-        str: The cleaned text
+        dict: The sync statistics of sync_collection, plus whether queries were switched to the new collection
+            and the duration of the refresh in seconds
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # Remove unnecessary elements
-    for script_or_style in soup(['script', 'style', 'header', 'footer', 'nav']):
-        script_or_style.decompose()
+    progress = progress or (lambda message: None)
+    start = time.perf_counter()
+    with VECTOR_STORE_LOCK:
+        crawled_at = time.time()
+        active_collection = Collection(get_active_collection_name())
+        shadow_name = get_shadow_collection_name(active_collection.name)
+        if utility.has_collection(shadow_name):
+            # The previous version of the corpus, or a refresh that did not complete
+            utility.drop_collection(shadow_name)
+        shadow = create_collection(shadow_name)
+        progress("Copying the active collection...")
+        active_collection.load()
+        copy_collection(active_collection, shadow)
+        manifest, stats = sync_collection(shadow, progress)
+        stats["switched"] = bool(stats["inserted"] or stats["deleted"])
+        if stats["switched"]:
+            progress("Loading the new collection...")
+            shadow.load()
+            # Recorded before the crawl manifest: the other order could pair the old collection with the new crawl state
+            save_ingestion_manifest(IngestionManifest(INGESTION_MANIFEST_PATH), shadow, crawled_at, stats)
+            manifest.save()
+            set_active_collection(shadow_name)
+        else:
+            utility.drop_collection(shadow_name)
+            save_ingestion_manifest(IngestionManifest(INGESTION_MANIFEST_PATH), active_collection, crawled_at, stats)
+            manifest.save()
+    stats["duration"] = time.perf_counter() - start
+    print(f"Vector store refreshed in {stats['duration']:.1f}s: {stats['inserted']} inserted, {stats['deleted']} deleted, "
+          f"{stats['unchanged']} unchanged" + (f", queries switched to {shadow_name}" if stats["switched"] else ""))
+    return stats
+
+@traced("vector_store.initialize")
+def initialize_milvus(uri: str=MILVUS_URI, progress=None, force_refresh=False, refresh_in_background=False):
+    """
+    Initialize the Milvus database with the vector store
 
-    main_content = soup.find('div', {'class': 'page-main-content'})
-    #main_content = soup.find('main')
-    if main_content:
-        content = main_content.get_text(separator='\n')
-    else:
-        content = soup.get_text(separator='\n')
+    The collection persisted in the Milvus Lite file is loaded as it is when the ingestion manifest stored
+    next to it is fresh: same corpus, collection, embedding model and schema version, crawled less than
+    CORPUS_MAX_AGE ago and holding the recorded number of chunks. Otherwise the collection is synced with
+    the website in place (see sync_collection).
 
-    return clean_text(content)
+    Args:
+        uri (str, optional): The URI of the Milvus database. Defaults to MILVUS_URI.
+        progress (callable, optional): Called with a status message at each step, e.g. from the warmup thread.
+            Defaults to showing the messages in a Streamlit placeholder.
+        force_refresh (bool, optional): Sync with the website even if the collection is fresh. Defaults to False.
+        refresh_in_background (bool, optional): Load a collection that is only older than CORPUS_MAX_AGE as it is,
+            because the caller refreshes it in the background (see refresh_vector_store). Defaults to False.
+    """
+    connections.connect("default",uri=MILVUS_URI)
+    spinner_placeholder = st.empty() if progress is None else None
+    progress = progress or spinner_placeholder.markdown
+
+    with VECTOR_STORE_LOCK:
+        ingestion_manifest = IngestionManifest(INGESTION_MANIFEST_PATH)
+        if force_refresh:
+            stale_reason = "refresh requested"
+        else:
+            stale_reason = load_fresh_vector_store(ingestion_manifest, progress, check_age=not refresh_in_background)
+        if stale_reason is None:
+            print(f"Vector store is fresh enough ({ingestion_manifest.data['chunk_count']} chunks crawled "
+                  f"{(time.time() - ingestion_manifest.data['crawled_at']) / 3600:.1f} hours ago), skipping the crawl")
+            if spinner_placeholder is not None:
+                spinner_placeholder.empty()
+            return
+        print(f"Syncing the vector store with the website: {stale_reason}")
+        if ingestion_manifest.stale_reason(get_ingestion_fingerprint()) is None:
+            set_active_collection(ingestion_manifest.data.get("active_collection", COLLECTION_NAME))
+        elif ingestion_manifest.data:
+            # Chunks embedded with another model or stored with another schema cannot be reused
+            print("Rebuilding the vector store")
+            reset_vector_store([ingestion_manifest.data.get("active_collection", COLLECTION_NAME)])
+        crawled_at = time.time()
+        vector_store_check(uri)
+        collection = create_collection(get_active_collection_name())
+        manifest, stats = sync_collection(collection, progress)
+
+        progress("Loading the vector store...")
+        with span("vector_store.load"):
+            collection.load()
+        manifest.save()
+        save_ingestion_manifest(ingestion_manifest, collection, crawled_at, stats)
+    if stats["inserted"] or stats["deleted"]:
+        invalidate_corpus_caches()
+    summary = f"Vector store synced: {stats['inserted']} inserted, {stats['deleted']} deleted, {stats['unchanged']} unchanged"
+    print(summary)
+    progress(summary)
+    if spinner_placeholder is not None:
+        time.sleep(0.3)
+        spinner_placeholder.empty()
 
-def clean_text(text):
+@traced("vector_store.sync")
+def sync_collection(collection, progress):
     """
-    Clean the text by removing extra spaces and empty lines
+    Sync a collection with the website: insert the chunks of changed pages and delete the outdated ones
+
+    Ingestion is a streaming pipeline: crawling, cleaning and splitting run in background stages connected
+    by bounded queues while the embedding model encodes and inserts the previous batch, so peak memory does
+    not grow with the size of the corpus. The website is re-crawled with conditional requests
+    (see IncrementalCrawler), so only pages that changed since the last crawl are cleaned, split and embedded.
 
     Args:
-        text (str): The text to clean
+        collection (Collection): The collection to sync
+        progress (callable): Called with a status message at each step
 
     Returns:
-        str: The cleaned text
+        tuple: The updated crawl manifest, to be saved once the collection is in use, and the sync statistics:
+            pages, changed_pages, removed_pages, inserted, deleted and unchanged
     """
-    lines = (line.strip() for line in text.splitlines())
-    cleaned_lines = [line for line in lines if line]
-    return '\n'.join(cleaned_lines)
+    existing_hashes = get_existing_hashes_from_db(collection)
+
+    # Load the embedding model while the first pages are crawled
+    threading.Thread(target=get_embedding_model, daemon=True).start()
+
+    progress("Retrieving documents from website...")
+    manifest = CrawlManifest(CRAWL_MANIFEST_PATH)
+    crawler = create_crawler(manifest)
+    stats = {"pages": 0, "changed_pages": 0, "inserted": 0}
+    pages = run_in_background(crawler.iter_pages(known_hashes=existing_hashes), INGESTION_QUEUE_SIZE, name="crawl")
+    chunks = run_in_background(_new_chunks(pages, manifest, existing_hashes, stats), INSERT_BATCH_SIZE, name="clean-and-split")
+    for batch in batched(chunks, INSERT_BATCH_SIZE):
+        insert_documents(collection, batch)
+        stats["inserted"] += len(batch)
+        progress(
+            f"Inserted {stats['inserted']} new chunks from {stats['changed_pages']} changed of {stats['pages']} pages..."
+        )
+    removed_urls = crawler.removed_urls()
+    progress("Retrieving documents from website... Done")
+
+    # Chunks no longer produced by any page are outdated; keep everything if the crawl reached no pages at all
+    hashes_to_delete = existing_hashes - manifest.chunk_hashes() if stats["pages"] else set()
+    print(f"Crawl diff: {stats['changed_pages']} changed pages, {len(removed_urls)} removed pages, "
+          f"{stats['inserted']} chunks inserted, {len(hashes_to_delete)} chunks to delete")
+    if hashes_to_delete:
+        progress(f"Deleting {len(hashes_to_delete)} outdated documents...")
+        delete_hashes(collection, hashes_to_delete)
+        print("Deleted outdated documents")
+    stats.update(
+        removed_pages=len(removed_urls),
+        deleted=len(hashes_to_delete),
+        unchanged=len(existing_hashes) - len(hashes_to_delete),
+    )
+    return manifest, stats
 
-def split_documents(documents):
+def _new_chunks(pages, manifest, existing_hashes, stats):
     """
-    Split the documents into chunks
+    Ingestion stage that cleans and splits changed pages and yields the chunks missing from the database
+
+    The chunk hashes of every changed page are recorded in the manifest, so unchanged pages can be skipped next time.
 
     Args:
-        documents (list): The documents to split
+        pages (Iterable[CrawledPage]): The crawled pages
+        manifest (CrawlManifest): The crawl manifest
+        existing_hashes (set): The chunk hashes already in the database
+        stats (dict): Page counters updated in place
 
-    Returns:
-        list: list of chunks of documents
+    Yields:
+        Document: The chunks to embed and insert
     """
-    # Create a text splitter to split the documents into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,  # Split the text into chunks of 1000 characters
-        chunk_overlap=100,  # Overlap the chunks by 100 characters
-        is_separator_regex=False,
-    )
-    # Split the documents into chunks
-    docs = text_splitter.split_documents(documents)
-    unique_docs = remove_duplicates(docs)
-    return unique_docs
+    def changed_pages():
+        for page in pages:
+            stats["pages"] += 1
+            if page.changed:
+                stats["changed_pages"] += 1
+                yield page
+
+    text_splitter = get_text_splitter()
+    queued_hashes = set()
+    for page, cleaned_text in clean_html_stream(changed_pages()):
+        chunks = text_splitter.split_documents([Document(page_content=cleaned_text, metadata=page.metadata)])
+        chunk_hashes = [hash_text(chunk.page_content[:MAX_TEXT_LENGTH]) for chunk in chunks]
+        manifest.update(page.url, chunk_hashes=chunk_hashes)
+        for chunk, chunk_hash in zip(chunks, chunk_hashes):
+            if chunk_hash not in existing_hashes and chunk_hash not in queued_hashes:
+                queued_hashes.add(chunk_hash)
+                yield chunk
+
+@traced("vector_store.delete")
+def delete_hashes(collection, hashes, batch_size=DELETE_BATCH_SIZE):
+    """
+    Delete chunks from the collection with one `hash_id in [...]` expression per batch
 
-def remove_duplicates(documents):
+    Args:
+        collection (Collection): The collection to delete from
+        hashes (Iterable[str]): The hash_ids of the chunks to delete
+        batch_size (int, optional): The number of hash_ids per delete call. Defaults to DELETE_BATCH_SIZE.
     """
-    Remove duplicate documents based on the page content
+    hashes = sorted(hashes)
+    for start in range(0, len(hashes), batch_size):
+        collection.delete(expr=f"hash_id in {json.dumps(hashes[start:start + batch_size])}")
+
+def insert_documents(collection, docs, batch_size=INSERT_BATCH_SIZE, progress_callback=None):
+    """
+    Embed and insert documents into the collection in bounded batches
 
     Args:
-        documents (list): The list of documents to remove duplicates from
+        collection (Collection): The collection to insert into
+        docs (list): The documents to insert
+        batch_size (int, optional): The number of documents per insert call. Defaults to INSERT_BATCH_SIZE.
+        progress_callback (callable, optional): Called with (done, total) after every embedding batch. Defaults to None.
+    """
+    number_of_docs = len(docs)
+    for start in range(0, number_of_docs, batch_size):
+        batch = docs[start:start + batch_size]
+        # Build the column lists for batch insertion
+        texts = [doc.page_content[:MAX_TEXT_LENGTH] for doc in batch]
+        hash_ids = [hash_text(text) for text in texts]
+        titles = [doc.metadata.get("title", "Untitled") for doc in batch]
+        sources = [doc.metadata.get("source", "Unknown") for doc in batch]
+        dynamically_generated_flags = [doc.metadata.get("dynamically_generated", False) for doc in batch]
+        with span("vector_store.embed"):
+            embeddings = embed_texts(
+                texts,
+                progress_callback=progress_callback and (lambda done, total: progress_callback(start + done, number_of_docs)),
+            )
+        with span("vector_store.insert"):
+            collection.insert([hash_ids, list(embeddings), texts, titles, sources, dynamically_generated_flags])
+
+def create_crawler(manifest):
+    """
+    Create the crawler for the corpus
+
+    Args:
+        manifest (CrawlManifest): The crawl state from the previous crawl
 
     Returns:
-        list: The list of unique documents
+        IncrementalCrawler: The crawler
     """
-    seen_content = set()
-    unique_documents = []
-    for doc in documents:
-        if doc.page_content not in seen_content:
-            seen_content.add(doc.page_content)
-            unique_documents.append(doc)
-    return unique_documents
+    return IncrementalCrawler(
+        url=CORPUS_SOURCE,
+        manifest=manifest,
+        max_depth=2,
+        exclude_dirs=CRAWL_EXCLUDE_DIRS,
+    )
+
+def get_text_splitter():
+    """
+    Create the text splitter used to split documents into chunks
+
+    Returns:
+        RecursiveCharacterTextSplitter: The text splitter
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,  # Split the text into chunks of 1000 characters
+        chunk_overlap=100,  # Overlap the chunks by 100 characters
+        is_separator_regex=False,
+    )
 
 def vector_store_check(uri):
     """
@@ -448,7 +1106,7 @@ def vector_store_check(uri):
     os.makedirs(head[0], exist_ok=True)
 
     # Return True if exists, False otherwise
-    return utility.has_collection(re.sub(r'\W+', '', CORPUS_SOURCE))
+    return utility.has_collection(get_active_collection_name())
 
 def hash_text(text):
     """
@@ -462,90 +1120,40 @@ def hash_text(text):
     """
     return hashlib.md5(text.encode()).hexdigest()
 
-def create_vector_store(docs):
+def get_collection_schema():
     """
-    Create a vector store in the local Milvus database
+    Get the schema of the vector store collection
 
-    Args:
-        docs (list): The list of documents to insert into the vector store
+    Returns:
+        CollectionSchema: The collection schema
     """
-    if docs == []:
-        spinner_placeholder = st.empty()
-        collection = Collection(re.sub(r'\W+', '', CORPUS_SOURCE))
-
-        spinner_placeholder.markdown("Loading the vector store...")
-        time.sleep(0.3)
-        collection.load()
-        spinner_placeholder.markdown("Vectore store Initialization complete!")
-        spinner_placeholder.empty()
-        return
-    spinner_placeholder = st.empty()
-    # Create a new vector store and drop any existing one
     fields = [
         FieldSchema(name="hash_id", dtype=DataType.VARCHAR, max_length=32, is_primary=True),
-        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=384),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIMENSION),
         FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=5000),
         FieldSchema(name="title", dtype=DataType.VARCHAR, max_length=200),
         FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=200),
         FieldSchema(name="dynamically_generated", dtype=DataType.BOOL)
     ]
-    schema = CollectionSchema(fields, description="Collection Schema for the Vector Store")
-    print("Before Collection")
-    collection = Collection(name=re.sub(r'\W+', '', CORPUS_SOURCE), schema=schema)
-    print("After Collection")
-    print("Before Index")
-    index_params = {
-        "index_type": "HNSW",
-        "metric_type": "IP",
-        "params": {"M": 16, "efConstruction": 200}
-    }
-    collection.create_index(field_name="embedding", index_params=index_params)
-    print("After Index")
+    return CollectionSchema(fields, description="Collection Schema for the Vector Store")
 
-    model = get_embedding_model()
-    count = 1
-    number_of_docs = len(docs)
-    spinner_placeholder.markdown(f"Inserting {number_of_docs} new documents...")
-    time.sleep(0.3)
-    # Initialize lists for batch insertion
-    hash_ids = []
-    embeddings = []
-    texts = []
-    titles = []
-    sources = []
-    dynamically_generated_flags = []
-    for doc in docs:
-        print(f"Inserting Document {count}", doc)
-        spinner_placeholder.markdown(f"Inserting {count}/{number_of_docs} new documents...")
-
-        text = doc.page_content[:MAX_TEXT_LENGTH]
-        hash_id = hash_text(text)
-        embedding = model.encode(text)
-        title = doc.metadata.get("title", "Untitled")
-        source = doc.metadata.get("source", "Unknown")
-        dynamically_generated = doc.metadata.get("dynamically_generated", False)
-
-        # Add the document to the batch insertion lists
-        hash_ids.append(hash_id)
-        embeddings.append(embedding)
-        texts.append(text)
-        titles.append(title)
-        sources.append(source)
-        dynamically_generated_flags.append(dynamically_generated)
-
-
-        count += 1
-    print("Inserting All Documents")
-    collection.insert([hash_ids, embeddings, texts, titles, sources, dynamically_generated_flags])
-    print("Insertion Completed")
-    spinner_placeholder.markdown(f"Inserting {number_of_docs} new documents... Done")
-    time.sleep(0.5)
-    spinner_placeholder.markdown("Loading the vector store...")
-    time.sleep(0.3)
-    collection.load()
-    spinner_placeholder.markdown("Vectore store Initialization complete!")
-    print("Vector Store Created")
-    spinner_placeholder.empty()
+def create_collection(name):
+    """
+    Get the collection with the vector store schema, creating it if it does not exist, indexed as
+    configured by VECTOR_INDEX_TYPE and VECTOR_INDEX_PARAMS (see backend.vector_index)
+
+    Args:
+        name (str): The collection name
+
+    Returns:
+        Collection: The collection
+    """
+    if utility.has_collection(name):
+        collection = Collection(name)
+    else:
+        collection = Collection(name=name, schema=get_collection_schema())
+    ensure_index(collection, index_params=get_index_params())
+    return collection
 
 def get_corpus():
     return CORPUS_SOURCE
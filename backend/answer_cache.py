@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    An LRU/TTL cache of generated answers keyed on query embeddings.
+
+    A cached answer is served when a new query embedding has a cosine similarity above
+    ``similarity_threshold`` with a cached one and retrieval returned the same chunks.
+
+    Attributes:
+        max_entries (int): Maximum number of cached answers.
+        ttl (float): Seconds an answer stays valid.
+        similarity_threshold (float): Minimum cosine similarity for a hit.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, similarity_threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+        # lookup_similar runs before retrieval and lookup after it, so a query can reach both; count them apart
+        self.similar_hits = 0
+        self.similar_misses = 0
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict_expired(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, query_embedding, hash_ids):
+        """
+        Look up a cached answer for a query
+
+        Args:
+            query_embedding (list): The query embedding
+            hash_ids (Iterable[str]): The hash_ids of the retrieved chunks
+
+        Returns:
+            tuple: The cached (answer, source), or None on a miss
+        """
+        query_vector = self._normalize(query_embedding)
+        hash_ids = frozenset(hash_ids)
+        with self._lock:
+            self._evict_expired(time.time())
+            best_key, best_similarity = None, self.similarity_threshold
+            for key, entry in self._entries.items():
+                if entry["hash_ids"] != hash_ids:
+                    continue
+                similarity = float(np.dot(query_vector, entry["embedding"]))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            return entry["answer"], entry["source"]
+
+    def lookup_similar(self, query_embedding, similarity_threshold):
+        """
+        Look up a cached answer for a near duplicate of a query, whatever chunks it was generated from
+
+        Args:
+            query_embedding (list): The query embedding
+            similarity_threshold (float): Minimum cosine similarity for a hit, above similarity_threshold of lookup
+
+        Returns:
+            tuple: The cached (answer, source), or None on a miss
+        """
+        query_vector = self._normalize(query_embedding)
+        with self._lock:
+            self._evict_expired(time.time())
+            best_key, best_similarity = None, similarity_threshold
+            for key, entry in self._entries.items():
+                similarity = float(np.dot(query_vector, entry["embedding"]))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            if best_key is None:
+                self.similar_misses += 1
+                return None
+            self.similar_hits += 1
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            return entry["answer"], entry["source"]
+
+    def store(self, query_embedding, hash_ids, answer, source):
+        """
+        Store a generated answer
+
+        Args:
+            query_embedding (list): The query embedding
+            hash_ids (Iterable[str]): The hash_ids of the retrieved chunks
+            answer (str): The formatted answer
+            source (str): The source of the answer
+        """
+        entry = {
+            "embedding": self._normalize(query_embedding),
+            "hash_ids": frozenset(hash_ids),
+            "answer": answer,
+            "source": source,
+            "created": time.time(),
+        }
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Invalidate every cached answer, e.g. when chunks were inserted or deleted
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get the cache counters
+
+        Returns:
+            dict: The number of entries, hits and misses of lookup, and hits and misses of lookup_similar
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "similar_hits": self.similar_hits,
+                "similar_misses": self.similar_misses,
+            }
+
+    def __len__(self):
+        return len(self._entries)
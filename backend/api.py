@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from backend.ddos_protection import RATE_LIMITER, resolve_client_ip
+from backend.tracing import get_tracer, start_metrics_server
+from backend.warmup import get_warmup, start_warmup
+
+# Port of the JSON query API started next to Streamlit by backend.server; 0 disables it
+API_PORT = int(os.environ.get("API_PORT", 5002))
+# Seconds an idle keep-alive connection stays open
+API_KEEP_ALIVE = int(os.environ.get("API_KEEP_ALIVE", 30))
+# Maximum open connections; further requests get a 503 before reaching the query engine
+API_MAX_CONNECTIONS = int(os.environ.get("API_MAX_CONNECTIONS", 256))
+# Longest accepted query, in characters
+API_MAX_QUERY_LENGTH = int(os.environ.get("API_MAX_QUERY_LENGTH", 2000))
+# Set to 0 to exempt API clients from the per-IP rate limit the Streamlit sessions share
+API_RATE_LIMIT_ENABLED = os.environ.get("API_RATE_LIMIT_ENABLED", "1") == "1"
+API_SERVER = None
+API_SERVER_LOCK = threading.Lock()
+
+
+class _TokenQueue:
+    # Hands the tokens the query engine produces on its event loop over to the API's event loop
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, token):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, token)
+
+
+def _error(status, message, **headers):
+    return JSONResponse({"error": message}, status_code=status, headers=headers or None)
+
+
+async def _read_query(request):
+    """
+    Validate a query request and check that it may be answered now
+
+    Returns:
+        tuple: The query and None, or None and the error response
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        return None, _error(400, "The body must be a JSON object")
+    query = body.get("query") if isinstance(body, dict) else None
+    if not isinstance(query, str) or not query.strip():
+        return None, _error(400, 'The body must have a non-empty "query" string')
+    if len(query) > API_MAX_QUERY_LENGTH:
+        return None, _error(413, f"The query is longer than {API_MAX_QUERY_LENGTH} characters")
+    if get_warmup().state != "ready":
+        return None, _error(503, "The chatbot is starting up", **{"Retry-After": "5"})
+    if API_RATE_LIMIT_ENABLED:
+        client_ip = resolve_client_ip(request.client.host if request.client else None, request.headers)
+        if not RATE_LIMITER.allow(hashlib.sha256(client_ip.encode()).hexdigest()):
+            return None, _error(429, "Too many questions, please try again in a few minutes",
+                                **{"Retry-After": str(int(RATE_LIMITER.lockout))})
+    return query, None
+
+
+async def query_endpoint(request):
+    """
+    POST /query {"query": "..."}: answer a query
+
+    Returns:
+        JSONResponse: {"answer", "source", "seconds"}, or {"error"} with status 400, 413, 429 or 503
+    """
+    # Imported on first use like in app.py: backend.async_engine imports backend.RAG, which the warmup imports and times
+    from backend.async_engine import QueryEngineOverloaded, get_query_engine
+
+    text, error = await _read_query(request)
+    if error is not None:
+        return error
+    start = time.perf_counter()
+    try:
+        answer, source = await asyncio.wrap_future(get_query_engine().submit(text))
+    except QueryEngineOverloaded:
+        return _error(503, "The chatbot is experiencing high traffic, please try again later", **{"Retry-After": "1"})
+    return JSONResponse({"answer": answer, "source": source, "seconds": round(time.perf_counter() - start, 3)})
+
+
+async def query_stream_endpoint(request):
+    """
+    POST /query/stream {"query": "..."}: answer a query token by token
+
+    Returns:
+        StreamingResponse: Newline-delimited JSON, one {"token"} line per token and a final
+            {"answer", "source", "seconds"} line, or the errors of POST /query
+    """
+    from backend.async_engine import QueryEngineOverloaded, get_query_engine
+
+    text, error = await _read_query(request)
+    if error is not None:
+        return error
+    start = time.perf_counter()
+    tokens = _TokenQueue(asyncio.get_running_loop())
+    try:
+        future, streaming_answer = get_query_engine().submit_stream(text, tokens)
+    except QueryEngineOverloaded:
+        return _error(503, "The chatbot is experiencing high traffic, please try again later", **{"Retry-After": "1"})
+    done = object()
+    future.add_done_callback(lambda _: tokens.put(done))
+
+    async def lines():
+        first_token = True
+        try:
+            while (token := await tokens.queue.get()) is not done:
+                if first_token:
+                    first_token = False
+                    get_tracer().record("query.first_token", time.perf_counter() - start)
+                yield json.dumps({"token": token}) + "\n"
+            future.result()
+            yield json.dumps({
+                "answer": streaming_answer.answer,
+                "source": streaming_answer.source,
+                "seconds": round(time.perf_counter() - start, 3),
+            }) + "\n"
+        finally:
+            # Stop generating when the client disconnects
+            future.cancel()
+            get_tracer().record("query.total", time.perf_counter() - start)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def health_endpoint(request):
+    """
+    GET /health: the warmup status and the query engine counters
+
+    Returns:
+        JSONResponse: With status 200 once the chatbot can answer queries, 503 before
+    """
+    from backend.async_engine import get_query_engine
+
+    status = get_warmup().status()
+    ready = status["state"] == "ready"
+    return JSONResponse(
+        {"status": status, "engine": get_query_engine().stats() if ready else None},
+        status_code=200 if ready else 503,
+    )
+
+
+async def metrics_endpoint(request):
+    """
+    GET /metrics: the span histograms in the Prometheus text format, as served on TRACING_METRICS_PORT
+    """
+    return PlainTextResponse(get_tracer().prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def create_app():
+    """
+    Create the JSON query API
+
+    Returns:
+        Starlette: The ASGI application
+    """
+    return Starlette(routes=[
+        Route("/query", query_endpoint, methods=["POST"]),
+        Route("/query/stream", query_stream_endpoint, methods=["POST"]),
+        Route("/health", health_endpoint, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ])
+
+
+def start_api_server(port=API_PORT, host="0.0.0.0"):
+    """
+    Serve the JSON query API at http://host:port in a background thread, once
+
+    Queries go through the process-wide query engine, so the API shares the embedding model,
+    collection, caches and concurrency limits of the Streamlit sessions in the same process.
+
+    Args:
+        port (int, optional): The port; 0 does not start the server. Defaults to API_PORT.
+        host (str, optional): The interface to listen on. Defaults to "0.0.0.0".
+
+    Returns:
+        uvicorn.Server: The server, None if it is disabled
+    """
+    global API_SERVER
+    if API_SERVER is not None or not port:
+        return API_SERVER
+    with API_SERVER_LOCK:
+        if API_SERVER is None:
+            config = uvicorn.Config(
+                create_app(),
+                host=host,
+                port=port,
+                timeout_keep_alive=API_KEEP_ALIVE,
+                limit_concurrency=API_MAX_CONNECTIONS,
+                access_log=False,
+                log_level="warning",
+            )
+            API_SERVER = uvicorn.Server(config)
+            threading.Thread(target=API_SERVER.run, name="query-api", daemon=True).start()
+            print(f"Serving the query API at http://{host}:{port}/query")
+    return API_SERVER
+
+
+def main():
+    """
+    Run the JSON query API on its own, without the Streamlit UI
+
+    Usage:
+        python -m backend.api
+    """
+    start_warmup()
+    start_metrics_server()
+    uvicorn.run(create_app(), host="0.0.0.0", port=API_PORT, timeout_keep_alive=API_KEEP_ALIVE,
+                limit_concurrency=API_MAX_CONNECTIONS, access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from httpx import HTTPStatusError
+
+import backend.RAG as RAG
+from backend.RAG import (
+    QUERY_EMBEDDING_CACHE,
+    StreamingAnswer,
+    build_query_context,
+    embed_query,
+    finalize_response,
+    get_embedding_server,
+    get_rag_pipeline,
+    greeting_response,
+    http_error_response,
+    is_filtered_query,
+    route_query,
+)
+from backend.tracing import get_tracer, span
+
+QUERY_ENGINE_MAX_CONCURRENCY = int(os.environ.get("QUERY_ENGINE_MAX_CONCURRENCY", 8))
+QUERY_ENGINE_MAX_PENDING = int(os.environ.get("QUERY_ENGINE_MAX_PENDING", 64))
+QUERY_ENGINE_SEARCH_WORKERS = int(os.environ.get("QUERY_ENGINE_SEARCH_WORKERS", 4))
+QUERY_ENGINE = None
+QUERY_ENGINE_LOCK = threading.Lock()
+_DONE = object()
+
+
+class QueryEngineOverloaded(Exception):
+    """
+    Raised when a query is submitted while the engine already has max_pending queries
+    """
+
+
+def overloaded_response():
+    """
+    Get the response to a query rejected because the engine is overloaded
+
+    Returns:
+        tuple: The answer and a None source
+    """
+    return "I am currently experiencing high traffic. Please try again later.", None
+
+
+class AsyncQueryEngine:
+    """
+    A process-wide asynchronous query engine shared by every Streamlit session.
+
+    The engine runs its own event loop in a background thread. Query embeddings go through the
+    shared embedding server, which micro-batches the queries of concurrent sessions into one model
+    call, Milvus searches and pipeline rebuilds run on a small thread pool, and the LLM is called with ``ainvoke``/``astream``
+    so waiting on Groq does not hold a thread. At most ``max_concurrency`` queries run at once and
+    at most ``max_pending`` may be queued or running; beyond that new queries are rejected.
+
+    Attributes:
+        max_concurrency (int): Maximum number of queries processed concurrently.
+        max_pending (int): Maximum number of queries queued or running.
+    """
+
+    def __init__(self, max_concurrency=8, max_pending=64, search_workers=4):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._counters = {"completed": 0, "rejected": 0}
+        self._search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="query-search")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="query-engine", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    async def _start(self):
+        # Created inside the loop so it binds to it on every Python version
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def aembed_query(self, query):
+        """
+        Embed a query through the cache and the micro-batching embedding server, or with
+        RAG.embed_query on the search thread pool when RAG.EMBEDDING_SERVER_ENABLED is off
+
+        Args:
+            query (str): The query to embed
+
+        Returns:
+            list: The normalized query embedding
+        """
+        # Read at call time, like RAG.embed_query, so the flag can be changed at runtime
+        if not RAG.EMBEDDING_SERVER_ENABLED:
+            return await self._loop.run_in_executor(self._search_executor, embed_query, query)
+        embedding = QUERY_EMBEDDING_CACHE.get(query)
+        if embedding is None:
+            embedding = await asyncio.wrap_future(get_embedding_server().submit(query))
+            QUERY_EMBEDDING_CACHE.put(query, embedding)
+        return embedding.tolist()
+
+    async def aprepare_query(self, query):
+        """
+        Asynchronous variant of RAG.prepare_query
+
+        Args:
+            query (str): The query string
+
+        Returns:
+            tuple: (answer, None) or (None, context), as returned by prepare_query
+        """
+        with span("query.filter"):
+            filtered = is_filtered_query(query)
+        if filtered:
+            return greeting_response(), None
+        # Rebuilding the pipeline after the corpus changed, and building the intent router on first use, take up to
+        # seconds; off the event loop they only hold up the queries that need them, not every query and API request
+        with span("query.pipeline"):
+            pipeline = await self._loop.run_in_executor(self._search_executor, get_rag_pipeline)
+        with span("query.embed"):
+            query_embedding = await self.aembed_query(query)
+        with span("query.route"):
+            answer = await self._loop.run_in_executor(self._search_executor, route_query, query_embedding)
+        if answer is not None:
+            return answer, None
+        with span("query.retrieve"):
+            retrieved_documents = await self._loop.run_in_executor(
+                self._search_executor,
+                pipeline.retriever.get_related_documents,
+                query_embedding,
+                pipeline.collection,
+            )
+        return build_query_context(query, query_embedding, retrieved_documents, pipeline)
+
+    async def aquery(self, query):
+        """
+        Asynchronous variant of RAG.query_rag
+
+        Args:
+            query (str): The query string
+
+        Returns:
+            tuple: The answer and its source
+        """
+        queued = time.perf_counter()
+        async with self._semaphore:
+            get_tracer().record("query.queue", time.perf_counter() - queued)
+            try:
+                answer, context = await self.aprepare_query(query)
+                if answer is not None:
+                    return answer
+                response = await context["pipeline"].document_chain.ainvoke(context["inputs"], config=get_tracer().llm_config("query"))
+                return finalize_response(response, context)
+            except HTTPStatusError as e:
+                return http_error_response(e)
+            finally:
+                get_tracer().record("query.total", time.perf_counter() - queued)
+
+    async def _astream(self, query, tokens, streaming_answer):
+        queued = time.perf_counter()
+        async with self._semaphore:
+            get_tracer().record("query.queue", time.perf_counter() - queued)
+            try:
+                answer, context = await self.aprepare_query(query)
+                if answer is not None:
+                    streaming_answer.answer, streaming_answer.source = answer
+                    tokens.put(streaming_answer.answer)
+                    return
+                buffer = []
+                try:
+                    async for token in context["pipeline"].document_chain.astream(context["inputs"], config=get_tracer().llm_config("query")):
+                        buffer.append(token)
+                        tokens.put(token)
+                except HTTPStatusError:
+                    raise
+                except Exception as e:
+                    if buffer:
+                        raise
+                    # Streaming is unavailable, fall back to a single non-streaming call
+                    print(f"Streaming failed, falling back to ainvoke: {e}")
+                    buffer.append(await context["pipeline"].document_chain.ainvoke(context["inputs"], config=get_tracer().llm_config("query")))
+                    tokens.put(buffer[0])
+                streaming_answer.answer, streaming_answer.source = finalize_response("".join(buffer), context)
+            except HTTPStatusError as e:
+                streaming_answer.answer, streaming_answer.source = http_error_response(e)
+
+    def _submit(self, coroutine):
+        with self._pending_lock:
+            if self._pending >= self.max_pending:
+                self._counters["rejected"] += 1
+                coroutine.close()
+                raise QueryEngineOverloaded(f"{self._pending} queries pending")
+            self._pending += 1
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._pending_lock:
+            self._pending -= 1
+            self._counters["completed"] += 1
+
+    def submit(self, query):
+        """
+        Submit a query from any thread
+
+        Args:
+            query (str): The query string
+
+        Returns:
+            concurrent.futures.Future: Resolves to the answer and its source
+
+        Raises:
+            QueryEngineOverloaded: If max_pending queries are already queued or running
+        """
+        return self._submit(self.aquery(query))
+
+    def submit_stream(self, query, tokens):
+        """
+        Submit a streaming query from any thread
+
+        Args:
+            query (str): The query string
+            tokens: Receives each answer token through tokens.put(token), called on the engine's event loop
+
+        Returns:
+            tuple: A concurrent.futures.Future resolving once the answer is complete, and the StreamingAnswer
+                holding the final answer and source by then
+
+        Raises:
+            QueryEngineOverloaded: If max_pending queries are already queued or running
+        """
+        streaming_answer = StreamingAnswer(query)
+        return self._submit(self._astream(query, tokens, streaming_answer)), streaming_answer
+
+    def query(self, query, timeout=None):
+        """
+        Answer a query, blocking the calling thread (e.g. the Streamlit script thread) until it is done
+
+        Args:
+            query (str): The query string
+            timeout (float, optional): Seconds to wait for the answer. Defaults to None.
+
+        Returns:
+            tuple: The answer and its source
+        """
+        try:
+            return self.submit(query).result(timeout)
+        except QueryEngineOverloaded:
+            return overloaded_response()
+
+    def stream(self, query):
+        """
+        Streaming variant of query
+
+        Args:
+            query (str): The query string
+
+        Returns:
+            EngineStreamingAnswer: Iterable of answer tokens, holding the final answer and source once exhausted
+        """
+        return EngineStreamingAnswer(self, query)
+
+    def stats(self):
+        """
+        Get the engine counters
+
+        Returns:
+            dict: Pending, completed and rejected queries
+        """
+        with self._pending_lock:
+            return dict(self._counters, pending=self._pending)
+
+    def close(self):
+        """
+        Stop the event loop and the worker threads
+        """
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._search_executor.shutdown(wait=False)
+
+
+class EngineStreamingAnswer(StreamingAnswer):
+    """
+    A StreamingAnswer generated by the AsyncQueryEngine: tokens are produced on the engine's event
+    loop and handed over to the iterating thread through a queue.
+    """
+
+    def __init__(self, engine, query):
+        super().__init__(query)
+        self.engine = engine
+
+    def __iter__(self):
+        self._start = time.perf_counter()
+        tokens = queue.Queue()
+        try:
+            future = self.engine._submit(self.engine._astream(self.query, tokens, self))
+        except QueryEngineOverloaded:
+            self.answer, self.source = overloaded_response()
+            self._first_token()
+            yield self.answer
+            return
+        future.add_done_callback(lambda _: tokens.put(_DONE))
+        try:
+            while (token := tokens.get()) is not _DONE:
+                self._first_token()
+                yield token
+            # Re-raise anything the engine failed with
+            future.result()
+        finally:
+            self._finish()
+
+
+def get_query_engine():
+    """
+    Get the process-wide query engine, starting it on first use
+
+    Returns:
+        AsyncQueryEngine: The shared engine
+    """
+    global QUERY_ENGINE
+    if QUERY_ENGINE is None:
+        with QUERY_ENGINE_LOCK:
+            if QUERY_ENGINE is None:
+                QUERY_ENGINE = AsyncQueryEngine(
+                    max_concurrency=QUERY_ENGINE_MAX_CONCURRENCY,
+                    max_pending=QUERY_ENGINE_MAX_PENDING,
+                    search_workers=QUERY_ENGINE_SEARCH_WORKERS,
+                )
+    return QUERY_ENGINE
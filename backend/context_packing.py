@@ -0,0 +1,247 @@
+import math
+import os
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Estimated tokens of context sent to the LLM per query; chunks beyond it are left out. 0 disables packing
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1024))
+# Trade-off between relevance (1) and diversity (0) when choosing which chunks fill the budget
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", 0.7))
+# A chunk at least this similar to one already chosen adds nothing and is dropped
+CONTEXT_REDUNDANCY_THRESHOLD = float(os.environ.get("CONTEXT_REDUNDANCY_THRESHOLD", 0.95))
+# Llama 3 averages about 4 characters per token on English text; the Groq tokenizer is not available locally
+CHARS_PER_TOKEN = 4
+# Chunks of the same page sharing at least this many characters at their boundary are merged into one
+MIN_MERGE_OVERLAP = 20
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of LLM tokens of a text
+
+    Args:
+        text (str): The text
+
+    Returns:
+        int: The estimated number of tokens
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def merge_overlapping(first, second, min_overlap=MIN_MERGE_OVERLAP):
+    """
+    Merge two chunks if one contains the other or the end of the first is the start of the second
+
+    The text splitter overlaps consecutive chunks of a page, so two retrieved neighbours repeat that overlap.
+
+    Args:
+        first (str): The first chunk
+        second (str): The second chunk
+        min_overlap (int, optional): The minimum number of shared characters. Defaults to MIN_MERGE_OVERLAP.
+
+    Returns:
+        str: The merged text, or None if the chunks do not overlap
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    # Only the positions of the first chunk where the second one's start occurs can begin an overlap
+    start = max(1, len(first) - len(second) + 1)
+    while True:
+        start = first.find(second[:min_overlap], start)
+        if start == -1 or len(first) - start < min_overlap:
+            return None
+        if second.startswith(first[start:]):
+            return first + second[len(first) - start:]
+        start += 1
+
+
+def format_chunk(text, title, source):
+    # The layout ScoreThresholdRetriever gives each document
+    return f" (title: {title})" + f" (source: {source})" + text + "\n"
+
+
+class PackingStats:
+    """
+    Process-wide totals of the context packed for the LLM, for the sidebar and benchmarks
+    """
+
+    def __init__(self):
+        self._totals = {"queries": 0, "chunks_before": 0, "chunks_after": 0, "tokens_before": 0, "tokens_after": 0, "merged": 0}
+        self._lock = threading.Lock()
+
+    def record(self, report):
+        """
+        Add the report of one packed query
+
+        Args:
+            report (dict): The report returned by ContextPacker.pack
+        """
+        with self._lock:
+            self._totals["queries"] += 1
+            for key in ["chunks_before", "chunks_after", "tokens_before", "tokens_after", "merged"]:
+                self._totals[key] += report[key]
+
+    def snapshot(self):
+        """
+        Get the totals
+
+        Returns:
+            dict: Queries packed, and chunks, estimated tokens and merges summed over them
+        """
+        with self._lock:
+            return dict(self._totals)
+
+
+CONTEXT_PACKING_STATS = PackingStats()
+
+
+class ContextPacker:
+    """
+    Packs retrieved chunks into a token budget before they are stuffed into the prompt.
+
+    Chunks of the same page that overlap are merged, so the overlap the splitter adds between
+    neighbours is sent once. The merged chunks are then chosen greedily by maximal marginal
+    relevance over the embeddings returned by the search: each step takes the chunk most similar to
+    the query and least similar to those already taken, skipping chunks that are near duplicates of
+    a taken one or do not fit in the remaining budget. The most relevant chunk is always kept,
+    truncated if it alone exceeds the budget.
+
+    Attributes:
+        token_budget (int): Estimated tokens of context per query.
+        mmr_lambda (float): Weight of relevance against diversity.
+        redundancy_threshold (float): Cosine similarity above which a chunk is a duplicate.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, mmr_lambda=CONTEXT_MMR_LAMBDA,
+                 redundancy_threshold=CONTEXT_REDUNDANCY_THRESHOLD, stats=CONTEXT_PACKING_STATS):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.redundancy_threshold = redundancy_threshold
+        self.stats = stats
+
+    def pack(self, documents):
+        """
+        Pack documents into the token budget
+
+        Args:
+            documents (list): The documents returned by ScoreThresholdRetriever, most relevant first, with an
+                "embedding" in their metadata when the retriever returns embeddings
+
+        Returns:
+            tuple: The packed documents in the order maximal marginal relevance selected them, so the most
+                relevant comes first but later ones are not sorted by score, and a report with the chunks and
+                estimated tokens before and after, the number of merges and the chunks dropped as redundant or over budget
+        """
+        units = self._merge([self._unit(document) for document in documents])
+        merged = len(documents) - len(units)
+        selected, redundant, over_budget = self._select(units)
+        packed = [self._document(unit) for unit in selected]
+        report = {
+            "chunks_before": len(documents),
+            "chunks_after": len(packed),
+            "tokens_before": sum(estimate_tokens(document.page_content) for document in documents),
+            "tokens_after": sum(estimate_tokens(document.page_content) for document in packed),
+            "merged": merged,
+            "redundant": redundant,
+            "over_budget": over_budget,
+        }
+        if self.stats is not None:
+            self.stats.record(report)
+        return packed, report
+
+    @staticmethod
+    def _unit(document):
+        metadata = document.metadata
+        title, source = metadata.get("title", "Untitled"), metadata.get("source", "Unknown")
+        text = document.page_content
+        prefix = format_chunk("", title, source)[:-1]
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+        embedding = metadata.get("embedding")
+        return {
+            "text": text.removesuffix("\n"),
+            "title": title,
+            "source": source,
+            "hash_ids": [metadata.get("hash_id")],
+            "score": metadata.get("score", 0.0),
+            "normalized_score": metadata.get("normalized_score"),
+            "embedding": None if embedding is None else np.asarray(embedding, dtype=np.float32),
+        }
+
+    @staticmethod
+    def _merge(units):
+        merged = []
+        for unit in units:
+            # Keep merging: a chunk can join two retrieved neighbours that did not overlap each other
+            while True:
+                for index, other in enumerate(merged):
+                    if other["source"] != unit["source"]:
+                        continue
+                    text = merge_overlapping(other["text"], unit["text"]) or merge_overlapping(unit["text"], other["text"])
+                    if text is not None:
+                        break
+                else:
+                    merged.append(unit)
+                    break
+                merged.pop(index)
+                embedding = None
+                if other["embedding"] is not None and unit["embedding"] is not None:
+                    embedding = other["embedding"] + unit["embedding"]
+                    embedding /= np.linalg.norm(embedding)
+                unit = dict(
+                    other,
+                    text=text,
+                    hash_ids=other["hash_ids"] + unit["hash_ids"],
+                    score=max(other["score"], unit["score"]),
+                    normalized_score=max(other["normalized_score"] or 0.0, unit["normalized_score"] or 0.0) or None,
+                    embedding=embedding if embedding is not None else other["embedding"],
+                )
+        return merged
+
+    def _select(self, units):
+        selected, redundant, over_budget = [], 0, 0
+        remaining = list(units)
+        budget = self.token_budget
+        while remaining:
+            # Greatest marginal relevance: similar to the query, unlike what is already selected
+            similarities = [self._max_similarity(unit, selected) for unit in remaining]
+            values = [self.mmr_lambda * unit["score"] - (1 - self.mmr_lambda) * similarity
+                      for unit, similarity in zip(remaining, similarities)]
+            best = max(range(len(remaining)), key=values.__getitem__)
+            unit, similarity = remaining.pop(best), similarities[best]
+            tokens = estimate_tokens(format_chunk(unit["text"], unit["title"], unit["source"]))
+            if selected and similarity >= self.redundancy_threshold:
+                redundant += 1
+            elif tokens <= budget:
+                selected.append(unit)
+                budget -= tokens
+            elif not selected:
+                unit["text"] = unit["text"][:max(0, budget * CHARS_PER_TOKEN - len(format_chunk("", unit["title"], unit["source"])))]
+                selected.append(unit)
+                budget = 0
+            else:
+                over_budget += 1
+        return selected, redundant, over_budget
+
+    @staticmethod
+    def _max_similarity(unit, selected):
+        if unit["embedding"] is None:
+            return 0.0
+        return max((float(unit["embedding"] @ other["embedding"]) for other in selected if other["embedding"] is not None), default=0.0)
+
+    @staticmethod
+    def _document(unit):
+        metadata = {
+            'hash_id': unit["hash_ids"][0],
+            'hash_ids': unit["hash_ids"],
+            'score': unit["score"],
+            'title': unit["title"],
+            'source': unit["source"],
+        }
+        if unit["normalized_score"] is not None:
+            metadata['normalized_score'] = unit["normalized_score"]
+        return Document(page_content=format_chunk(unit["text"], unit["title"], unit["source"]), metadata=metadata)
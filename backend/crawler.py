@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from bs4 import BeautifulSoup
+from langchain_core.utils.html import extract_sub_links
+
+
+class CrawlManifest:
+    """
+    Per-URL crawl state persisted as JSON, so re-crawls can send conditional requests.
+
+    Each page entry holds the ``etag``, ``last_modified`` and ``content_hash`` of the last
+    response, the ``links`` found on the page and the ``chunk_hashes`` it was split into.
+
+    Attributes:
+        path (str): The JSON file the manifest is stored in, None to keep it in memory only.
+        pages (dict): The page entries keyed by URL.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.pages = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        Load the manifest from ``path`` if it exists
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.pages = json.load(f).get("pages", {})
+        except (OSError, ValueError) as e:
+            print(f"Could not load crawl manifest from {self.path}: {e}")
+            self.pages = {}
+
+    def save(self):
+        """
+        Write the manifest to ``path`` atomically
+        """
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary_path = f"{self.path}.tmp"
+        with self._lock:
+            data = {"pages": self.pages}
+            with open(temporary_path, 'w') as f:
+                json.dump(data, f)
+        os.replace(temporary_path, self.path)
+
+    def get(self, url):
+        with self._lock:
+            return self.pages.get(url)
+
+    def update(self, url, **fields):
+        """
+        Update the entry of a page, creating it if needed
+
+        Args:
+            url (str): The page URL
+            **fields: The entry fields to set
+        """
+        with self._lock:
+            self.pages.setdefault(url, {}).update(fields)
+
+    def prune(self, urls):
+        """
+        Remove every page that is not in ``urls``
+
+        Args:
+            urls (set): The URLs to keep
+
+        Returns:
+            list: The removed URLs
+        """
+        with self._lock:
+            removed = [url for url in self.pages if url not in urls]
+            for url in removed:
+                del self.pages[url]
+            return removed
+
+    def chunk_hashes(self):
+        """
+        Get the chunk hashes of every page in the manifest
+
+        Returns:
+            set: The union of all pages' chunk hashes
+        """
+        with self._lock:
+            return {chunk_hash for entry in self.pages.values() for chunk_hash in entry.get("chunk_hashes", [])}
+
+
+class CrawledPage:
+    """
+    A page visited by the IncrementalCrawler.
+
+    Attributes:
+        url (str): The page URL.
+        changed (bool): False if the page is unchanged since the last crawl (304 or same content hash).
+        html (str): The raw HTML, None for unchanged pages.
+        metadata (dict): Source, title, description, language and content type, empty for unchanged pages.
+        links (list): The sub links found on the page.
+    """
+
+    def __init__(self, url, changed, html=None, metadata=None, links=None):
+        self.url = url
+        self.changed = changed
+        self.html = html
+        self.metadata = metadata or {}
+        self.links = links or []
+
+
+class IncrementalCrawler:
+    """
+    A breadth-first crawler with the same scope rules as RecursiveUrlLoader that sends HTTP conditional
+    requests (If-None-Match / If-Modified-Since) based on a CrawlManifest.
+
+    Unchanged pages are reported without their HTML, so callers can skip parsing, splitting and embedding them.
+
+    Attributes:
+        url (str): The URL to start crawling from.
+        manifest (CrawlManifest): The crawl state from the previous crawl, updated in place.
+        max_depth (int): The maximum link depth, as in RecursiveUrlLoader.
+        exclude_dirs (tuple): URL prefixes that are not crawled.
+        timeout (float): The request timeout in seconds.
+        max_workers (int): The number of pages fetched concurrently.
+    """
+
+    def __init__(self, url, manifest, max_depth=2, exclude_dirs=(), timeout=10, max_workers=8, session=None):
+        self.url = url
+        self.manifest = manifest
+        self.max_depth = max_depth
+        self.exclude_dirs = tuple(exclude_dirs)
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.session = session or requests.Session()
+        self.visited = set()
+
+    @staticmethod
+    def content_hash(html):
+        return hashlib.md5(html.encode()).hexdigest()
+
+    @staticmethod
+    def extract_metadata(html, url, response):
+        """
+        Extract the same metadata as RecursiveUrlLoader's default metadata extractor
+
+        Args:
+            html (str): The raw HTML
+            url (str): The page URL
+            response (requests.Response): The response the HTML came from
+
+        Returns:
+            dict: The page metadata
+        """
+        metadata = {"source": url, "content_type": response.headers.get("Content-Type", "")}
+        soup = BeautifulSoup(html, "html.parser")
+        if title := soup.find("title"):
+            metadata["title"] = title.get_text()
+        if description := soup.find("meta", attrs={"name": "description"}):
+            metadata["description"] = description.get("content", None)
+        if html_tag := soup.find("html"):
+            metadata["language"] = html_tag.get("lang", None)
+        return metadata
+
+    def _extract_links(self, html, url):
+        return extract_sub_links(
+            html,
+            url,
+            base_url=self.url,
+            prevent_outside=True,
+            exclude_prefixes=self.exclude_dirs,
+            continue_on_failure=True,
+        )
+
+    def _fetch(self, url, known_hashes):
+        """
+        Fetch a page, conditionally if the manifest has a complete entry for it
+
+        Args:
+            url (str): The page URL
+            known_hashes (set): The chunk hashes present in the vector store, None to trust the manifest
+
+        Returns:
+            CrawledPage: The crawled page, None if it could not be fetched and is not in the manifest
+        """
+        entry = self.manifest.get(url)
+        complete = entry is not None and "chunk_hashes" in entry and (
+            known_hashes is None or set(entry["chunk_hashes"]) <= known_hashes
+        )
+        headers = {}
+        if complete:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to fetch {url}: {e}")
+            # Keep the previous state of the page rather than treating it as removed
+            return CrawledPage(url, changed=False, links=entry.get("links", [])) if complete else None
+
+        if response.status_code == 304 and complete:
+            self.manifest.update(url, crawled_at=time.time())
+            return CrawledPage(url, changed=False, links=entry.get("links", []))
+        if response.status_code >= 400:
+            print(f"Failed to fetch {url}: HTTP {response.status_code}")
+            return CrawledPage(url, changed=False, links=entry.get("links", [])) if complete else None
+
+        html = response.text
+        content_hash = self.content_hash(html)
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "crawled_at": time.time(),
+        }
+        if complete and entry.get("content_hash") == content_hash:
+            self.manifest.update(url, **validators)
+            return CrawledPage(url, changed=False, links=entry.get("links", []))
+
+        links = self._extract_links(html, url)
+        self.manifest.update(url, content_hash=content_hash, links=links, **validators)
+        return CrawledPage(url, changed=True, html=html, metadata=self.extract_metadata(html, url, response), links=links)
+
+    def iter_pages(self, known_hashes=None):
+        """
+        Crawl breadth-first, yielding every page in scope as it is fetched
+
+        At most 2 * max_workers fetches are in flight, so the pages held in memory do not grow with the
+        size of a depth level when the consumer is slower than the fetches.
+
+        Args:
+            known_hashes (set, optional): The chunk hashes present in the vector store. Pages whose chunks are
+                missing from it are fetched unconditionally. Defaults to None (trust the manifest).
+
+        Yields:
+            CrawledPage: The crawled pages
+        """
+        self.visited = {self.url}
+        frontier = [self.url]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for depth in range(self.max_depth):
+                next_frontier = []
+                in_flight = deque()
+                for url in frontier:
+                    in_flight.append(pool.submit(self._fetch, url, known_hashes))
+                    if len(in_flight) >= 2 * self.max_workers:
+                        yield from self._collect(in_flight.popleft().result(), depth, next_frontier)
+                while in_flight:
+                    yield from self._collect(in_flight.popleft().result(), depth, next_frontier)
+                frontier = next_frontier
+                if not frontier:
+                    break
+
+    def _collect(self, page, depth, next_frontier):
+        # Yields a fetched page and queues its unvisited links for the next depth level
+        if page is None:
+            return
+        yield page
+        if depth + 1 < self.max_depth:
+            for link in page.links:
+                if link not in self.visited:
+                    self.visited.add(link)
+                    next_frontier.append(link)
+
+    def removed_urls(self):
+        """
+        Drop the manifest entries of pages that were not reached by the last crawl
+
+        Returns:
+            list: The removed URLs
+        """
+        return self.manifest.prune(self.visited)
@@ -1,49 +1,235 @@
+import atexit
 import time
 import random
 import json
 import os
+import threading
 import streamlit as st
-import requests
-from collections import defaultdict
+from collections import deque
 import hashlib
 
 # Set the path for the JSON file to persist the rate-limiting data
-JSON_FILE_PATH = 'user_rate_limit_data.json'
-
-# Function to load data from JSON file into session state
-def load_data():
-    if os.path.exists(JSON_FILE_PATH):
-        with open(JSON_FILE_PATH, 'r') as f:
-            data = json.load(f)
-            user_requests = data.get('user_requests', {})
-            lockout_time = data.get('lockout_time', {})
-    else:
-        user_requests = {}
-        lockout_time = {}
-
-    # Store loaded data in session state for easy access
-    st.session_state.user_requests = defaultdict(list, user_requests)
-    st.session_state.lockout_time = lockout_time
-
-# Function to get the remote IP address (can be from headers or external service)
+JSON_FILE_PATH = os.environ.get("RATE_LIMIT_DATA_PATH", 'user_rate_limit_data.json')
+# At most RATE_LIMIT_MAX_REQUESTS questions per RATE_LIMIT_WINDOW seconds, then a RATE_LIMIT_LOCKOUT second lockout
+RATE_LIMIT_MAX_REQUESTS = int(os.environ.get("RATE_LIMIT_MAX_REQUESTS", 10))
+RATE_LIMIT_WINDOW = float(os.environ.get("RATE_LIMIT_WINDOW", 60))
+RATE_LIMIT_LOCKOUT = float(os.environ.get("RATE_LIMIT_LOCKOUT", 180))
+# Seconds between snapshots of the rate-limiting data to JSON_FILE_PATH
+RATE_LIMIT_SNAPSHOT_INTERVAL = float(os.environ.get("RATE_LIMIT_SNAPSHOT_INTERVAL", 30))
+# Comma-separated addresses of reverse proxies whose X-Real-IP / X-Forwarded-For headers are trusted; other clients are
+# rate limited by their own address, since they could send a new header value with every request
+TRUSTED_PROXIES = {address.strip() for address in os.environ.get("TRUSTED_PROXIES", "").split(",") if address.strip()}
+
+
+class RateLimiter:
+    """
+    A process-wide sliding-window rate limiter shared by every Streamlit session.
+
+    Each user keeps a deque of at most ``max_requests`` timestamps, so checking and recording
+    a request is O(1). The state is snapshotted to ``path`` every ``snapshot_interval`` seconds
+    (and at exit) instead of on every request, and reloaded at startup so lockouts survive restarts.
+
+    Attributes:
+        max_requests (int): Maximum number of requests in a window.
+        window (float): Length of the sliding window in seconds.
+        lockout (float): Seconds a user is locked out after exceeding the limit.
+        path (str): Optional JSON file the state is persisted to.
+        snapshot_interval (float): Seconds between snapshots.
+    """
+
+    def __init__(self, max_requests=10, window=60, lockout=180, path=None, snapshot_interval=30):
+        self.max_requests = max_requests
+        self.window = window
+        self.lockout = lockout
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self._requests = {}
+        self._lockout_time = {}
+        self._dirty = False
+        self._last_snapshot = time.time()
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        if self.path:
+            self.load()
+            atexit.register(self.save)
+
+    def is_rate_limited(self, user_ip, now=None):
+        """
+        Check if the user is rate-limited without recording a request
+
+        Args:
+            user_ip (str): The (hashed) IP address of the user
+            now (float, optional): The current time. Defaults to time.time().
+
+        Returns:
+            bool: True if the user is rate-limited, False otherwise
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._is_rate_limited(user_ip, now)
+
+    def _is_rate_limited(self, user_ip, now):
+        if now < self._lockout_time.get(user_ip, 0):
+            return True
+        timestamps = self._requests.get(user_ip)
+        # The deque holds the last max_requests timestamps, so the window is full
+        # exactly when the oldest of them is still inside it
+        if timestamps is not None and len(timestamps) >= self.max_requests and now - timestamps[0] < self.window:
+            self._lockout_time[user_ip] = now + self.lockout
+            self._dirty = True
+            return True
+        return False
+
+    def allow(self, user_ip, now=None):
+        """
+        Check if the user is rate-limited and record the request if it is allowed
+
+        Args:
+            user_ip (str): The (hashed) IP address of the user
+            now (float, optional): The current time. Defaults to time.time().
+
+        Returns:
+            bool: True if the request is allowed, False if the user is rate-limited
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._is_rate_limited(user_ip, now):
+                allowed = False
+            else:
+                timestamps = self._requests.get(user_ip)
+                if timestamps is None:
+                    timestamps = self._requests[user_ip] = deque(maxlen=self.max_requests)
+                timestamps.append(now)
+                self._dirty = True
+                allowed = True
+            should_save = self.path and self._dirty and now - self._last_snapshot >= self.snapshot_interval
+            if should_save:
+                self._last_snapshot = now
+        if should_save:
+            threading.Thread(target=self.save, daemon=True).start()
+        return allowed
+
+    def compact(self, now=None):
+        """
+        Drop users with no request in the current window and expired lockouts
+
+        Args:
+            now (float, optional): The current time. Defaults to time.time().
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._compact(now)
+
+    def _compact(self, now):
+        # A user without timestamps has no request in the window either
+        for user_ip in [user_ip for user_ip, timestamps in self._requests.items() if not timestamps or now - timestamps[-1] >= self.window]:
+            del self._requests[user_ip]
+        for user_ip in [user_ip for user_ip, until in self._lockout_time.items() if until <= now]:
+            del self._lockout_time[user_ip]
+
+    def save(self):
+        """
+        Write a compacted snapshot of the rate-limiting data to ``path`` if it changed since the last one
+        """
+        if not self.path:
+            return
+        with self._snapshot_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._compact(time.time())
+                data = {
+                    'user_requests': {user_ip: list(timestamps) for user_ip, timestamps in self._requests.items()},
+                    'lockout_time': dict(self._lockout_time),
+                }
+                self._dirty = False
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(temporary_path, self.path)
+
+    def load(self):
+        """
+        Load the rate-limiting data from ``path`` if it exists
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load rate-limiting data from {self.path}: {e}")
+            return
+        with self._lock:
+            for user_ip, timestamps in data.get('user_requests', {}).items():
+                if not timestamps:
+                    continue
+                self._requests[user_ip] = deque(sorted(timestamps)[-self.max_requests:], maxlen=self.max_requests)
+            self._lockout_time.update(data.get('lockout_time', {}))
+            self._compact(time.time())
+
+    def __len__(self):
+        return len(self._requests)
+
+
+RATE_LIMITER = RateLimiter(
+    max_requests=RATE_LIMIT_MAX_REQUESTS,
+    window=RATE_LIMIT_WINDOW,
+    lockout=RATE_LIMIT_LOCKOUT,
+    path=JSON_FILE_PATH,
+    snapshot_interval=RATE_LIMIT_SNAPSHOT_INTERVAL,
+)
+
+# Function to resolve the address a request is rate limited by
+def resolve_client_ip(peer, headers):
+    """
+    Function to get the IP address of the user of a request: X-Real-IP, then the first X-Forwarded-For
+    hop when the connection comes from one of TRUSTED_PROXIES, otherwise the address of the connection.
+
+    Args:
+        peer (str): The address of the connection, None if unknown.
+        headers (Mapping): The request headers.
+
+    Returns:
+        str: The IP address of the user, or 'Unavailable' if it cannot be determined.
+    """
+    if peer and peer in TRUSTED_PROXIES:
+        if headers.get('X-Real-IP'):
+            return headers['X-Real-IP'].strip()
+        if headers.get('X-Forwarded-For'):
+            return headers['X-Forwarded-For'].split(',')[0].strip()
+    return peer or 'Unavailable'
+
+# Function to read the client IP address from the request that opened the session
+def get_client_ip():
+    """
+    Function to get the IP address of the user from the request that opened the Streamlit session,
+    see resolve_client_ip. Never makes an outbound call.
+
+    Returns:
+        str: The IP address of the user, or 'Unavailable' if it cannot be determined.
+    """
+    context = getattr(st, "context", None)
+    if context is None:
+        return 'Unavailable'
+    # st.context.ip_address is only available in newer Streamlit releases
+    return resolve_client_ip(getattr(context, "ip_address", None), context.headers)
+
+# Function to get the hashed remote IP address of the session
 def get_remote_ip():
     """
-    Function to get the remote IP address of the user from the request headers
-    or an external service like ipify if behind a proxy.
+    Function to get the hashed remote IP address of the user, resolved once per session
+    and memoized in the session state.
+
+    Returns:
+        str: The SHA-256 hash of the IP address of the user.
     """
-    try:
-        if 'X-Real-IP' in st.query_params:
-            user_ip = st.query_params['X-Real-IP'][0]
-        elif 'X-Forwarded-For' in st.query_params:
-            user_ip = st.query_params['X-Forwarded-For'][0].split(',')[0]
-        else:
-            # If no IP found in headers, use an external service (ipify)
-            response = requests.get('https://api.ipify.org')
-            user_ip = response.text
-    except requests.exceptions.RequestException:
-        user_ip = 'Unavailable'
-
-    return  hashlib.sha256(user_ip.encode()).hexdigest()
+    hashed_ip = st.session_state.get('hashed_remote_ip')
+    if hashed_ip is None:
+        hashed_ip = hashlib.sha256(get_client_ip().encode()).hexdigest()
+        st.session_state.hashed_remote_ip = hashed_ip
+    return hashed_ip
 
 # Rate limit checker function
 def is_rate_limited(user_ip):
@@ -56,29 +242,7 @@ def is_rate_limited(user_ip):
     Returns:
         bool: True if the user is rate-limited, False otherwise.
     """
-    current_time = time.time()
-
-    # Check if the user is in the lockout period
-    lockout_time_user = st.session_state.lockout_time.get(user_ip, 0)
-    if current_time < lockout_time_user:
-        return True
-
-    # Clean up the list to remove timestamps older than 1 minute
-    st.session_state.user_requests[user_ip] = [
-        timestamp for timestamp in st.session_state.user_requests[user_ip]
-        if current_time - timestamp < 60
-    ]
-
-    # Check if the number of requests is over the limit
-    if len(st.session_state.user_requests[user_ip]) >= 10:
-        # Lock out the user for 3 minutes
-        st.session_state.lockout_time[user_ip] = current_time + 180  # 3 minutes lockout
-        
-        # Save data to JSON after the lockout time is set
-        save_data_to_json()
-        return True
-
-    return False
+    return RATE_LIMITER.is_rate_limited(user_ip)
 
 # Function to handle rate-limiting
 def handle_rate_limiting():
@@ -89,29 +253,9 @@ def handle_rate_limiting():
     str or bool: The user IP if the request is allowed, False if the request is rate-limited.
     """
     hashed_ip = get_remote_ip()
-    load_data()
 
-    # Check if the user is rate-limited
-    if is_rate_limited(hashed_ip):
+    # Check if the user is rate-limited, and record the request if not
+    if not RATE_LIMITER.allow(hashed_ip):
         return False
 
-    # If not rate-limited, allow the request and store the timestamp
-    current_time = time.time()
-    st.session_state.user_requests[hashed_ip].append(current_time)
-
-    # Save updated data to the JSON file
-    save_data_to_json()
-
     return hashed_ip
-
-# Function to save the data to a JSON file
-def save_data_to_json():
-    """
-    Save the user requests and lockout time to a JSON file for persistence.
-    """
-    data = {
-        'user_requests': {user_ip: timestamps for user_ip, timestamps in st.session_state.user_requests.items()},
-        'lockout_time': st.session_state.lockout_time
-    }
-    with open(JSON_FILE_PATH, 'w') as f:
-        json.dump(data, f, indent=4)
\ No newline at end of file
@@ -0,0 +1,153 @@
+import glob
+import os
+import re
+import time
+
+import numpy as np
+
+EMBEDDING_BACKENDS = ['torch', 'onnx', 'onnx-int8']
+# Instruction set the int8 model is quantized for: avx2 runs on any recent x86 CPU; avx512, avx512_vnni or arm64 are faster where available
+ONNX_QUANTIZATION_CONFIG = os.environ.get("EMBEDDING_ONNX_QUANTIZATION", "avx2")
+# Minimum cosine similarity between an ONNX embedding and the PyTorch embedding of the same text
+PARITY_MIN_COSINE = float(os.environ.get("EMBEDDING_PARITY_MIN_COSINE", 0.99))
+# Texts embedded to check a backend against PyTorch: queries and passages like the ones the chatbot sees
+PARITY_TEXTS = [
+    "How can I contact ITS?",
+    "How can I connect to the campus Wi-Fi?",
+    "What are the available free software for a student?",
+    "Where are all the printers located?",
+    "How do I reset my password?",
+    "The Technology Support Center is located in the John M. Pfau Library, room PL-1109.",
+    "Connect to the eduroam network with your campus email address and password.",
+    "Students can download Microsoft Office 365 at no cost while enrolled.",
+]
+
+
+def is_onnx_available():
+    """
+    Check whether the ONNX Runtime backend of sentence-transformers can be used
+
+    Returns:
+        bool: True if onnxruntime and optimum are installed
+    """
+    try:
+        import onnxruntime  # noqa: F401
+        import optimum.onnxruntime  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_export_directory(cache_dir, model_name):
+    """
+    Get the directory an ONNX export of a model is cached in
+
+    Args:
+        cache_dir (str): The model cache directory
+        model_name (str): The model name
+
+    Returns:
+        str: The export directory
+    """
+    return os.path.join(cache_dir, re.sub(r'\W+', '_', model_name) + "_onnx")
+
+
+def _quantized_file_name(export_directory):
+    # Named model_qint8_<config>.onnx or model_quint8_<config>.onnx depending on the config
+    paths = glob.glob(os.path.join(export_directory, "onnx", f"model_*int8_{ONNX_QUANTIZATION_CONFIG}.onnx"))
+    return os.path.relpath(paths[0], export_directory) if paths else None
+
+
+def export_onnx_model(model_name, cache_dir, quantize=False):
+    """
+    Export a model to ONNX (and optionally int8) in cache_dir, unless it is already there,
+    together with the PyTorch embeddings of PARITY_TEXTS used by the parity check
+
+    Args:
+        model_name (str): The model name
+        cache_dir (str): The model cache directory
+        quantize (bool, optional): Also export the int8 dynamically quantized model. Defaults to False.
+
+    Returns:
+        str: The export directory
+    """
+    from sentence_transformers import SentenceTransformer
+
+    export_directory = get_export_directory(cache_dir, model_name)
+    if not os.path.exists(os.path.join(export_directory, "onnx", "model.onnx")):
+        print(f"Exporting {model_name} to ONNX in {export_directory}")
+        SentenceTransformer(model_name, backend="onnx").save_pretrained(export_directory)
+    if not os.path.exists(os.path.join(export_directory, "parity_embeddings.npy")):
+        reference = SentenceTransformer(model_name).encode(PARITY_TEXTS, convert_to_numpy=True, normalize_embeddings=True)
+        np.save(os.path.join(export_directory, "parity_embeddings.npy"), reference)
+    if quantize and _quantized_file_name(export_directory) is None:
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        print(f"Quantizing {model_name} to int8 ({ONNX_QUANTIZATION_CONFIG})")
+        export_dynamic_quantized_onnx_model(
+            SentenceTransformer(export_directory, backend="onnx"),
+            quantization_config=ONNX_QUANTIZATION_CONFIG,
+            model_name_or_path=export_directory,
+        )
+    return export_directory
+
+
+def check_parity(model, reference_embeddings, texts=PARITY_TEXTS):
+    """
+    Compare a model's embeddings of texts with reference embeddings of the same texts
+
+    Args:
+        model (SentenceTransformer): The model to check
+        reference_embeddings (np.ndarray): The normalized reference embeddings, one row per text
+        texts (list, optional): The texts. Defaults to PARITY_TEXTS.
+
+    Returns:
+        float: The lowest cosine similarity between a model embedding and its reference
+    """
+    embeddings = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    return float(np.min(np.sum(embeddings * reference_embeddings, axis=1)))
+
+
+def load_embedding_model(model_name, backend='torch', cache_dir=None):
+    """
+    Load a SentenceTransformer with the given inference backend.
+
+    ONNX models are exported (and quantized) into cache_dir on first use and loaded from there
+    afterwards. An ONNX model whose embeddings drift from the PyTorch ones below PARITY_MIN_COSINE,
+    or one that cannot be loaded, falls back to PyTorch so the stored embeddings stay comparable.
+
+    Args:
+        model_name (str): The model name
+        backend (str, optional): One of EMBEDDING_BACKENDS. Defaults to 'torch'.
+        cache_dir (str, optional): Where ONNX exports are cached. Required for the ONNX backends.
+
+    Returns:
+        SentenceTransformer: The embedding model
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in EMBEDDING_BACKENDS:
+        print(f"Unknown embedding backend {backend}, using torch")
+        backend = 'torch'
+    if backend != 'torch' and not is_onnx_available():
+        print(f"Embedding backend {backend} needs onnxruntime and optimum (pip install sentence-transformers[onnx]), using torch")
+        backend = 'torch'
+    if backend == 'torch':
+        return SentenceTransformer(model_name)
+
+    start = time.perf_counter()
+    try:
+        export_directory = export_onnx_model(model_name, cache_dir, quantize=backend == 'onnx-int8')
+        model_kwargs = {"file_name": _quantized_file_name(export_directory)} if backend == 'onnx-int8' else {"file_name": "onnx/model.onnx"}
+        model = SentenceTransformer(export_directory, backend="onnx", model_kwargs=model_kwargs)
+        reference_embeddings = np.load(os.path.join(export_directory, "parity_embeddings.npy"))
+    except Exception as e:
+        print(f"Could not load the {backend} embedding model, using torch: {e}")
+        return SentenceTransformer(model_name)
+
+    min_cosine = check_parity(model, reference_embeddings)
+    if min_cosine < PARITY_MIN_COSINE:
+        print(f"{backend} embeddings drift from torch (min cosine {min_cosine:.4f} < {PARITY_MIN_COSINE}), using torch")
+        return SentenceTransformer(model_name)
+    print(f"Embedding model loaded with the {backend} backend in {time.perf_counter() - start:.2f}s (min cosine to torch {min_cosine:.4f})")
+    return model
@@ -0,0 +1,163 @@
+import atexit
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+SPECIAL_CHARACTERS = "?!@#$%^&*()-_=+[]{}\\|;:'\",<>/`~"
+
+
+def normalize_query_text(text):
+    """
+    Normalize a query for use as a cache key: same rules as app.remove_special_characters,
+    plus collapsing repeated whitespace.
+
+    Args:
+        text (str): The query text
+
+    Returns:
+        str: The normalized query text
+    """
+    text = text.translate(str.maketrans("", "", SPECIAL_CHARACTERS)).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class QueryEmbeddingCache:
+    """
+    A bounded, thread-safe LRU cache of query embeddings keyed on normalized query text.
+
+    Attributes:
+        max_entries (int): Maximum number of cached embeddings.
+        path (str): Optional .npz file the cache is persisted to, so warm restarts skip encoding.
+        persist_every (int): Number of new entries between saves to ``path``.
+        model (str): Identifies the model and backend the embeddings come from; a file saved for another one is discarded.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that had to encode the query.
+    """
+
+    def __init__(self, max_entries=1024, path=None, persist_every=32, model=""):
+        self.max_entries = max_entries
+        self.path = path
+        self.persist_every = persist_every
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        if self.path:
+            self.load()
+            atexit.register(self.save)
+
+    def get(self, text):
+        """
+        Get the cached embedding of a query
+
+        Args:
+            text (str): The query text
+
+        Returns:
+            np.ndarray: The cached embedding, or None on a miss
+        """
+        key = normalize_query_text(text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return embedding
+
+    def put(self, text, embedding):
+        """
+        Cache the embedding of a query
+
+        Args:
+            text (str): The query text
+            embedding (np.ndarray): The query embedding
+        """
+        key = normalize_query_text(text)
+        with self._lock:
+            self._entries[key] = np.asarray(embedding, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            should_save = self.path and self._unsaved >= self.persist_every
+        if should_save:
+            self.save()
+
+    def get_or_compute(self, text, encode):
+        """
+        Get the cached embedding of a query, encoding and caching it on a miss
+
+        Args:
+            text (str): The query text
+            encode (callable): Function mapping the query text to its embedding
+
+        Returns:
+            np.ndarray: The query embedding
+        """
+        embedding = self.get(text)
+        if embedding is None:
+            embedding = np.asarray(encode(text), dtype=np.float32)
+            self.put(text, embedding)
+        return embedding
+
+    def stats(self):
+        """
+        Get the cache counters
+
+        Returns:
+            dict: The number of entries, hits, misses and the hit rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def save(self):
+        """
+        Persist the cache to ``path``
+        """
+        if not self.path:
+            return
+        with self._lock:
+            keys = list(self._entries.keys())
+            embeddings = np.stack(list(self._entries.values())) if keys else np.empty((0, 0), dtype=np.float32)
+            self._unsaved = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary_path = f"{self.path}.tmp.npz"
+        np.savez(temporary_path, keys=np.array(keys, dtype=str), embeddings=embeddings, model=np.array(self.model))
+        os.replace(temporary_path, self.path)
+
+    def load(self):
+        """
+        Load the cache from ``path`` if it exists and was saved for the same model
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                keys, embeddings = data["keys"], data["embeddings"]
+                # Files saved before the model was recorded have no "model" entry
+                model = str(data["model"]) if "model" in data.files else None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load query embedding cache from {self.path}: {e}")
+            return
+        if model != self.model:
+            print(f"Discarding query embedding cache {self.path}: saved for model {model!r}, not {self.model!r}")
+            return
+        with self._lock:
+            for key, embedding in zip(keys[-self.max_entries:], embeddings[-self.max_entries:]):
+                self._entries[str(key)] = embedding.astype(np.float32)
+
+    def __len__(self):
+        return len(self._entries)
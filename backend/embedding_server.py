@@ -0,0 +1,139 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from backend.tracing import Histogram
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """
+    An in-process embedding service that micro-batches single-text requests.
+
+    Requests from any thread are queued; a worker thread takes the first waiting request, collects
+    the requests arriving within ``max_wait_ms`` (up to ``max_batch_size``), encodes them in one call
+    and resolves each request's future with its own row. Requests that arrive while the model is busy
+    are picked up together by the next batch.
+
+    Attributes:
+        max_batch_size (int): Maximum number of texts encoded per call.
+        max_wait (float): Seconds the worker waits for more requests before encoding a batch.
+        batch_sizes (Histogram): Number of texts per encode call.
+        queue_wait_ms (Histogram): Milliseconds each request waited before its batch started encoding.
+    """
+
+    BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+    QUEUE_WAIT_MS_BUCKETS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000]
+
+    def __init__(self, encode, max_batch_size=32, max_wait_ms=2, name="embedding-server"):
+        """
+        Start the worker thread.
+
+        Args:
+            encode (callable): Function mapping a list of texts to a matrix with one embedding per row.
+            max_batch_size (int, optional): Maximum number of texts encoded per call. Defaults to 32.
+            max_wait_ms (float, optional): Milliseconds to wait for more requests. Defaults to 2.
+            name (str, optional): The worker thread name. Defaults to "embedding-server".
+        """
+        self.encode_batch = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Histogram(self.BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(self.QUEUE_WAIT_MS_BUCKETS)
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if request is _STOP:
+                # Finish this batch, then stop
+                self._requests.put(_STOP)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._requests.get()
+            if first is _STOP:
+                return
+            batch = self._collect_batch(first)
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+            self.batch_sizes.observe(len(batch))
+            try:
+                embeddings = self.encode_batch([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+    def submit(self, text):
+        """
+        Queue a text for encoding
+
+        Args:
+            text (str): The text to encode
+
+        Returns:
+            concurrent.futures.Future: Resolves to the embedding of the text
+        """
+        future = Future()
+        self._requests.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text, timeout=None):
+        """
+        Encode a text, blocking until its batch is done
+
+        Args:
+            text (str): The text to encode
+            timeout (float, optional): Seconds to wait. Defaults to None.
+
+        Returns:
+            np.ndarray: The embedding of the text
+        """
+        return self.submit(text).result(timeout)
+
+    def stats(self):
+        """
+        Get the batch-size and queue-wait histograms
+
+        Returns:
+            dict: The number of batches and queries, the mean batch size and both histograms
+        """
+        batch_sizes = self.batch_sizes.snapshot(cumulative=False)
+        queue_wait_ms = self.queue_wait_ms.snapshot(cumulative=False)
+        return {
+            "batches": batch_sizes["count"],
+            "queries": int(batch_sizes["sum"]),
+            "mean_batch_size": round(batch_sizes["mean"], 3),
+            "batch_size_histogram": batch_sizes["buckets"],
+            "queue_wait_ms_histogram": queue_wait_ms["buckets"],
+            "mean_queue_wait_ms": round(queue_wait_ms["mean"], 3),
+        }
+
+    def close(self):
+        """
+        Stop the worker thread once the queued requests are encoded
+        """
+        self._requests.put(_STOP)
+        self._thread.join()
@@ -0,0 +1,212 @@
+import json
+import os
+import time
+
+import numpy as np
+from pydantic import ConfigDict, Field
+
+from backend.retriever import ScoreThresholdRetriever
+
+# Fields kept next to the embedding matrix, one list per field with one entry per row
+METADATA_FIELDS = ["hash_id", "title", "text", "source"]
+
+
+class ExactHit:
+    """
+    A search result of the EmbeddingMatrix, shaped like a Milvus hit
+
+    Attributes:
+        id (str): The chunk hash_id.
+        distance (float): The inner product of the chunk and query embeddings.
+        entity (dict): The chunk title, text and source.
+    """
+
+    __slots__ = ("id", "distance", "entity")
+
+    def __init__(self, id, distance, entity):
+        self.id = id
+        self.distance = distance
+        self.entity = entity
+
+    def __repr__(self):
+        return repr({"hash_id": self.id, "distance": self.distance, "entity": self.entity})
+
+
+class EmbeddingMatrix:
+    """
+    The embeddings of a collection as one contiguous float32 matrix, with the chunk metadata in parallel lists.
+
+    The matrix is saved as a .npy file and memory-mapped, so it is read from the page cache rather than
+    copied into every process, and a restart does not have to export the collection again.
+
+    Attributes:
+        embeddings (np.ndarray): The normalized embeddings, one row per chunk.
+        metadata (dict): The METADATA_FIELDS lists, row-aligned with the embeddings.
+        stamp (dict): What the matrix was exported from, compared to decide whether it can be reused.
+    """
+
+    def __init__(self, embeddings, metadata, stamp=None):
+        self.embeddings = embeddings
+        self.metadata = metadata
+        self.stamp = stamp
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @staticmethod
+    def paths(directory, name):
+        return os.path.join(directory, f"{name}.npy"), os.path.join(directory, f"{name}.json")
+
+    @classmethod
+    def from_collection(cls, collection, batch_size=1000):
+        """
+        Read every chunk of a loaded collection
+
+        Args:
+            collection (Collection): The collection
+            batch_size (int, optional): The number of chunks per query. Defaults to 1000.
+
+        Returns:
+            EmbeddingMatrix: The embeddings and metadata of the collection, in memory
+        """
+        iterator = collection.query_iterator(batch_size=batch_size, expr="", output_fields=["embedding", *METADATA_FIELDS])
+        embeddings, metadata = [], {field: [] for field in METADATA_FIELDS}
+        try:
+            while rows := iterator.next():
+                for row in rows:
+                    embeddings.append(row["embedding"])
+                    for field in METADATA_FIELDS:
+                        metadata[field].append(row.get(field))
+        finally:
+            iterator.close()
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        return cls(np.ascontiguousarray(matrix), metadata)
+
+    def save(self, directory, name, stamp=None):
+        """
+        Write the matrix and metadata to directory, atomically
+
+        Args:
+            directory (str): The directory
+            name (str): The file name without extension, usually the collection name
+            stamp (dict, optional): What the matrix was exported from. Defaults to None.
+        """
+        os.makedirs(directory, exist_ok=True)
+        matrix_path, metadata_path = self.paths(directory, name)
+        # np.save appends .npy to names without it
+        np.save(f"{matrix_path}.tmp.npy", self.embeddings)
+        with open(f"{metadata_path}.tmp", 'w') as f:
+            json.dump({"stamp": stamp, "metadata": self.metadata}, f)
+        os.replace(f"{matrix_path}.tmp.npy", matrix_path)
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+        self.stamp = stamp
+
+    @classmethod
+    def load(cls, directory, name, stamp=None):
+        """
+        Memory-map a saved matrix
+
+        Args:
+            directory (str): The directory
+            name (str): The file name without extension
+            stamp (dict, optional): Only load a matrix saved with this stamp. Defaults to None.
+
+        Returns:
+            EmbeddingMatrix: The matrix, or None if there is no usable saved matrix
+        """
+        matrix_path, metadata_path = cls.paths(directory, name)
+        if not os.path.exists(matrix_path) or not os.path.exists(metadata_path):
+            return None
+        try:
+            with open(metadata_path) as f:
+                saved = json.load(f)
+            if stamp is not None and saved.get("stamp") != stamp:
+                return None
+            embeddings = np.load(matrix_path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            print(f"Could not load the embedding matrix {matrix_path}: {e}")
+            return None
+        if len(embeddings) != len(saved["metadata"]["hash_id"]):
+            return None
+        return cls(embeddings, saved["metadata"], saved.get("stamp"))
+
+    def search(self, query_embedding, k, with_embeddings=False):
+        """
+        Find the k rows with the highest inner product with the query
+
+        Args:
+            query_embedding (list): The normalized query embedding
+            k (int): The number of rows
+            with_embeddings (bool, optional): Add the embedding of each row to its entity. Defaults to False.
+
+        Returns:
+            list: ExactHits, best first
+        """
+        if not len(self):
+            return []
+        scores = self.embeddings @ np.asarray(query_embedding, dtype=np.float32)
+        if k < len(scores):
+            # Partial selection of the k best in O(n), then only those k are sorted
+            rows = np.argpartition(-scores, k - 1)[:k]
+        else:
+            rows = np.arange(len(scores))
+        rows = rows[np.argsort(-scores[rows])]
+        hits = []
+        for row in rows.tolist():
+            entity = {"title": self.metadata["title"][row], "text": self.metadata["text"][row], "source": self.metadata["source"][row]}
+            if with_embeddings:
+                entity["embedding"] = self.embeddings[row]
+            hits.append(ExactHit(self.metadata["hash_id"][row], float(scores[row]), entity))
+        return hits
+
+
+def get_embedding_matrix(collection, directory, stamp=None):
+    """
+    Get the embedding matrix of a collection, reusing the one saved in directory if its stamp matches
+
+    Args:
+        collection (Collection): The loaded collection
+        directory (str): Where matrices are saved
+        stamp (dict, optional): Identifies the collection contents, e.g. the ingestion manifest. Without one
+            the collection is always exported again.
+
+    Returns:
+        EmbeddingMatrix: The memory-mapped matrix
+    """
+    matrix = EmbeddingMatrix.load(directory, collection.name, stamp) if stamp is not None else None
+    if matrix is None:
+        start = time.perf_counter()
+        EmbeddingMatrix.from_collection(collection).save(directory, collection.name, stamp)
+        matrix = EmbeddingMatrix.load(directory, collection.name)
+        print(f"Exported {len(matrix)} embeddings of {collection.name} in {time.perf_counter() - start:.2f}s")
+    return matrix
+
+
+class ExactSearchRetriever(ScoreThresholdRetriever):
+    """
+    A ScoreThresholdRetriever that searches an in-memory EmbeddingMatrix exactly instead of querying Milvus.
+
+    For a corpus of a few thousand chunks one matrix-vector product is faster than a Milvus Lite search
+    and always returns the exact nearest chunks. The collection argument of get_related_documents is
+    accepted for compatibility and ignored.
+
+    Attributes:
+        matrix (EmbeddingMatrix): The embeddings and metadata searched.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    matrix: EmbeddingMatrix = Field(description="The embeddings and metadata searched")
+
+    def search(self, query_embedding, collection=None):
+        """
+        Search the embedding matrix for the k chunks nearest to the query
+
+        Args:
+            query_embedding (list): The normalized query embedding
+            collection (Collection, optional): Ignored. Defaults to None.
+
+        Returns:
+            List[ExactHit]: The hits, best first
+        """
+        return self.matrix.search(query_embedding, self.k, with_embeddings=self.return_embeddings)
@@ -0,0 +1,187 @@
+import itertools
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from bs4 import BeautifulSoup
+
+REMOVED_TAGS = ['script', 'style', 'header', 'footer', 'nav']
+MAIN_CONTENT_CLASS = 'page-main-content'
+HTML_PARSERS = ['selectolax', 'lxml', 'html.parser']
+HTML_CLEAN_WORKERS = int(os.environ.get("HTML_CLEAN_WORKERS", os.cpu_count() or 1))
+# Below this many pages the process pool costs more than it saves
+HTML_CLEAN_MIN_PARALLEL_PAGES = 8
+
+
+def is_parser_available(parser):
+    """
+    Check whether an HTML parser backend can be used
+
+    Args:
+        parser (str): One of HTML_PARSERS
+
+    Returns:
+        bool: True if the backend is installed
+    """
+    try:
+        if parser == 'selectolax':
+            import selectolax.lexbor  # noqa: F401
+        elif parser == 'lxml':
+            import lxml  # noqa: F401
+        elif parser != 'html.parser':
+            return False
+    except ImportError:
+        return False
+    return True
+
+
+def get_default_parser():
+    """
+    Get the HTML parser backend to use: HTML_PARSER if set and installed, otherwise html.parser
+
+    selectolax and lxml are faster but repair misnested tags and unknown entities differently from html.parser,
+    which changes the chunk text and hashes of such pages. Only set HTML_PARSER to one of them after
+    benchmarks.html_cleaning_benchmark reports no mismatches on the captured pages.
+
+    Returns:
+        str: The parser backend
+    """
+    configured = os.environ.get("HTML_PARSER", "html.parser")
+    return configured if is_parser_available(configured) else 'html.parser'
+
+
+HTML_PARSER = get_default_parser()
+
+
+def clean_text(text):
+    """
+    Clean the text by removing extra spaces and empty lines
+
+    Args:
+        text (str): The text to clean
+
+    Returns:
+        str: The cleaned text
+    """
+    lines = (line.strip() for line in text.splitlines())
+    cleaned_lines = [line for line in lines if line]
+    return '\n'.join(cleaned_lines)
+
+
+def _extract_text_beautifulsoup(html_content, features):
+    soup = BeautifulSoup(html_content, features)
+
+    # Remove unnecessary elements
+    for script_or_style in soup(REMOVED_TAGS):
+        script_or_style.decompose()
+
+    main_content = soup.find('div', {'class': MAIN_CONTENT_CLASS})
+    if main_content:
+        return main_content.get_text(separator='\n')
+    return soup.get_text(separator='\n')
+
+
+def _extract_text_selectolax(html_content):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html_content)
+    # Remove unnecessary elements
+    tree.strip_tags(REMOVED_TAGS)
+
+    main_content = tree.css_first(f'div.{MAIN_CONTENT_CLASS}')
+    node = main_content if main_content is not None else tree.root
+    if node is None:
+        return ''
+    return node.text(separator='\n')
+
+
+def clean_text_from_html(html_content, parser=None):
+    """
+    Clean the text from the HTML content
+
+    The backends agree on well-formed pages, but not always on malformed markup (see get_default_parser).
+
+    Args:
+        html_content (str): The HTML content to clean
+        parser (str, optional): The parser backend, one of HTML_PARSERS. Defaults to HTML_PARSER.
+
+    Returns:
+        str: The cleaned text
+    """
+    parser = parser or HTML_PARSER
+    if parser == 'selectolax':
+        content = _extract_text_selectolax(html_content)
+    else:
+        content = _extract_text_beautifulsoup(html_content, parser)
+    return clean_text(content)
+
+
+def _process_pool(workers):
+    # Started through a fork server (or spawned) rather than forked from a process already running torch, the
+    # embedding server and the crawler threads
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+
+def clean_html_documents(html_contents, parser=None, workers=HTML_CLEAN_WORKERS):
+    """
+    Clean many HTML pages, over a process pool when there are enough of them
+
+    Args:
+        html_contents (list): The HTML content of each page
+        parser (str, optional): The parser backend. Defaults to HTML_PARSER.
+        workers (int, optional): The number of worker processes. Defaults to HTML_CLEAN_WORKERS.
+
+    Returns:
+        list: The cleaned text of each page, in the same order
+    """
+    clean = partial(clean_text_from_html, parser=parser or HTML_PARSER)
+    if workers <= 1 or len(html_contents) < HTML_CLEAN_MIN_PARALLEL_PAGES:
+        return [clean(html_content) for html_content in html_contents]
+    chunksize = max(1, len(html_contents) // (workers * 4))
+    with _process_pool(workers) as pool:
+        return list(pool.map(clean, html_contents, chunksize=chunksize))
+
+
+def clean_html_stream(pages, parser=None, workers=HTML_CLEAN_WORKERS):
+    """
+    Clean a stream of crawled pages over a process pool, keeping at most a few pages in flight
+
+    The pool is only started once the stream has HTML_CLEAN_MIN_PARALLEL_PAGES pages, so a sync that
+    changed a few pages cleans them inline.
+
+    Args:
+        pages (Iterable): Objects with an ``html`` attribute, e.g. CrawledPage
+        parser (str, optional): The parser backend. Defaults to HTML_PARSER.
+        workers (int, optional): The number of worker processes. Defaults to HTML_CLEAN_WORKERS.
+
+    Yields:
+        tuple: Each page and its cleaned text, in input order
+    """
+    clean = partial(clean_text_from_html, parser=parser or HTML_PARSER)
+    if workers <= 1:
+        for page in pages:
+            yield page, clean(page.html)
+        return
+    pages = iter(pages)
+    first_pages = []
+    for page in pages:
+        first_pages.append(page)
+        if len(first_pages) >= HTML_CLEAN_MIN_PARALLEL_PAGES:
+            break
+    else:
+        for page in first_pages:
+            yield page, clean(page.html)
+        return
+    with _process_pool(workers) as pool:
+        in_flight = deque()
+        for page in itertools.chain(first_pages, pages):
+            in_flight.append((page, pool.submit(clean, page.html)))
+            if len(in_flight) >= 2 * workers:
+                page, future = in_flight.popleft()
+                yield page, future.result()
+        while in_flight:
+            page, future = in_flight.popleft()
+            yield page, future.result()
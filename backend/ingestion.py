@@ -0,0 +1,158 @@
+import json
+import os
+import queue
+import threading
+import time
+from itertools import islice
+
+INGESTION_QUEUE_SIZE = 16
+_DONE = object()
+
+
+def _pump(iterable, items, stop, errors):
+    """
+    Move the items of an iterable into a bounded queue until it is exhausted or the consumer stops
+    """
+    iterator = iter(iterable)
+    try:
+        for item in iterator:
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                return
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        # Closing a generator stage also closes the stages feeding it
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+        while not stop.is_set():
+            try:
+                items.put(_DONE, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
+
+def run_in_background(iterable, maxsize=INGESTION_QUEUE_SIZE, name=None):
+    """
+    Run an iterable (usually a generator stage) in a background thread and hand its items over
+    through a bounded queue, so the stage overlaps with its consumer while memory stays bounded.
+
+    Exceptions raised by the stage are re-raised in the consumer. Closing the returned generator
+    stops the stage.
+
+    Args:
+        iterable (Iterable): The stage to run
+        maxsize (int, optional): The maximum number of items buffered between the stages. Defaults to INGESTION_QUEUE_SIZE.
+        name (str, optional): The thread name. Defaults to None.
+
+    Yields:
+        The items produced by the stage
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    errors = []
+    thread = threading.Thread(target=_pump, args=(iterable, items, stop, errors), name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def batched(iterable, batch_size):
+    """
+    Group the items of an iterable into lists of at most batch_size items
+
+    Args:
+        iterable (Iterable): The items
+        batch_size (int): The maximum batch size
+
+    Yields:
+        list: The batches
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+class IngestionManifest:
+    """
+    Record of the last completed ingestion, persisted as JSON next to the vector store.
+
+    It holds the ``corpus`` URL, the ``collection_name``, the ``embedding_model`` and ``schema_version``
+    the collection was built with, the time of the crawl (``crawled_at``, seconds since the epoch) and
+    the ``chunk_count`` of the collection afterwards. Unlike an environment variable it survives
+    restarts, so a process can tell whether the collection on disk can be used as it is.
+
+    Attributes:
+        path (str): The JSON file the manifest is stored in.
+        data (dict): The recorded fields, empty if there was no readable manifest.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        self.load()
+
+    def load(self):
+        """
+        Load the manifest from ``path`` if it exists
+        """
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load ingestion manifest from {self.path}: {e}")
+            self.data = {}
+
+    def save(self, **fields):
+        """
+        Replace the recorded fields and write the manifest to ``path`` atomically
+
+        Args:
+            **fields: The fields to record
+        """
+        self.data = dict(fields)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def stale_reason(self, expected, max_age=None, now=None):
+        """
+        Check whether the recorded ingestion can be reused
+
+        Args:
+            expected (dict): Fields that must be recorded with these values, e.g. the corpus and embedding model
+            max_age (float, optional): Maximum seconds since the crawl, None for no limit. Defaults to None.
+            now (float, optional): The current time. Defaults to time.time().
+
+        Returns:
+            str: Why the ingestion must be redone, or None if it is fresh
+        """
+        if not self.data:
+            return "no ingestion manifest"
+        for field, value in expected.items():
+            if self.data.get(field) != value:
+                return f"{field} changed from {self.data.get(field)!r} to {value!r}"
+        age = (now or time.time()) - self.data.get("crawled_at", 0)
+        if max_age is not None and age > max_age:
+            return f"last crawl is {age / 3600:.1f} hours old"
+        return None
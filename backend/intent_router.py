@@ -0,0 +1,185 @@
+import os
+import re
+import threading
+
+import numpy as np
+
+# Set to 0 to send every query that is not a greeting matched by FILTERED_QUERY_PATTERN through retrieval and the LLM
+INTENT_ROUTER_ENABLED = os.environ.get("INTENT_ROUTER_ENABLED", "1") == "1"
+# Set to 1 to answer queries close to a small talk or chatbot identity intent with the greeting response without retrieval,
+# and INTENT_ROUTER_OFF_TOPIC to 1 to answer queries close to an off-topic intent with the insufficient information
+# response. Both are off by default: the thresholds below have not been calibrated with the SentenceTransformer, and a
+# misrouted ITS question would not be answered. Run benchmarks.router_benchmark --greeting --off-topic on the model first.
+INTENT_ROUTER_GREETING = os.environ.get("INTENT_ROUTER_GREETING", "0") == "1"
+INTENT_ROUTER_OFF_TOPIC = os.environ.get("INTENT_ROUTER_OFF_TOPIC", "0") == "1"
+# Minimum cosine similarity between a query and the centroid of a greeting or off-topic intent for it to be routed there
+INTENT_ROUTER_THRESHOLD = float(os.environ.get("INTENT_ROUTER_THRESHOLD", 0.5))
+# How much closer the query must be to that intent than to the closest ITS intent
+INTENT_ROUTER_MARGIN = float(os.environ.get("INTENT_ROUTER_MARGIN", 0.1))
+# Minimum cosine similarity with a previously answered query for its cached answer to be served without retrieval
+INTENT_ROUTER_FAQ_SIMILARITY = float(os.environ.get("INTENT_ROUTER_FAQ_SIMILARITY", 0.97))
+
+# Greetings and identity questions, answered with the greeting response without embedding the query
+FILTERED_QUERY_PATTERN = re.compile("|".join(f"(?:{pattern})" for pattern in [
+    r"\b(hi|hello|hey|hiya|howdy|greetings|yo)\b", # Common greetings
+    r"who (are|r) you\??", # Identity questions
+    r"what('?s| is) your name\??", # Name questions
+    r"what('?s| is) your role\??", # Role questions
+    r"(hi|hello|hey|yo),? (who are you|what('?s| is) your name)\??", # Greeting + identity
+    r"(hi|hello|hey|yo),? (what do you do|what can you do)\??", # Greeting + capability
+    r"good (morning|afternoon|evening),? (who are you|what('?s| is) your role)\??", # Polite intros
+    r"(what can you do for me)\??" # Informal assistance questions
+]))
+
+# Routes of the intents: "greeting" and "off_topic" get a canned response, "rag" goes on to retrieval
+INTENT_ROUTES = {
+    "small talk": "greeting",
+    "chatbot identity": "greeting",
+    "general knowledge": "off_topic",
+    "programming": "off_topic",
+    "entertainment": "off_topic",
+    "campus services": "off_topic",
+    "accounts and passwords": "rag",
+    "network and wifi": "rag",
+    "software": "rag",
+    "printing and labs": "rag",
+    "security": "rag",
+    "help desk and devices": "rag",
+}
+# Example queries of each intent; each intent is represented by the centroid of their embeddings
+INTENT_EXAMPLES = {
+    "small talk": [
+        "good morning", "thanks for your help", "thank you so much", "how are you doing today",
+        "nice to meet you", "bye, have a nice day", "okay cool", "see you later",
+    ],
+    "chatbot identity": [
+        "are you a bot or a human", "what are you", "tell me about yourself", "how can you help me",
+        "what kind of questions can I ask you", "are you an AI", "who made you",
+    ],
+    "general knowledge": [
+        "what is the capital of France", "explain quantum physics", "how does blockchain work",
+        "who won the world cup", "what is machine learning", "summarize the history of the roman empire",
+        "what is the meaning of life", "explain the theory of relativity", "how does photosynthesis work",
+    ],
+    "programming": [
+        "write a java program that sorts an array", "fix this javascript error", "how do I reverse a list in python",
+        "write a SQL query to join two tables", "explain recursion with an example", "generate a hello world program in c++",
+    ],
+    "entertainment": [
+        "tell me a joke", "recommend a good movie", "write a poem about the ocean", "what is the weather tomorrow",
+        "what is your favorite food", "play a game with me",
+    ],
+    "campus services": [
+        "when is the dining hall open", "where is the bookstore", "where is the recreation center",
+        "how do I apply for financial aid", "how do I order an official transcript", "how do I declare a major",
+        "how do I register for classes", "where is the admissions office",
+    ],
+    "accounts and passwords": [
+        "how do I reset my password", "my account is locked", "how do I set up Duo two-factor authentication",
+        "I can't log in to MyCoyote", "how do I change my campus email password", "how do I activate my student account",
+    ],
+    "network and wifi": [
+        "how do I connect my phone to eduroam", "the wireless internet is not working in my dorm",
+        "how do I use the VPN from home", "how do I get internet access on campus",
+    ],
+    "software": [
+        "can students get Microsoft Office for free", "how do I download Matlab", "where can I get antivirus software",
+        "how do I install SPSS on my laptop", "what software does the university license for faculty",
+    ],
+    "printing and labs": [
+        "how do I print from my laptop", "where are the computer labs", "how much does printing cost on campus",
+        "can I access lab software remotely", "how do I add money for printing",
+    ],
+    "security": [
+        "I received a suspicious email", "how do I report a phishing email", "how do I keep my computer safe from viruses",
+        "what is the university information security policy", "my account may have been hacked",
+    ],
+    "help desk and devices": [
+        "how do I submit an IT support ticket", "what are the technology support center hours",
+        "can I borrow a laptop from the university", "my campus issued laptop is broken",
+        "how do I get my ID card", "how do I set up Canvas notifications",
+    ],
+}
+
+
+class IntentRouter:
+    """
+    Routes queries to a canned response, a cached answer or retrieval before the RAG pipeline.
+
+    Greetings matched by FILTERED_QUERY_PATTERN never reach the router. Other queries are classified by
+    their nearest intent centroid, computed once from INTENT_EXAMPLES: a query closer than ``threshold``
+    to a greeting or off-topic intent, and ``margin`` closer to it than to any ITS intent, gets the
+    canned response of that route if the route is turned on (``greeting``, ``off_topic``). Queries that
+    stay on the RAG route can still be answered from the answer cache when they are near duplicates of
+    an answered query.
+
+    Attributes:
+        threshold (float): Minimum cosine similarity to a greeting or off-topic centroid.
+        margin (float): Minimum lead over the closest ITS centroid.
+        faq_similarity (float): Minimum cosine similarity with an answered query.
+        greeting (bool): Whether small talk and identity queries get the greeting response instead of retrieval.
+        off_topic (bool): Whether off-topic queries get the insufficient information response instead of retrieval.
+        intents (list): The intent names, in the order of the centroid rows.
+    """
+
+    def __init__(self, encode, intent_examples=INTENT_EXAMPLES, intent_routes=INTENT_ROUTES,
+                 threshold=INTENT_ROUTER_THRESHOLD, margin=INTENT_ROUTER_MARGIN, faq_similarity=INTENT_ROUTER_FAQ_SIMILARITY,
+                 greeting=INTENT_ROUTER_GREETING, off_topic=INTENT_ROUTER_OFF_TOPIC):
+        self.threshold = threshold
+        self.margin = margin
+        self.faq_similarity = faq_similarity
+        self.greeting = greeting
+        self.off_topic = off_topic
+        self.intents = list(intent_examples)
+        self._routes = np.array([intent_routes[intent] for intent in self.intents])
+        self._rag = self._routes == "rag"
+        # All examples in one model call, then one normalized mean per intent
+        examples = [example for intent in self.intents for example in intent_examples[intent]]
+        embeddings = np.asarray(encode(examples), dtype=np.float32)
+        centroids, start = [], 0
+        for intent in self.intents:
+            centroid = embeddings[start:start + len(intent_examples[intent])].mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+            start += len(intent_examples[intent])
+        self.centroids = np.stack(centroids)
+        self._counts = {"greeting": 0, "off_topic": 0, "faq": 0, "rag": 0}
+        self._lock = threading.Lock()
+
+    def classify(self, query_embedding):
+        """
+        Find the intent of a query
+
+        Args:
+            query_embedding (list): The normalized query embedding
+
+        Returns:
+            tuple: The route ("greeting", "off_topic" or "rag"), the nearest intent and its cosine similarity
+        """
+        similarities = self.centroids @ np.asarray(query_embedding, dtype=np.float32)
+        best = int(np.argmax(similarities))
+        route, similarity = str(self._routes[best]), float(similarities[best])
+        if route != "rag" and (similarity < self.threshold or similarity - similarities[self._rag].max() < self.margin):
+            route = "rag"
+        elif not (self.greeting if route == "greeting" else self.off_topic):
+            route = "rag"
+        return route, self.intents[best], similarity
+
+    def count(self, route):
+        """
+        Count a routed query
+
+        Args:
+            route (str): "greeting", "off_topic", "faq" or "rag"
+        """
+        with self._lock:
+            self._counts[route] += 1
+
+    def stats(self):
+        """
+        Get the number of queries sent down each route
+
+        Returns:
+            dict: The count per route; every route but "rag" is a query answered without the LLM
+        """
+        with self._lock:
+            return dict(self._counts)
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+import traceback
+
+import backend.RAG as RAG
+from backend.ingestion import IngestionManifest
+from backend.tracing import Histogram
+
+# Refresh the corpus in the background whenever the last crawl is older than RAG.CORPUS_MAX_AGE; set to 0 to only sync at startup
+CORPUS_REFRESH_ENABLED = os.environ.get("CORPUS_REFRESH_ENABLED", "1") == "1"
+# Seconds to wait before retrying a refresh that failed
+CORPUS_REFRESH_RETRY_DELAY = float(os.environ.get("CORPUS_REFRESH_RETRY_DELAY", 600))
+CORPUS_REFRESHER = None
+CORPUS_REFRESHER_LOCK = threading.Lock()
+
+
+class CorpusRefresher:
+    """
+    Background worker that keeps the vector store in sync with the website.
+
+    Each refresh runs ``RAG.refresh_vector_store``, which builds the new corpus in a shadow collection
+    and switches queries over once it is complete, so sessions are never blocked and never see a
+    partially updated collection. A refresh is due ``interval`` seconds after the last crawl, or
+    immediately when ``trigger()`` is called.
+
+    Attributes:
+        interval (float): Seconds between refreshes.
+        durations (Histogram): Seconds each refresh took.
+        last_refresh (dict): The statistics of the last completed refresh, None before the first one.
+    """
+
+    DURATION_BUCKETS = [1, 5, 10, 30, 60, 120, 300, 600, 1800]
+
+    def __init__(self, interval, retry_delay=CORPUS_REFRESH_RETRY_DELAY):
+        """
+        Args:
+            interval (float): Seconds between refreshes.
+            retry_delay (float, optional): Seconds to wait before retrying a failed refresh. Defaults to CORPUS_REFRESH_RETRY_DELAY.
+        """
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.durations = Histogram(self.DURATION_BUCKETS)
+        self.last_refresh = None
+        self.next_refresh = None
+        self._counters = {"refreshes": 0, "switches": 0, "failures": 0, "inserted": 0, "deleted": 0}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, first_delay=None):
+        """
+        Start the worker thread, once
+
+        Args:
+            first_delay (float, optional): Seconds until the first refresh. Defaults to the time left until
+                the crawl recorded in the ingestion manifest is ``interval`` seconds old.
+        """
+        if self._thread is not None:
+            return
+        if first_delay is None:
+            crawled_at = IngestionManifest(RAG.INGESTION_MANIFEST_PATH).data.get("crawled_at", 0)
+            first_delay = 0 if RAG.CORPUS_REFRESH_ON_START else max(0.0, crawled_at + self.interval - time.time())
+        self.next_refresh = time.time() + first_delay
+        self._thread = threading.Thread(target=self._run, name="corpus-refresh", daemon=True)
+        self._thread.start()
+
+    def trigger(self):
+        """
+        Refresh now instead of waiting for the next scheduled refresh
+        """
+        self.next_refresh = time.time()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(max(0.0, self.next_refresh - time.time()))
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            if time.time() < self.next_refresh:
+                continue
+            self.next_refresh = time.time() + self.refresh()
+
+    def refresh(self):
+        """
+        Refresh the vector store now, on the calling thread
+
+        Returns:
+            float: Seconds until the next refresh is due
+        """
+        start = time.perf_counter()
+        try:
+            stats = RAG.refresh_vector_store()
+        except Exception:
+            print("Corpus refresh failed")
+            traceback.print_exc()
+            self._counters["failures"] += 1
+            self.durations.observe(time.perf_counter() - start)
+            return self.retry_delay
+        self.durations.observe(stats["duration"])
+        self.last_refresh = dict(stats, finished_at=time.time())
+        self._counters["refreshes"] += 1
+        self._counters["switches"] += stats["switched"]
+        self._counters["inserted"] += stats["inserted"]
+        self._counters["deleted"] += stats["deleted"]
+        # A crawl that reached no pages did not refresh anything, so try again sooner
+        return self.interval if stats["pages"] else self.retry_delay
+
+    def stats(self):
+        """
+        Get the refresh metrics
+
+        Returns:
+            dict: Refresh, switch and failure counts, chunks inserted and deleted in total, the duration histogram,
+                the statistics of the last refresh and the time of the next one
+        """
+        durations = self.durations.snapshot(cumulative=False)
+        return dict(
+            self._counters,
+            duration_seconds_histogram=durations["buckets"],
+            mean_duration_seconds=round(durations["mean"], 3),
+            last_refresh=self.last_refresh,
+            next_refresh=self.next_refresh,
+        )
+
+    def stop(self):
+        """
+        Stop the worker thread after the refresh in progress, if any
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def get_corpus_refresher():
+    """
+    Get the process-wide corpus refresher
+
+    Returns:
+        CorpusRefresher: The shared refresher, refreshing every RAG.CORPUS_MAX_AGE seconds
+    """
+    global CORPUS_REFRESHER
+    if CORPUS_REFRESHER is None:
+        with CORPUS_REFRESHER_LOCK:
+            if CORPUS_REFRESHER is None:
+                CORPUS_REFRESHER = CorpusRefresher(interval=RAG.CORPUS_MAX_AGE)
+    return CORPUS_REFRESHER
@@ -1,56 +1,67 @@
-from langchain.schema import BaseRetriever, Document
-import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from pydantic import Field
 from pymilvus import Collection
 from typing import List, Any
 
+from backend.vector_index import get_search_params
+
 class ScoreThresholdRetriever(BaseRetriever):
     """
     A retriever that retrieves relevant documents based on similarity scores from a vector store.
 
     Attributes:
         vector_store (Any): The vector store for similarity search.
-        score_threshold (float): Minimum normalized score to consider a document relevant.
+        score_threshold (float): Minimum normalized score to consider a document relevant, between 0 and 1.
         k (int): Number of documents to retrieve.
+        search_params (dict): The Milvus search parameters, see backend.vector_index.get_search_params.
+        return_embeddings (bool): Whether to add each chunk's embedding to its metadata, e.g. for backend.context_packing.
 
     """
 
     score_threshold: float = Field(default=0.7, description="Minimum score threshold for a document to be considered relevant")
     k: int = Field(default=5, description="Number of documents to retrieve")
+    search_params: dict = Field(default_factory=get_search_params, description="Milvus search parameters")
+    return_embeddings: bool = Field(default=False, description="Whether to add each chunk's embedding to its metadata")
 
     def _get_relevant_documents(self) -> List[Any]:
         # This method is not implemented in the base class
         pass
 
+    def search(self, query_embedding, collection: Collection) -> List[Any]:
+        """
+        Search the collection for the k chunks nearest to the query
+
+        Args:
+            query_embedding (list): The normalized query embedding
+            collection (Collection): The collection to search
+
+        Returns:
+            List[Hit]: The hits, each with an id, a distance and an entity holding the title, text and source,
+                and the embedding if return_embeddings is set
+        """
+        result = collection.search(
+            data = [query_embedding],
+            anns_field = "embedding",
+            param = self.search_params,
+            limit = self.k,
+            output_fields = ["title", "text" ,"source", "embedding"] if self.return_embeddings else ["title", "text" ,"source"]
+        )
+        return result[0]
+
     def get_related_documents(self, query_embedding, collection: Collection) -> List[Any]:
         """
-        Get relevant documents based on the query
+        Get the documents whose normalized score reaches the score threshold, most relevant first
 
         Args:
-            query (str): The query string
+            query_embedding (list): The normalized query embedding
+            collection (Collection): The collection to search
 
         Returns:
-            List[Document]: The list of relevant documents
+            List[Document]: The relevant documents, empty if none reaches the threshold
         """
         try:
-            # search_params = {
-            #     "metric_type": "L2",
-            #     "params": {"nprobe": 10}
-            # }
-            search_params = {
-                "metric_type": "IP",
-                "params": {
-                    "ef": 200
-                }
-            }
-            result = collection.search(
-                data = [query_embedding],
-                anns_field = "embedding",
-                param = search_params,
-                limit = self.k,
-                output_fields = ["title", "text" ,"source"]
-            )
-            docs_and_scores = result[0]
+            docs_and_scores = self.search(query_embedding, collection)
         except Exception:
             return []
 
@@ -63,8 +74,9 @@ class ScoreThresholdRetriever(BaseRetriever):
 
         for doc in docs_and_scores:
             score = doc.distance
-            # normalized_score = self._normalize_score(score)
-            # print("Normalized score: ", normalized_score)
+            normalized_score = self._normalize_score(score)
+            if normalized_score < self.score_threshold:
+                continue
             page_content = doc.entity.get("text")
             title = doc.entity.get("title")
             source = doc.entity.get("source")
@@ -75,20 +87,23 @@ class ScoreThresholdRetriever(BaseRetriever):
             if source is None:
                 source = "Unknown"
             page_content =f" (title: {title})" + f" (source: {source})" + page_content + "\n"
-            # if normalized_score < self.score_threshold:
             res = Document(
                 page_content = page_content,
                 metadata = {
+                    'hash_id': doc.id,
                     'score': score,
+                    'normalized_score': normalized_score,
                     'title': title,
                     'source': source
                 }
             )
-            print("Doc: ", doc)
+            if self.return_embeddings:
+                res.metadata['embedding'] = doc.entity.get("embedding")
+            print("Doc: ", {"hash_id": doc.id, "distance": score, "title": title, "source": source})
             relevant_documents.append(res)
 
         # Sort the relevant documents by score in descending order
-        relevant_documents.sort(key=lambda x: x.metadata["score"])
+        relevant_documents.sort(key=lambda x: x.metadata["score"], reverse=True)
 
         return relevant_documents
     
@@ -98,12 +113,10 @@ class ScoreThresholdRetriever(BaseRetriever):
         Normalize the score to a value between 0 and 1
 
         Args:
-            score (float): The score to be normalized
+            score (float): The inner product of normalized embeddings, i.e. their cosine similarity between -1 and 1
 
         Returns:
-            float: The normalized score
+            float: The normalized score, 1 for identical directions and 0.5 for unrelated ones
         """
-        # Assuming Milvus L2 distance, adjust based on your distance metric
-        max_distance = np.sqrt(2)
-        normalized = 1 - (score / max_distance)
-        return max(0, min(1, normalized))
+        normalized = (1 + score) / 2
+        return max(0.0, min(1.0, normalized))
@@ -0,0 +1,33 @@
+import sys
+
+from backend.tracing import start_metrics_server
+from backend.warmup import start_warmup
+
+
+def main():
+    """
+    Run the Streamlit server with the backend warmup started at process start.
+
+    ``streamlit run`` only executes the app script when the first session connects, so anything the
+    script initializes is paid for by the first user. This entry point starts the warmup thread
+    first and then runs the Streamlit CLI in the same process, so the model and vector store load
+    while the server is starting and the sessions share them. The span metrics of backend.tracing are
+    served in the Prometheus text format on TRACING_METRICS_PORT, and the JSON query API of backend.api
+    on API_PORT.
+
+    Usage:
+        python -m backend.server app.py --server.port=5001
+    """
+    start_warmup()
+    start_metrics_server()
+    from backend.api import start_api_server
+    from streamlit.web import cli
+
+    start_api_server()
+
+    sys.argv = ["streamlit", "run", *sys.argv[1:]]
+    sys.exit(cli.main())
+
+
+if __name__ == "__main__":
+    main()
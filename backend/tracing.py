@@ -0,0 +1,352 @@
+import bisect
+import functools
+import http.server
+import os
+import threading
+import time
+from collections import deque
+
+# Record the duration of each stage of query_rag and initialize_milvus; set to 0 to make every span a no-op
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "1") == "1"
+# Port of the Prometheus text endpoint (GET /metrics) started by backend.server; 0 disables it
+TRACING_METRICS_PORT = int(os.environ.get("TRACING_METRICS_PORT", 9464))
+# Number of recent durations per span the p50/p95/p99 are computed from
+TRACING_WINDOW = int(os.environ.get("TRACING_WINDOW", 1024))
+TRACER = None
+TRACER_LOCK = threading.Lock()
+METRICS_SERVER = None
+
+
+class Histogram:
+    """
+    A thread-safe histogram with fixed bucket upper bounds, and optionally a window of recent values for percentiles.
+
+    Used for the span durations of the tracer and for the batch sizes, queue waits and refresh durations
+    of backend.embedding_server and backend.refresh.
+
+    Attributes:
+        bounds (list): The inclusive upper bound of each bucket; larger values go to a final "+Inf" bucket.
+    """
+
+    BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300]
+
+    def __init__(self, bounds=BUCKETS, window=0):
+        """
+        Args:
+            bounds (list, optional): The bucket upper bounds, sorted. Defaults to BUCKETS, in seconds.
+            window (int, optional): The number of recent values the percentiles are computed from; 0 keeps none. Defaults to 0.
+        """
+        self.bounds = list(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._recent = deque(maxlen=window) if window else None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Record a value
+
+        Args:
+            value (float): The value
+        """
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+            self._count += 1
+            self._sum += value
+            if self._recent is not None:
+                self._recent.append(value)
+
+    def snapshot(self, cumulative=True):
+        """
+        Get the count, sum, bucket counts and percentiles
+
+        Args:
+            cumulative (bool, optional): Count the values up to each bound, as Prometheus does, rather than
+                the values in each bucket. Defaults to True.
+
+        Returns:
+            dict: count, sum, mean, p50, p95 and p99 (0.0 without a window), and the count per bucket bound
+        """
+        with self._lock:
+            counts, count, total = list(self._counts), self._count, self._sum
+            recent = sorted(self._recent) if self._recent is not None else []
+        if cumulative:
+            running = 0
+            for index, bucket_count in enumerate(counts):
+                running += bucket_count
+                counts[index] = running
+
+        def percentile(fraction):
+            return recent[min(len(recent) - 1, int(fraction * len(recent)))] if recent else 0.0
+
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "buckets": dict(zip([*map(str, self.bounds), "+Inf"], counts)),
+        }
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Process-wide latency histograms of named spans, e.g. "query.retrieve" or "vector_store.sync".
+
+    ``with tracer.span(name):`` records how long the block took, whether or not it raised. When the
+    tracer is disabled ``span`` returns a shared no-op context manager, so instrumented code costs
+    one attribute check per span.
+
+    Attributes:
+        enabled (bool): Whether spans are recorded.
+    """
+
+    def __init__(self, enabled=True, window=TRACING_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """
+        Time a block
+
+        Args:
+            name (str): The span name
+
+        Returns:
+            A context manager recording the duration of the block under name
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, seconds):
+        """
+        Record a duration measured elsewhere
+
+        Args:
+            name (str): The span name
+            seconds (float): The duration
+        """
+        if not self.enabled:
+            return
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(window=self.window))
+        histogram.observe(seconds)
+
+    def llm_config(self, prefix):
+        """
+        Get the config of a document chain call that records how long the prompt took to assemble and
+        the LLM took to answer, as "{prefix}.prompt", "{prefix}.llm" and "{prefix}.llm_first_token"
+
+        Args:
+            prefix (str): The span name prefix
+
+        Returns:
+            dict: The config to pass to invoke/stream/ainvoke/astream, None when tracing is disabled
+        """
+        if not self.enabled:
+            return None
+        return {"callbacks": [_llm_timing_callback(self, prefix)]}
+
+    def summary(self):
+        """
+        Get the count, mean and percentiles of every span
+
+        Returns:
+            dict: Per span name, sorted by name, the snapshot of its histogram without the buckets
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+        summary = {}
+        for name in sorted(histograms):
+            snapshot = histograms[name].snapshot()
+            del snapshot["buckets"]
+            summary[name] = snapshot
+        return summary
+
+    def prometheus(self):
+        """
+        Render every span histogram in the Prometheus text exposition format
+
+        Returns:
+            str: One rag_span_duration_seconds histogram, labelled by span, plus p50/p95/p99 gauges
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+        lines = [
+            "# HELP rag_span_duration_seconds Duration of each stage of the RAG pipeline.",
+            "# TYPE rag_span_duration_seconds histogram",
+        ]
+        quantiles = []
+        for name in sorted(histograms):
+            snapshot = histograms[name].snapshot()
+            for bound, count in snapshot["buckets"].items():
+                lines.append(f'rag_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'rag_span_duration_seconds_sum{{span="{name}"}} {snapshot["sum"]:.6f}')
+            lines.append(f'rag_span_duration_seconds_count{{span="{name}"}} {snapshot["count"]}')
+            for quantile in ["p50", "p95", "p99"]:
+                quantiles.append(f'rag_span_duration_seconds_recent{{span="{name}",quantile="0.{quantile[1:]}"}} {snapshot[quantile]:.6f}')
+        lines += [
+            f"# HELP rag_span_duration_seconds_recent Percentiles of the last {self.window} durations of each stage.",
+            "# TYPE rag_span_duration_seconds_recent gauge",
+            *quantiles,
+        ]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """
+        Drop every recorded duration
+        """
+        with self._lock:
+            self._histograms = {}
+
+
+def _llm_timing_callback(tracer, prefix):
+    # Imported here: langchain_core callbacks are only needed once a query reaches the LLM
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class LLMTimingCallback(BaseCallbackHandler):
+        # Record on the thread or event loop making the call rather than through an executor
+        run_inline = True
+
+        def __init__(self):
+            self.start = time.perf_counter()
+            self.llm_start = None
+            self.first_token = False
+
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            self.llm_start = time.perf_counter()
+            tracer.record(f"{prefix}.prompt", self.llm_start - self.start)
+
+        def on_llm_new_token(self, token, **kwargs):
+            if not self.first_token and self.llm_start is not None:
+                self.first_token = True
+                tracer.record(f"{prefix}.llm_first_token", time.perf_counter() - self.llm_start)
+
+        def on_llm_end(self, response, **kwargs):
+            if self.llm_start is not None:
+                tracer.record(f"{prefix}.llm", time.perf_counter() - self.llm_start)
+
+    return LLMTimingCallback()
+
+
+def get_tracer():
+    """
+    Get the process-wide tracer
+
+    Returns:
+        Tracer: The shared tracer, enabled unless TRACING_ENABLED is 0
+    """
+    global TRACER
+    if TRACER is None:
+        with TRACER_LOCK:
+            if TRACER is None:
+                TRACER = Tracer(enabled=TRACING_ENABLED)
+    return TRACER
+
+
+def span(name):
+    """
+    Time a block with the process-wide tracer, see Tracer.span
+
+    Args:
+        name (str): The span name
+
+    Returns:
+        A context manager recording the duration of the block under name
+    """
+    return get_tracer().span(name)
+
+
+def traced(name):
+    """
+    Decorator timing every call of a function with the process-wide tracer
+
+    Args:
+        name (str): The span name
+
+    Returns:
+        callable: The decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_tracer().prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=TRACING_METRICS_PORT):
+    """
+    Serve the span histograms in the Prometheus text format at http://0.0.0.0:port/metrics, once
+
+    Args:
+        port (int, optional): The port; 0 does not start the server. Defaults to TRACING_METRICS_PORT.
+
+    Returns:
+        ThreadingHTTPServer: The server, None if it is disabled or the port is unavailable
+    """
+    global METRICS_SERVER
+    if METRICS_SERVER is not None or not port or not TRACING_ENABLED:
+        return METRICS_SERVER
+    try:
+        METRICS_SERVER = http.server.ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    except OSError as e:
+        print(f"Could not start the metrics endpoint on port {port}: {e}")
+        return None
+    METRICS_SERVER.daemon_threads = True
+    threading.Thread(target=METRICS_SERVER.serve_forever, name="metrics-endpoint", daemon=True).start()
+    print(f"Serving span metrics at http://0.0.0.0:{port}/metrics")
+    return METRICS_SERVER
@@ -0,0 +1,91 @@
+import json
+import os
+
+# Index types Milvus Lite can build; other Milvus index types are accepted at creation but never built
+VECTOR_INDEX_TYPES = ['FLAT', 'IVF_FLAT', 'IVF_SQ8', 'HNSW', 'HNSW_SQ']
+# Build parameters of each index type, used unless VECTOR_INDEX_PARAMS is set
+DEFAULT_INDEX_PARAMS = {
+    'FLAT': {},
+    'IVF_FLAT': {"nlist": 128},
+    'IVF_SQ8': {"nlist": 128},
+    'HNSW': {"M": 16, "efConstruction": 200},
+    'HNSW_SQ': {"M": 16, "efConstruction": 200, "sq_type": "SQ8"},
+}
+# Search parameters of each index type, used unless VECTOR_SEARCH_PARAMS is set
+DEFAULT_SEARCH_PARAMS = {
+    'FLAT': {},
+    'IVF_FLAT': {"nprobe": 16},
+    'IVF_SQ8': {"nprobe": 16},
+    'HNSW': {"ef": 200},
+    'HNSW_SQ': {"ef": 200},
+}
+VECTOR_METRIC_TYPE = "IP"
+VECTOR_INDEX_TYPE = os.environ.get("VECTOR_INDEX_TYPE", "HNSW").upper()
+# JSON objects, e.g. VECTOR_INDEX_PARAMS='{"M": 32, "efConstruction": 400}' VECTOR_SEARCH_PARAMS='{"ef": 64}'
+VECTOR_INDEX_PARAMS = json.loads(os.environ.get("VECTOR_INDEX_PARAMS") or "null")
+VECTOR_SEARCH_PARAMS = json.loads(os.environ.get("VECTOR_SEARCH_PARAMS") or "null")
+
+
+def get_index_params(index_type=None, params=None):
+    """
+    Get the index parameters of the embedding field
+
+    Args:
+        index_type (str, optional): One of VECTOR_INDEX_TYPES. Defaults to VECTOR_INDEX_TYPE.
+        params (dict, optional): The build parameters. Defaults to VECTOR_INDEX_PARAMS, or the defaults of the index type.
+
+    Returns:
+        dict: The index type, metric type and build parameters, as passed to Collection.create_index
+
+    Raises:
+        ValueError: If the index type is not supported by Milvus Lite
+    """
+    index_type = (index_type or VECTOR_INDEX_TYPE).upper()
+    if index_type not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"Unsupported vector index type {index_type}, expected one of {VECTOR_INDEX_TYPES}")
+    if params is None:
+        params = VECTOR_INDEX_PARAMS if VECTOR_INDEX_PARAMS is not None and index_type == VECTOR_INDEX_TYPE else DEFAULT_INDEX_PARAMS[index_type]
+    return {"index_type": index_type, "metric_type": VECTOR_METRIC_TYPE, "params": dict(params)}
+
+
+def get_search_params(index_type=None, params=None):
+    """
+    Get the search parameters of the embedding field
+
+    Args:
+        index_type (str, optional): One of VECTOR_INDEX_TYPES. Defaults to VECTOR_INDEX_TYPE.
+        params (dict, optional): The search parameters. Defaults to VECTOR_SEARCH_PARAMS, or the defaults of the index type.
+
+    Returns:
+        dict: The metric type and search parameters, as passed to Collection.search
+    """
+    index_type = (index_type or VECTOR_INDEX_TYPE).upper()
+    if params is None:
+        params = VECTOR_SEARCH_PARAMS if VECTOR_SEARCH_PARAMS is not None and index_type == VECTOR_INDEX_TYPE else DEFAULT_SEARCH_PARAMS.get(index_type, {})
+    return {"metric_type": VECTOR_METRIC_TYPE, "params": dict(params)}
+
+
+def ensure_index(collection, field_name="embedding", index_params=None):
+    """
+    Make sure a collection's vector field is indexed with the given parameters, rebuilding the index if they changed
+
+    Rebuilding only re-indexes the stored embeddings; nothing is re-embedded.
+
+    Args:
+        collection (Collection): The collection
+        field_name (str, optional): The vector field. Defaults to "embedding".
+        index_params (dict, optional): The index parameters. Defaults to get_index_params().
+
+    Returns:
+        bool: True if the index was (re)built
+    """
+    index_params = index_params or get_index_params()
+    current = next((index.params for index in collection.indexes if index.field_name == field_name), None)
+    if current is not None and current.get("index_type") == index_params["index_type"] and current.get("params", {}) == index_params["params"]:
+        return False
+    if current is not None:
+        print(f"Rebuilding the {collection.name} index: {current} -> {index_params}")
+        collection.release()
+        collection.drop_index(index_name=next(index.index_name for index in collection.indexes if index.field_name == field_name))
+    collection.create_index(field_name=field_name, index_params=index_params)
+    return True
@@ -0,0 +1,189 @@
+import importlib
+import threading
+import time
+import traceback
+
+# Modules imported one at a time before the first warmup step, so the startup report shows what each one costs.
+# backend.RAG imports langchain_groq, the document chain and sentence_transformers lazily, so they are listed separately.
+WARMUP_IMPORTS = [
+    "backend.RAG",
+    "langchain_groq.chat_models",
+    "langchain.chains.combine_documents",
+    "sentence_transformers",
+    "backend.async_engine",
+    "backend.refresh",
+]
+# Approximately the time the process started: the launcher imports this module before anything heavy
+PROCESS_START = time.perf_counter()
+WARMUP = None
+WARMUP_LOCK = threading.Lock()
+
+
+class Warmup:
+    """
+    Process-wide background warmup of everything a query needs.
+
+    A daemon thread imports the heavy modules, syncs and loads the Milvus collection, loads the
+    embedding model, encodes a first query, builds the RAG pipeline and starts the background corpus
+    refresher, recording the time each step took. Sessions render immediately and poll ``status()`` to show a readiness indicator.
+
+    Attributes:
+        state (str): "pending", "running", "ready" or "failed".
+        step (str): The step currently running.
+        message (str): The latest progress message of the current step.
+        timings (dict): Seconds taken by each finished step, in the order they ran.
+        errors (dict): The error of each failed step.
+    """
+
+    # Steps without which no query can be answered; the warmup fails if one of them fails
+    REQUIRED_STEPS = ("vector store", "embedding model")
+
+    def __init__(self):
+        self.state = "pending"
+        self.step = None
+        self.message = None
+        self.timings = {}
+        self.errors = {}
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the warmup thread unless it is already running or done
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "running"
+            self.started = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def _progress(self, message):
+        self.message = message
+
+    def _timed(self, step, function, *args, **kwargs):
+        self.step, self.message = step, None
+        start = time.perf_counter()
+        try:
+            function(*args, **kwargs)
+        except Exception as e:
+            self.errors[step] = f"{type(e).__name__}: {e}".splitlines()[0]
+            print(f"Warmup step {step} failed")
+            traceback.print_exc()
+        self.timings[step] = time.perf_counter() - start
+
+    def _run(self):
+        for module in WARMUP_IMPORTS:
+            self._timed(f"import {module}", importlib.import_module, module)
+        if "import backend.RAG" in self.errors:
+            self._finish()
+            return
+        import backend.RAG as RAG
+        from backend.refresh import CORPUS_REFRESH_ENABLED, get_corpus_refresher
+
+        # With background refreshes an old collection is served right away and refreshed once the warmup is done
+        refresh_in_background = CORPUS_REFRESH_ENABLED and RAG.CORPUS_MAX_AGE > 0
+        self._timed("vector store", RAG.initialize_milvus, progress=self._progress, refresh_in_background=refresh_in_background)
+        self._timed("embedding model", RAG.get_embedding_model)
+        # The first encode is much slower than the following ones
+        self._timed("first query embedding", RAG.encode_queries, ["warm up"])
+        if RAG.INTENT_ROUTER_ENABLED:
+            self._timed("intent router", RAG.get_intent_router)
+        if RAG.EMBEDDING_SERVER_ENABLED:
+            self._timed("embedding server", RAG.get_embedding_server)
+        self._timed("rag pipeline", RAG.get_rag_pipeline)
+        if refresh_in_background and "vector store" not in self.errors:
+            self._timed("corpus refresher", get_corpus_refresher().start)
+        self._finish()
+
+    def _finish(self):
+        self.step, self.message = None, None
+        self.finished = time.perf_counter()
+        failed = any(step in self.REQUIRED_STEPS or step.startswith("import backend") for step in self.errors)
+        self.state = "failed" if failed else "ready"
+        self._done.set()
+        print(self.report())
+
+    def is_running(self):
+        """
+        Check whether the warmup is still running
+
+        Returns:
+            bool: True until the warmup has finished, successfully or not
+        """
+        return self.state == "running"
+
+    def wait(self, timeout=None):
+        """
+        Block until the warmup has finished
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to None.
+
+        Returns:
+            bool: True if the warmup finished within the timeout
+        """
+        return self._done.wait(timeout)
+
+    def status(self):
+        """
+        Get the warmup status for a readiness indicator
+
+        Returns:
+            dict: The state, the current step and its latest progress message, and the seconds elapsed since the warmup started
+        """
+        end = self.finished or time.perf_counter()
+        return {
+            "state": self.state,
+            "step": self.step,
+            "message": self.message,
+            "elapsed": end - self.started if self.started else 0.0,
+        }
+
+    def report(self):
+        """
+        Get the startup timing report
+
+        Returns:
+            str: The time of each step, any errors, and when the process became ready
+        """
+        lines = ["Startup timings:"]
+        width = max((len(step) for step in self.timings), default=0)
+        for step, seconds in list(self.timings.items()):
+            error = f"  FAILED: {self.errors[step]}" if step in self.errors else ""
+            lines.append(f"  {step:<{width}}  {seconds:7.2f}s{error}")
+        if self.finished is not None:
+            lines.append(f"  {self.state} {self.finished - PROCESS_START:.2f}s after process start "
+                         f"(warmup started after {self.started - PROCESS_START:.2f}s)")
+        return "\n".join(lines)
+
+
+def get_warmup():
+    """
+    Get the process-wide warmup
+
+    Returns:
+        Warmup: The shared warmup
+    """
+    global WARMUP
+    if WARMUP is None:
+        with WARMUP_LOCK:
+            if WARMUP is None:
+                WARMUP = Warmup()
+    return WARMUP
+
+
+def start_warmup():
+    """
+    Start the process-wide warmup in the background, once; later calls return the same warmup
+
+    Returns:
+        Warmup: The shared warmup
+    """
+    warmup = get_warmup()
+    warmup.start()
+    return warmup
@@ -0,0 +1,256 @@
+"""
+Compare the throughput of the JSON query API with driving the Streamlit UI.
+
+A server process runs app.py under Streamlit with the query API of backend.api next to it, as
+backend.server does, so both paths answer through the same process-wide query engine, collection
+and caches. Each simulated session then asks its questions one after another:
+
+- through the UI, over the WebSocket a browser uses: every question is sent as the value of the
+  chat input, which reruns the whole script (rendering the history, the sidebar metrics and the
+  streamed answer), and the script is rerun once more after the answer, as app.py does;
+- through the API, posting to /query, or to /query/stream and reading the whole stream, over a
+  keep-alive connection, and once more opening a new connection per question.
+
+Retrieval runs against a throwaway Milvus Lite collection of synthetic chunks, and the embedding
+model and LLM are the stubs of benchmarks.load_test, so no model download, Groq key or network
+access is needed. The rate limiter is disabled and the warmup is marked as done.
+
+Usage:
+    python -m benchmarks.api_benchmark --sessions 1 4 16 --queries 8 --llm-latency 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from benchmarks.load_test import percentile
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_PATH, "app.py")
+
+
+def serve(directory, ui_port, api_port, chunks, llm_latency):
+    """
+    Run app.py under Streamlit and the query API in this process, with stub models and a synthetic collection
+    """
+    # ChatGroq validates that a key is set but the stub chat model replaces it
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    # Makes app.py render the chat instead of launching the server
+    os.environ["STREAMLIT_RUNNING"] = "1"
+    import numpy as np
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from pymilvus import connections
+    from streamlit.web import cli
+
+    import backend.api as api
+    import backend.RAG as RAG
+    from backend.ddos_protection import RATE_LIMITER
+    from backend.warmup import get_warmup
+    from benchmarks.load_test import StubChatModel, StubEmbeddingModel
+    from benchmarks.sync_benchmark import synthetic_rows
+
+    connections.connect("default", uri=os.path.join(directory, "api_benchmark.db"))
+    RAG.COLLECTION_NAME = "api_benchmark"
+    # Random query embeddings are unrelated to the synthetic chunks; keep every query on the generation path
+    RAG.RETRIEVER_SCORE_THRESHOLD = 0.0
+    collection = RAG.create_collection(RAG.COLLECTION_NAME)
+    rng = np.random.default_rng(0)
+    for start in range(0, chunks, RAG.INSERT_BATCH_SIZE):
+        collection.insert(synthetic_rows(start, min(RAG.INSERT_BATCH_SIZE, chunks - start), rng))
+    collection.flush()
+    collection.load()
+    RAG.EMBEDDING_MODEL = StubEmbeddingModel()
+    pipeline = RAG.get_rag_pipeline()
+    pipeline.document_chain = create_stuff_documents_chain(StubChatModel(latency=llm_latency), pipeline.prompt)
+
+    # Everything the warmup would load is set up above; without a thread it is never started
+    warmup = get_warmup()
+    warmup._thread = threading.current_thread()
+    warmup.state = "ready"
+    RATE_LIMITER.path = None
+    RATE_LIMITER.max_requests = 10 ** 9
+    api.API_RATE_LIMIT_ENABLED = False
+    api.start_api_server(api_port, host="127.0.0.1")
+    # app.py reads its stylesheet and writes the metrics database relative to the working directory
+    os.symlink(os.path.join(REPO_PATH, "assets"), os.path.join(directory, "assets"))
+    os.chdir(directory)
+    sys.argv = [
+        "streamlit", "run", APP_PATH, f"--server.port={ui_port}", "--server.address=127.0.0.1",
+        "--server.headless=true", "--server.enableXsrfProtection=false", "--server.enableCORS=false",
+        "--browser.gatherUsageStats=false",
+    ]
+    cli.main()
+
+
+def question(label, session, number):
+    # Distinct questions so neither the query embedding cache nor the answer cache hits
+    return f"How do I reset my password? ({label}, session {session}, question {number})"
+
+
+class UISession:
+    """
+    A browser session of the Streamlit app, driven over its WebSocket
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.chat_input_id = None
+
+    async def run(self, chat_input=None):
+        """
+        Rerun the script, with a value sent from the chat input if given, until a run finishes without asking for another
+
+        Args:
+            chat_input (str, optional): The question typed into the chat input. Defaults to None.
+        """
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        if chat_input is not None:
+            widget = message.rerun_script.widget_states.widgets.add()
+            widget.id = self.chat_input_id
+            widget.chat_input_value.data = chat_input
+        await self.websocket.send(message.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.websocket.recv())
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                if element.WhichOneof("type") == "chat_input" and not element.chat_input.disabled:
+                    self.chat_input_id = element.chat_input.id
+            elif kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                if forward.script_finished != ForwardMsg.FINISHED_SUCCESSFULLY:
+                    raise RuntimeError(f"app.py finished with status {forward.script_finished}")
+                return
+
+
+async def run_ui_sessions(label, ui_url, sessions, queries):
+    """
+    Ask questions through the Streamlit UI, one WebSocket per session
+
+    Returns:
+        tuple: Elapsed seconds and the sorted latencies of every question
+    """
+    latencies = []
+    async with contextlib.AsyncExitStack() as stack:
+        # The first page load of each session is not part of asking a question
+        ui_sessions = []
+        for _ in range(sessions):
+            websocket = await stack.enter_async_context(websockets.connect(ui_url, subprotocols=["streamlit"], max_size=None))
+            ui_sessions.append(UISession(websocket))
+            await ui_sessions[-1].run()
+
+        async def session(number):
+            for query_number in range(queries):
+                start = time.perf_counter()
+                await ui_sessions[number].run(question(label, number, query_number))
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(session(number) for number in range(sessions)))
+        return time.perf_counter() - start, sorted(latencies)
+
+
+async def run_api_sessions(label, api_url, sessions, queries, stream=False, keep_alive=True):
+    """
+    Ask questions through the query API, one HTTP client per session
+
+    Returns:
+        tuple: Elapsed seconds and the sorted latencies of every question
+    """
+    latencies = []
+
+    async def session(number):
+        headers = {} if keep_alive else {"Connection": "close"}
+        async with httpx.AsyncClient(base_url=api_url, timeout=120, headers=headers) as client:
+            for query_number in range(queries):
+                body = {"query": question(label, number, query_number)}
+                start = time.perf_counter()
+                if stream:
+                    async with client.stream("POST", "/query/stream", json=body) as response:
+                        response.raise_for_status()
+                        async for _ in response.aiter_lines():
+                            pass
+                else:
+                    response = await client.post("/query", json=body)
+                    response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(number) for number in range(sessions)))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def wait_until_ready(server, urls, timeout=300):
+    # Building the collection and starting Streamlit take a while
+    deadline = time.monotonic() + timeout
+    for url in urls:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"The server exited with code {server.returncode}")
+            try:
+                httpx.get(url).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16], help="Numbers of concurrent sessions")
+    parser.add_argument("--queries", type=int, default=8, help="Questions asked by each session")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds the stub LLM takes to answer")
+    parser.add_argument("--chunks", type=int, default=2000, help="Number of synthetic chunks in the collection")
+    parser.add_argument("--ui-port", type=int, default=18501, help="Port of the Streamlit server")
+    parser.add_argument("--api-port", type=int, default=18002, help="Port of the query API")
+    # Runs the server process in the given directory
+    parser.add_argument("--serve", metavar="DIRECTORY", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.ui_port, args.api_port, args.chunks, args.llm_latency)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.api_benchmark", "--serve", directory, f"--ui-port={args.ui_port}",
+             f"--api-port={args.api_port}", f"--chunks={args.chunks}", f"--llm-latency={args.llm_latency}"],
+            cwd=REPO_PATH,
+            # The query path prints every step
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            api_url = f"http://127.0.0.1:{args.api_port}"
+            ui_url = f"ws://127.0.0.1:{args.ui_port}/_stcore/stream"
+            wait_until_ready(server, [f"http://127.0.0.1:{args.ui_port}/_stcore/health", f"{api_url}/health"])
+            print(f"{'path':<26} {'sessions':>8} {'questions/s':>12} {'p50 s':>8} {'p95 s':>8}")
+            for sessions in args.sessions:
+                runs = [
+                    ("streamlit ui", lambda label: run_ui_sessions(label, ui_url, sessions, args.queries)),
+                    ("api /query", lambda label: run_api_sessions(label, api_url, sessions, args.queries)),
+                    ("api /query/stream", lambda label: run_api_sessions(label, api_url, sessions, args.queries, stream=True)),
+                    ("api /query, no keep-alive", lambda label: run_api_sessions(label, api_url, sessions, args.queries, keep_alive=False)),
+                ]
+                for label, run in runs:
+                    elapsed, latencies = asyncio.run(run(f"{label} {sessions}"))
+                    print(f"{label:<26} {sessions:>8} {len(latencies) / elapsed:>12.2f} "
+                          f"{statistics.median(latencies):>8.3f} {percentile(latencies, 0.95):>8.3f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
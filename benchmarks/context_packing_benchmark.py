@@ -0,0 +1,142 @@
+"""
+Report the context tokens sent to the LLM per query before and after context packing.
+
+Each query is retrieved once with the pipeline's retriever (k chunks above the score threshold,
+with their embeddings) and packed with a ContextPacker. For every query the report shows the chunks
+and estimated tokens of the context and of the whole prompt (system prompt, question and context)
+without packing and with it, followed by the totals and the time packing took. Tokens are estimated
+at backend.context_packing.CHARS_PER_TOKEN characters per token.
+
+By default the real collection at RAG.MILVUS_URI is searched with the benchmarks/queries.json
+queries embedded by the SentenceTransformer. Pass --synthetic to use pages of generated text split
+with the app's text splitter instead, where each query is close to one page so that neighbouring,
+overlapping chunks of that page are retrieved together.
+
+Usage:
+    python -m benchmarks.context_packing_benchmark --budget 1024
+    python -m benchmarks.context_packing_benchmark --synthetic --budget 512 768 1024
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from pymilvus import Collection, connections
+
+import backend.RAG as RAG
+from backend.context_packing import CONTEXT_MMR_LAMBDA, CONTEXT_TOKEN_BUDGET, ContextPacker, estimate_tokens
+from backend.ingestion import IngestionManifest
+from backend.retriever import ScoreThresholdRetriever
+from benchmarks.index_benchmark import QUERIES_PATH, load_queries
+
+WORDS = ("student faculty campus account password reset wifi network printer laptop software license adobe office "
+         "canvas email security phishing authentication duo portal lab computer support ticket request service "
+         "library coyote onecard parking schedule semester registration vpn storage drive backup").split()
+
+
+def synthetic_collection(name, pages, rng, spread=0.5):
+    """
+    Insert pages of generated text, split into chunks, with chunk embeddings close to their page's
+
+    Returns:
+        tuple: The loaded collection and the page embeddings
+    """
+    splitter = RAG.get_text_splitter()
+    page_embeddings = rng.standard_normal((pages, RAG.EMBEDDING_DIMENSION)).astype(np.float32)
+    page_embeddings /= np.linalg.norm(page_embeddings, axis=1, keepdims=True)
+    collection = RAG.create_collection(name)
+    for page in range(pages):
+        sentences = [" ".join(rng.choice(WORDS, rng.integers(8, 20))).capitalize() + "." for _ in range(rng.integers(30, 60))]
+        chunks = splitter.split_documents([Document(page_content=" ".join(sentences))])
+        texts = [chunk.page_content for chunk in chunks]
+        noise = rng.standard_normal((len(texts), RAG.EMBEDDING_DIMENSION)).astype(np.float32)
+        embeddings = page_embeddings[page] + spread * noise / np.linalg.norm(noise, axis=1, keepdims=True)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        collection.insert([
+            [RAG.hash_text(f"{page} {text}") for text in texts],
+            list(embeddings),
+            texts,
+            [f"Page {page}"] * len(texts),
+            [f"https://www.csusb.edu/its/page-{page}"] * len(texts),
+            [False] * len(texts),
+        ])
+    collection.flush()
+    collection.load()
+    return collection, page_embeddings
+
+
+def prompt_tokens(prompt, query, documents):
+    # The stuff documents chain joins the documents with blank lines
+    return estimate_tokens(prompt.format(input=query, context="\n\n".join(document.page_content for document in documents)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, nargs="+", default=[CONTEXT_TOKEN_BUDGET], help="Token budgets to pack into")
+    parser.add_argument("--mmr-lambda", type=float, default=CONTEXT_MMR_LAMBDA, help="Relevance weight of the MMR selection")
+    parser.add_argument("--k", type=int, default=RAG.RETRIEVER_K, help="Number of chunks retrieved per query")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="JSON query set")
+    parser.add_argument("--milvus-uri", default=RAG.MILVUS_URI, help="Milvus Lite database holding the ingested corpus")
+    parser.add_argument("--synthetic", action="store_true", help="Use a synthetic corpus and synthetic query embeddings")
+    parser.add_argument("--pages", type=int, default=200, help="Number of pages in the synthetic corpus")
+    args = parser.parse_args()
+
+    queries = [query["query"] for query in load_queries(args.queries)]
+    with tempfile.TemporaryDirectory() as directory:
+        if args.synthetic:
+            connections.connect("default", uri=os.path.join(directory, "context_packing_benchmark.db"))
+            rng = np.random.default_rng(0)
+            collection, page_embeddings = synthetic_collection("context_packing", args.pages, rng)
+            query_embeddings = page_embeddings[rng.integers(0, args.pages, len(queries))]
+            noise = rng.standard_normal(query_embeddings.shape).astype(np.float32)
+            query_embeddings = query_embeddings + 0.3 * noise / np.linalg.norm(noise, axis=1, keepdims=True)
+            query_embeddings = (query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)).tolist()
+            score_threshold = 0.0
+        else:
+            connections.connect("default", uri=args.milvus_uri)
+            manifest = IngestionManifest(os.path.join(os.path.dirname(args.milvus_uri), os.path.basename(RAG.INGESTION_MANIFEST_PATH)))
+            collection = Collection(manifest.data.get("active_collection", RAG.COLLECTION_NAME))
+            collection.load()
+            query_embeddings = RAG.encode_queries(queries).tolist()
+            score_threshold = RAG.RETRIEVER_SCORE_THRESHOLD
+
+        retriever = ScoreThresholdRetriever(k=args.k, score_threshold=score_threshold, return_embeddings=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            prompt = RAG.create_prompt()
+            results = [retriever.get_related_documents(embedding, collection) for embedding in query_embeddings]
+
+        for budget in args.budget:
+            packer = ContextPacker(token_budget=budget, mmr_lambda=args.mmr_lambda, stats=None)
+            print(f"\nBudget {budget} tokens, MMR lambda {args.mmr_lambda}, k={args.k}")
+            print(f"{'query':<50} {'chunks':>9} {'context tokens':>15} {'prompt tokens':>14} {'merged':>7} {'dropped':>8}")
+            totals = {"before": 0, "after": 0, "prompt_before": 0, "prompt_after": 0}
+            seconds = 0.0
+            for query, documents in zip(queries, results):
+                if not documents:
+                    # Answered with the insufficient information response, no LLM call
+                    print(f"{query[:50]:<50} {'-':>9} {'no LLM call':>15}")
+                    continue
+                start = time.perf_counter()
+                packed, report = packer.pack(documents)
+                seconds += time.perf_counter() - start
+                before, after = prompt_tokens(prompt, query, documents), prompt_tokens(prompt, query, packed)
+                totals["before"] += report["tokens_before"]
+                totals["after"] += report["tokens_after"]
+                totals["prompt_before"] += before
+                totals["prompt_after"] += after
+                print(f"{query[:50]:<50} {report['chunks_before']:>4} -> {report['chunks_after']:<2} "
+                      f"{report['tokens_before']:>6} -> {report['tokens_after']:<5} {before:>5} -> {after:<5} "
+                      f"{report['merged']:>7} {report['redundant'] + report['over_budget']:>8}")
+            packed_queries = sum(1 for documents in results if documents)
+            if packed_queries:
+                print(f"{'total':<50} {'':>9} {totals['before']:>6} -> {totals['after']:<5} {totals['prompt_before']:>5} -> {totals['prompt_after']:<5}"
+                      f"  ({1 - totals['prompt_after'] / totals['prompt_before']:.0%} fewer prompt tokens, "
+                      f"{seconds / packed_queries * 1000:.2f} ms per query to pack)")
+
+
+if __name__ == "__main__":
+    main()
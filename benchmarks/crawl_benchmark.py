@@ -0,0 +1,91 @@
+"""
+Benchmark the incremental re-crawl against a local HTTP server fixture.
+
+Serves a synthetic ITS-like site from a temporary directory with Python's http.server (which
+answers If-Modified-Since with 304), then crawls it three times with IncrementalCrawler:
+a cold crawl, a re-crawl of the unchanged site and a re-crawl after some pages changed.
+No outbound network access is needed.
+
+Usage:
+    python -m benchmarks.crawl_benchmark --pages 200 --changed 10
+"""
+import argparse
+import functools
+import os
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from backend.crawler import CrawlManifest, IncrementalCrawler
+
+PAGE_TEMPLATE = """<html lang="en"><head><title>ITS page {number}</title></head>
+<body><nav>Navigation</nav><div class="page-main-content">
+<h1>ITS page {number} (revision {revision})</h1>
+<p>{body}</p>
+</div><footer>Footer</footer></body></html>"""
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def write_page(root, number, revision=0, mtime=None):
+    path = os.path.join(root, "its", f"page-{number}.html")
+    with open(path, "w") as f:
+        f.write(PAGE_TEMPLATE.format(number=number, revision=revision, body=f"Support article {number}. " * 50))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def build_site(root, number_of_pages, base_url):
+    os.makedirs(os.path.join(root, "its"))
+    links = "\n".join(f'<a href="{base_url}page-{number}.html">Page {number}</a>' for number in range(number_of_pages))
+    with open(os.path.join(root, "its", "index.html"), "w") as f:
+        f.write(f'<html lang="en"><head><title>ITS</title></head><body><div class="page-main-content">{links}</div></body></html>')
+    for number in range(number_of_pages):
+        write_page(root, number)
+
+
+def crawl(base_url, manifest):
+    crawler = IncrementalCrawler(url=base_url, manifest=manifest, max_depth=2)
+    start = time.perf_counter()
+    pages = list(crawler.iter_pages())
+    elapsed = time.perf_counter() - start
+    changed = [page for page in pages if page.changed]
+    # Stand-in for the chunk hashes recorded by initialize_milvus
+    for page in changed:
+        manifest.update(page.url, chunk_hashes=[IncrementalCrawler.content_hash(page.html)])
+    return elapsed, len(pages), len(changed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="Number of pages in the fixture site")
+    parser.add_argument("--changed", type=int, default=10, help="Number of pages changed before the last crawl")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=root))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/its/"
+        build_site(root, args.pages, base_url)
+
+        manifest = CrawlManifest()
+        for label, prepare in [
+            ("cold crawl", None),
+            ("unchanged re-crawl", None),
+            (f"re-crawl, {args.changed} changed", lambda: [
+                write_page(root, number, revision=1, mtime=time.time() + 10) for number in range(args.changed)
+            ]),
+        ]:
+            if prepare:
+                prepare()
+            elapsed, pages, changed = crawl(base_url, manifest)
+            print(f"{label:<24} {pages:>5} pages {changed:>5} to parse/embed {elapsed:>8.3f}s")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark the embedding model backends: PyTorch, ONNX Runtime and int8-quantized ONNX.
+
+For each backend this reports the cold-load time (import plus model load in a fresh Python
+process, after the ONNX export has been cached), the single-query encode latency, the batched
+encode throughput and the cosine agreement of its embeddings with the PyTorch ones.
+
+The ONNX backends need onnxruntime and optimum (pip install "sentence-transformers[onnx]").
+
+Usage:
+    python -m benchmarks.embedding_backend_benchmark --queries 200 --batch-size 32
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from backend.RAG import EMBEDDING_MODEL_CACHE_DIR, MODEL_NAME
+from backend.embedding_backends import EMBEDDING_BACKENDS, PARITY_TEXTS, export_onnx_model, is_onnx_available, load_embedding_model
+
+COLD_LOAD_SCRIPT = """
+import time
+start = time.perf_counter()
+from backend.embedding_backends import load_embedding_model
+load_embedding_model({model_name!r}, {backend!r}, {cache_dir!r}).encode("warm up")
+print(time.perf_counter() - start)
+"""
+
+
+def cold_load_seconds(model_name, backend, cache_dir):
+    script = COLD_LOAD_SCRIPT.format(model_name=model_name, backend=backend, cache_dir=cache_dir)
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200, help="Number of single-query encodes timed per backend")
+    parser.add_argument("--batch-size", type=int, default=32, help="Batch size of the throughput test")
+    parser.add_argument("--model", default=MODEL_NAME, help="Model name or path")
+    parser.add_argument("--cache-dir", default=EMBEDDING_MODEL_CACHE_DIR, help="Where the ONNX exports are cached")
+    args = parser.parse_args()
+
+    backends = EMBEDDING_BACKENDS if is_onnx_available() else ['torch']
+    if len(backends) == 1:
+        print("onnxruntime/optimum are not installed, only benchmarking torch")
+    else:
+        # Export once up front so the cold-load times below do not include it
+        export_onnx_model(args.model, args.cache_dir, quantize=True)
+
+    texts = [f"{PARITY_TEXTS[number % len(PARITY_TEXTS)]} ({number})" for number in range(args.batch_size * 8)]
+    # torch comes first, so its embeddings are the reference
+    reference = None
+    print(f"{'backend':<10} {'cold load s':>12} {'p50 query ms':>13} {'p95 query ms':>13} {'batch texts/s':>14} {'min cosine':>11} {'mean cosine':>12}")
+    for backend in backends:
+        cold_load = cold_load_seconds(args.model, backend, args.cache_dir)
+        model = load_embedding_model(args.model, backend, args.cache_dir)
+
+        latencies = []
+        for number in range(args.queries):
+            start = time.perf_counter()
+            model.encode(PARITY_TEXTS[number % 5], normalize_embeddings=True)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+
+        start = time.perf_counter()
+        embeddings = model.encode(texts, batch_size=args.batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        throughput = len(texts) / (time.perf_counter() - start)
+
+        if reference is None:
+            reference = embeddings
+        cosines = np.sum(embeddings * reference, axis=1)
+        print(f"{backend:<10} {cold_load:>12.2f} {statistics.median(latencies) * 1000:>13.2f} "
+              f"{latencies[int(0.95 * (len(latencies) - 1))] * 1000:>13.2f} {throughput:>14.1f} "
+              f"{cosines.min():>11.4f} {cosines.mean():>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
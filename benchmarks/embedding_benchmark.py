@@ -0,0 +1,88 @@
+"""
+Benchmark the chunk embedding stage used by insert_documents.
+
+Compares the original per-chunk ``model.encode(text)`` loop against the batched
+``embed_texts`` stage and reports chunks/sec for each.
+
+Usage:
+    python -m benchmarks.embedding_benchmark --chunks 500 --batch-sizes 16 32 64 128
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from backend.RAG import MAX_TEXT_LENGTH, embed_texts, get_embedding_model
+
+SAMPLE_SENTENCES = [
+    "Connect to the eduroam wireless network using your CSUSB email and password.",
+    "Multi-factor authentication protects your MyCoyote account from unauthorized access.",
+    "Students can print from any campus computer lab using their Coyote OneCard.",
+    "Microsoft 365 and Adobe Creative Cloud are available to students at no cost.",
+    "Contact the Technology Support Center by phone, email or the self-service portal.",
+    "CoyoteLabs provides virtual access to lab software from your personal device.",
+    "Report suspicious emails to the Information Security and Emerging Technologies office.",
+    "Laptops and chargers can be borrowed from the library for the current term.",
+]
+
+
+def make_chunks(number_of_chunks, chunk_size=1000, seed=0):
+    """
+    Build synthetic ITS-like chunks of roughly the size produced by get_text_splitter
+
+    Args:
+        number_of_chunks (int): The number of chunks to build
+        chunk_size (int, optional): The approximate chunk length in characters. Defaults to 1000.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        list: The synthetic chunk texts
+    """
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(number_of_chunks):
+        sentences = []
+        while sum(len(sentence) + 1 for sentence in sentences) < chunk_size:
+            sentences.append(rng.choice(SAMPLE_SENTENCES))
+        chunks.append(" ".join(sentences)[:MAX_TEXT_LENGTH])
+    return chunks
+
+
+def per_item_loop(texts):
+    """
+    The original ingestion embedding loop: one encode call per chunk
+    """
+    model = get_embedding_model()
+    return [model.encode(text) for text in texts]
+
+
+def time_call(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=500, help="Number of synthetic chunks to embed")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64, 128])
+    args = parser.parse_args()
+
+    texts = make_chunks(args.chunks)
+    # Load the model (and warm it up) outside of the timed sections
+    get_embedding_model().encode(texts[:8])
+
+    elapsed, baseline = time_call(per_item_loop, texts)
+    print(f"{'per-item loop':<20} {len(texts) / elapsed:>10.1f} chunks/sec ({elapsed:.2f}s)")
+    baseline = np.asarray(baseline, dtype=np.float32)
+    baseline /= np.linalg.norm(baseline, axis=1, keepdims=True)
+
+    for batch_size in args.batch_sizes:
+        elapsed, embeddings = time_call(embed_texts, texts, batch_size=batch_size)
+        max_error = float(np.max(np.abs(embeddings - baseline)))
+        print(f"{f'batched ({batch_size})':<20} {len(texts) / elapsed:>10.1f} chunks/sec ({elapsed:.2f}s, max abs diff {max_error:.2e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark HTML cleaning: pages/sec for each parser backend, serial and over the process pool,
+plus a byte-for-byte parity check of every backend against html.parser.
+
+The fixture is a directory of saved ITS pages (one .html file per page). Capture it once with
+--capture, which crawls CORPUS_SOURCE without a manifest and saves the raw HTML.
+
+Usage:
+    python -m benchmarks.html_cleaning_benchmark --capture
+    python -m benchmarks.html_cleaning_benchmark --workers 4
+"""
+import argparse
+import glob
+import hashlib
+import os
+import time
+
+from backend.crawler import CrawlManifest
+from backend.html_cleaning import HTML_CLEAN_WORKERS, HTML_PARSERS, clean_html_documents, is_parser_available
+
+FIXTURE_DIRECTORY = os.path.join(os.path.dirname(__file__), "fixtures", "its_pages")
+
+
+def capture(directory):
+    from backend.RAG import create_crawler
+
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for page in create_crawler(CrawlManifest()).iter_pages():
+        if page.html is None:
+            continue
+        name = hashlib.md5(page.url.encode()).hexdigest()
+        with open(os.path.join(directory, f"{name}.html"), "w", encoding="utf-8") as f:
+            f.write(page.html)
+        count += 1
+    print(f"Saved {count} pages to {directory}")
+
+
+def load_fixture(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append(f.read())
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", default=FIXTURE_DIRECTORY, help="Directory of saved .html pages")
+    parser.add_argument("--capture", action="store_true", help="Crawl CORPUS_SOURCE and save the pages to --fixture")
+    parser.add_argument("--workers", type=int, default=HTML_CLEAN_WORKERS, help="Process pool size")
+    args = parser.parse_args()
+
+    if args.capture:
+        capture(args.fixture)
+        return
+
+    pages = load_fixture(args.fixture)
+    if not pages:
+        parser.error(f"No pages in {args.fixture}, run with --capture first")
+
+    reference = clean_html_documents(pages, parser='html.parser', workers=1)
+    print(f"{len(pages)} pages")
+    for backend in HTML_PARSERS:
+        if not is_parser_available(backend):
+            print(f"{backend:<12} not installed")
+            continue
+        for workers in (1, args.workers):
+            start = time.perf_counter()
+            cleaned = clean_html_documents(pages, parser=backend, workers=workers)
+            elapsed = time.perf_counter() - start
+            mismatches = sum(1 for expected, actual in zip(reference, cleaned) if expected != actual)
+            print(f"{backend:<12} workers={workers:<3} {len(pages) / elapsed:>9.1f} pages/sec  mismatches={mismatches}")
+
+
+if __name__ == "__main__":
+    main()
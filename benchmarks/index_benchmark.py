@@ -0,0 +1,153 @@
+"""
+Benchmark vector index types and parameters: recall@k against exact search, and search latency.
+
+For every configuration the corpus is inserted into a fresh Milvus Lite collection indexed with it,
+and each query in benchmarks/queries.json (the answerable and unanswerable questions of the app)
+is searched ``--repeat`` times. Recall@k is the fraction of the exact top k (brute-force inner
+product in NumPy) that the index returns; latency is the p50 and p99 of single-query searches.
+
+By default the corpus is synthetic: clustered normalized vectors, with each answerable query close
+to a corpus chunk and each unanswerable query a random direction. Pass --milvus-uri to benchmark
+the embeddings of the real collection instead, and --real-embeddings to embed the queries with the
+SentenceTransformer.
+
+Usage:
+    python -m benchmarks.index_benchmark --chunks 20000 --k 5 --repeat 20
+    python -m benchmarks.index_benchmark --milvus-uri /app/milvus/milvus_vector.db --real-embeddings
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from pymilvus import Collection, connections, utility
+
+import backend.RAG as RAG
+from backend.ingestion import IngestionManifest
+from backend.vector_index import ensure_index, get_index_params, get_search_params
+from benchmarks.sync_benchmark import synthetic_rows
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "queries.json")
+# (index type, build parameters, search parameters to try)
+CONFIGURATIONS = [
+    ('FLAT', {}, [{}]),
+    ('IVF_FLAT', {"nlist": 128}, [{"nprobe": 4}, {"nprobe": 16}, {"nprobe": 64}]),
+    ('IVF_SQ8', {"nlist": 128}, [{"nprobe": 16}, {"nprobe": 64}]),
+    ('HNSW', {"M": 8, "efConstruction": 100}, [{"ef": 16}, {"ef": 64}]),
+    ('HNSW', {"M": 16, "efConstruction": 200}, [{"ef": 16}, {"ef": 64}, {"ef": 200}]),
+    ('HNSW', {"M": 32, "efConstruction": 400}, [{"ef": 64}, {"ef": 200}]),
+    ('HNSW_SQ', {"M": 16, "efConstruction": 200, "sq_type": "SQ8"}, [{"ef": 64}, {"ef": 200}]),
+]
+
+
+def load_queries(path=QUERIES_PATH):
+    with open(path) as f:
+        return json.load(f)["queries"]
+
+
+def synthetic_corpus(chunks, rng, clusters=200, spread=0.35):
+    # Chunks of the same page or topic are close together, unlike uniformly random vectors
+    centroids = rng.standard_normal((clusters, RAG.EMBEDDING_DIMENSION), dtype=np.float32)
+    embeddings = centroids[rng.integers(0, clusters, chunks)] + spread * rng.standard_normal((chunks, RAG.EMBEDDING_DIMENSION), dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def synthetic_query_embeddings(queries, corpus, spread=0.5):
+    embeddings = []
+    for query in queries:
+        rng = np.random.default_rng(int(hashlib.md5(query["query"].encode()).hexdigest()[:8], 16))
+        noise = rng.standard_normal(RAG.EMBEDDING_DIMENSION).astype(np.float32)
+        embedding = corpus[rng.integers(len(corpus))] + spread * noise / np.linalg.norm(noise) if query["answerable"] else noise
+        embeddings.append(embedding / np.linalg.norm(embedding))
+    return np.stack(embeddings)
+
+
+def read_corpus(uri):
+    connections.connect("source", uri=uri)
+    manifest = IngestionManifest(os.path.join(os.path.dirname(uri), os.path.basename(RAG.INGESTION_MANIFEST_PATH)))
+    collection = Collection(manifest.data.get("active_collection", RAG.COLLECTION_NAME), using="source")
+    collection.load()
+    iterator = collection.query_iterator(batch_size=RAG.INSERT_BATCH_SIZE, expr="", output_fields=["embedding"])
+    embeddings = []
+    while rows := iterator.next():
+        embeddings.extend(row["embedding"] for row in rows)
+    iterator.close()
+    connections.disconnect("source")
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def build_collection(name, corpus, index_params, settle):
+    start = time.perf_counter()
+    collection = Collection(name=name, schema=RAG.get_collection_schema())
+    ensure_index(collection, index_params=index_params)
+    rng = np.random.default_rng(0)
+    for offset in range(0, len(corpus), RAG.INSERT_BATCH_SIZE):
+        rows = synthetic_rows(offset, min(RAG.INSERT_BATCH_SIZE, len(corpus) - offset), rng)
+        rows[1] = list(corpus[offset:offset + RAG.INSERT_BATCH_SIZE])
+        collection.insert(rows)
+    collection.flush()
+    utility.wait_for_index_building_complete(name)
+    collection.load()
+    build_seconds = time.perf_counter() - start
+    # Milvus Lite compacts the flushed segments and indexes the result in a background thread; until it is done
+    # searches fall back to brute force on unindexed segments, which skews both recall and latency
+    time.sleep(settle)
+    return collection, build_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000, help="Number of chunks in the synthetic corpus")
+    parser.add_argument("--k", type=int, default=RAG.RETRIEVER_K, help="Number of results per search")
+    parser.add_argument("--repeat", type=int, default=20, help="Times each query is searched for the latency percentiles")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="JSON query set")
+    parser.add_argument("--milvus-uri", help="Benchmark the embeddings of this Milvus Lite database instead of a synthetic corpus")
+    parser.add_argument("--real-embeddings", action="store_true", help="Embed the queries with the SentenceTransformer")
+    parser.add_argument("--index-types", nargs="+", help="Only benchmark these index types")
+    parser.add_argument("--settle", type=float, default=5, help="Seconds to let Milvus Lite finish indexing in the background before searching")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = load_queries(args.queries)
+    corpus = read_corpus(args.milvus_uri) if args.milvus_uri else synthetic_corpus(args.chunks, rng)
+    if args.real_embeddings:
+        query_embeddings = RAG.encode_queries([query["query"] for query in queries])
+    else:
+        query_embeddings = synthetic_query_embeddings(queries, corpus)
+    # Ground truth: the exact top k by inner product
+    exact = np.argsort(-(query_embeddings @ corpus.T), axis=1)[:, :args.k]
+    print(f"{len(corpus)} chunks, {len(queries)} queries, k={args.k}")
+
+    print(f"{'index':<10} {'build params':<50} {'search params':<16} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        connections.connect("default", uri=os.path.join(directory, "index_benchmark.db"))
+        for number, (index_type, build_params, search_params_list) in enumerate(CONFIGURATIONS):
+            if args.index_types and index_type not in args.index_types:
+                continue
+            index_params = get_index_params(index_type, build_params)
+            collection, build_seconds = build_collection(f"index_{number}", corpus, index_params, args.settle)
+            for search_params in search_params_list:
+                param = get_search_params(index_type, search_params)
+                for embedding in query_embeddings.tolist():
+                    collection.search(data=[embedding], anns_field="embedding", param=param, limit=args.k)
+                hits, latencies = 0, []
+                for query_number, embedding in enumerate(query_embeddings.tolist()):
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        result = collection.search(data=[embedding], anns_field="embedding", param=param, limit=args.k)
+                        latencies.append(time.perf_counter() - start)
+                    # Row n of the corpus was inserted with the hash_id of "chunk n"
+                    returned = {hit.id for hit in result[0]}
+                    hits += len(returned & {RAG.hash_text(f"chunk {row}") for row in exact[query_number]})
+                latencies.sort()
+                print(f"{index_type:<10} {json.dumps(build_params):<50} {json.dumps(search_params):<16} {build_seconds:>8.2f} "
+                      f"{hits / exact.size:>9.3f} {latencies[len(latencies) // 2] * 1000:>8.2f} "
+                      f"{latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000:>8.2f}")
+            collection.drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Load test of the query path with many concurrent sessions and a stubbed LLM.
+
+Each simulated session sends its queries one after another, like a user reading each answer
+(an exponentially distributed think time) before asking the next question.
+The same workload runs through the synchronous query_rag (one thread per session, as Streamlit
+runs each session's script on its own thread), first encoding each query on its session's thread
+and then through the micro-batching embedding server, and through the shared AsyncQueryEngine, at
+increasing numbers of concurrent sessions. The report shows throughput, latency percentiles and
+the mean embedding batch size, followed by the embedding server's batch-size and queue-wait histograms.
+
+Retrieval runs against a throwaway Milvus Lite collection of synthetic chunks. The LLM is a stub
+chat model that answers after a fixed delay, so no Groq key or network access is needed. By default
+the embedding model is also a stub whose calls are serialized and cost a fixed overhead plus a
+per-text cost, like a CPU-bound model; pass --real-embeddings to load the SentenceTransformer.
+
+Usage:
+    python -m benchmarks.load_test --sessions 1 8 32 64 --queries 8 --think-time 1 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+# ChatGroq validates that a key is set but the stub chat model replaces it
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+import numpy as np
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pymilvus import connections
+
+import backend.RAG as RAG
+from backend.async_engine import AsyncQueryEngine
+from benchmarks.sync_benchmark import synthetic_rows
+
+
+class StubChatModel(BaseChatModel):
+    """
+    A chat model that answers every prompt with the same text after ``latency`` seconds
+    """
+
+    latency: float = 0.5
+    answer: str = "Contact the Technology Support Center.\n\nSource: ITS (https://www.csusb.edu/its)"
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _result(self):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+
+class StubEmbeddingModel:
+    """
+    Stands in for the SentenceTransformer: one call at a time, costing call_overhead + per_text seconds per text.
+    The defaults approximate all-MiniLM-L12-v2 on short queries on one CPU core.
+    """
+
+    def __init__(self, call_overhead=0.02, per_text=0.007):
+        self.call_overhead = call_overhead
+        self.per_text = per_text
+        self._lock = threading.Lock()
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        texts = [sentences] if isinstance(sentences, str) else list(sentences)
+        with self._lock:
+            time.sleep(self.call_overhead + self.per_text * len(texts))
+        embeddings = np.stack([
+            np.random.default_rng(int(hashlib.md5(text.encode()).hexdigest()[:8], 16)).standard_normal(RAG.EMBEDDING_DIMENSION)
+            for text in texts
+        ]).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings[0] if isinstance(sentences, str) else embeddings
+
+
+def run_sessions(answer, sessions, queries_per_session, think_time, run_id):
+    """
+    Run closed-loop sessions, each waiting for an answer and then thinking before its next query
+
+    Returns:
+        tuple: Elapsed seconds and the sorted latencies of every query
+    """
+    latencies = [[] for _ in range(sessions)]
+
+    def session(number):
+        rng = random.Random(f"{run_id}-{number}")
+        for query_number in range(queries_per_session):
+            time.sleep(rng.expovariate(1 / think_time) if think_time else 0)
+            # Distinct queries so neither the query embedding cache nor the answer cache hits
+            query = f"How do I reset my password? (run {run_id}, session {number}, query {query_number})"
+            start = time.perf_counter()
+            answer(query)
+            latencies[number].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(number,)) for number in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sorted(latency for session_latencies in latencies for latency in session_latencies)
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32, 64], help="Numbers of concurrent sessions")
+    parser.add_argument("--queries", type=int, default=8, help="Queries sent by each session")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds a session waits between answer and next query")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds the stub LLM takes to answer")
+    parser.add_argument("--chunks", type=int, default=2000, help="Number of synthetic chunks in the collection")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="AsyncQueryEngine max_concurrency")
+    parser.add_argument("--max-batch-size", type=int, default=RAG.EMBEDDING_SERVER_MAX_BATCH_SIZE, help="Embedding server max batch size")
+    parser.add_argument("--max-wait-ms", type=float, default=RAG.EMBEDDING_SERVER_MAX_WAIT_MS, help="Embedding server max wait")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use the SentenceTransformer instead of the stub")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        connections.connect("default", uri=os.path.join(directory, "load_test.db"))
+        RAG.COLLECTION_NAME = "load_test"
+        # Random query embeddings are unrelated to the synthetic chunks; keep every query on the generation path
+        RAG.RETRIEVER_SCORE_THRESHOLD = 0.0
+        collection = RAG.create_collection(RAG.COLLECTION_NAME)
+        rng = np.random.default_rng(0)
+        for start in range(0, args.chunks, RAG.INSERT_BATCH_SIZE):
+            collection.insert(synthetic_rows(start, min(RAG.INSERT_BATCH_SIZE, args.chunks - start), rng))
+        collection.flush()
+        collection.load()
+
+        if not args.real_embeddings:
+            RAG.EMBEDDING_MODEL = StubEmbeddingModel()
+        RAG.EMBEDDING_SERVER_MAX_BATCH_SIZE = args.max_batch_size
+        RAG.EMBEDDING_SERVER_MAX_WAIT_MS = args.max_wait_ms
+        embedding_server = RAG.get_embedding_server()
+        pipeline = RAG.get_rag_pipeline()
+        pipeline.document_chain = create_stuff_documents_chain(StubChatModel(latency=args.llm_latency), pipeline.prompt)
+        engine = AsyncQueryEngine(
+            max_concurrency=args.max_concurrency,
+            max_pending=max(args.sessions) * 2,
+        )
+        # Warm up both paths; the query path prints every step, so its output is discarded
+        with contextlib.redirect_stdout(io.StringIO()):
+            RAG.query_rag("warm up sync")
+            engine.query("warm up engine")
+
+        paths = [
+            ("sync", False, RAG.query_rag),
+            ("sync + server", True, RAG.query_rag),
+            ("async engine", True, engine.query),
+        ]
+        print(f"{'path':<14} {'sessions':>8} {'queries/s':>10} {'p50 s':>8} {'p95 s':>8} {'emb batch':>10}")
+        for sessions in args.sessions:
+            for label, server_enabled, answer in paths:
+                RAG.EMBEDDING_SERVER_ENABLED = server_enabled
+                before = embedding_server.stats()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    elapsed, latencies = run_sessions(answer, sessions, args.queries, args.think_time, run_id=f"{label}-{sessions}")
+                after = embedding_server.stats()
+                batches = after["batches"] - before["batches"]
+                batch_size = (after["queries"] - before["queries"]) / batches if batches else 1.0
+                print(f"{label:<14} {sessions:>8} {len(latencies) / elapsed:>10.2f} "
+                      f"{statistics.median(latencies):>8.3f} {percentile(latencies, 0.95):>8.3f} {batch_size:>10.2f}")
+        engine.close()
+
+        stats = embedding_server.stats()
+        print(f"\nEmbedding server: {stats['batches']} batches, {stats['queries']} queries, "
+              f"mean batch size {stats['mean_batch_size']}, mean queue wait {stats['mean_queue_wait_ms']}ms")
+        for name in ("batch_size_histogram", "queue_wait_ms_histogram"):
+            print(f"{name}: " + "  ".join(f"{bucket} {count}" for bucket, count in stats[name].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark the performance metrics store under concurrent sessions.
+
+Each simulated session records feedback the way the app does on every rerun: it creates a
+DatabaseClient, increments a count metric, recomputes the derived metrics and reads them all back
+for the sidebar. The same workload runs against the shared write-behind store (DatabaseClient)
+and against the previous approach (a new SQLite connection per rerun, one UPDATE per increment and
+a read-modify-write of the derived metrics), at increasing numbers of concurrent sessions. The
+report shows throughput, latency percentiles, SQLite write transactions and "database is locked"
+errors, and checks that no increment was lost.
+
+Usage:
+    python -m benchmarks.metrics_benchmark --sessions 1 8 32 --events 200
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from metrics.chatbot_statistics import COUNT_METRICS, PERFORMANCE_METRICS_ROW_ID, DatabaseClient, safe_divide
+
+
+class PerRerunDatabaseClient:
+    """
+    The previous DatabaseClient: a connection per instance and a write transaction per call
+    """
+
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(db_path, timeout=5)
+        self.transactions = 0
+
+    def create_performance_metrics_table(self):
+        with self.connection:
+            self.connection.execute("DROP TABLE IF EXISTS performance_metrics;")
+            self.connection.execute('''
+            CREATE TABLE performance_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                true_positive INTEGER, true_negative INTEGER, false_positive INTEGER, false_negative INTEGER,
+                accuracy REAL, precision REAL, sensitivity REAL, specificity REAL, f1_score REAL
+            )
+        ''')
+            self.connection.execute('''
+                INSERT INTO performance_metrics VALUES (1, 0, 0, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
+            ''')
+
+    def increment_performance_metric(self, metric, increment_value=1):
+        with self.connection:
+            self.connection.execute(f'''
+                UPDATE performance_metrics
+                SET {metric} = CASE WHEN {metric} + ? < 0 THEN 0 ELSE {metric} + ? END
+                WHERE id = ?
+            ''', (increment_value, increment_value, PERFORMANCE_METRICS_ROW_ID))
+        self.transactions += 1
+
+    def update_performance_metrics(self):
+        tp, tn, fp, fn = self.connection.execute(
+            f"SELECT {', '.join(COUNT_METRICS)} FROM performance_metrics WHERE id = ?", (PERFORMANCE_METRICS_ROW_ID,)
+        ).fetchone()
+        precision, sensitivity = safe_divide(tp, tp + fp), safe_divide(tp, tp + fn)
+        f1_score = None if precision is None or sensitivity is None else safe_divide(2 * precision * sensitivity, precision + sensitivity)
+        with self.connection:
+            self.connection.execute('''
+                UPDATE performance_metrics SET accuracy = ?, precision = ?, sensitivity = ?, specificity = ?, f1_score = ?
+                WHERE id = ?
+            ''', (safe_divide(tp + tn, tp + tn + fp + fn), precision, sensitivity, safe_divide(tn, tn + fp), f1_score, PERFORMANCE_METRICS_ROW_ID))
+        self.transactions += 1
+
+    def get_performance_metrics(self):
+        cursor = self.connection.cursor()
+        cursor.row_factory = sqlite3.Row
+        return dict(cursor.execute("SELECT * FROM performance_metrics WHERE id = ?", (PERFORMANCE_METRICS_ROW_ID,)).fetchone())
+
+
+def run_sessions(make_client, sessions, events):
+    """
+    Record events feedback events per session from concurrent sessions
+
+    Returns:
+        tuple: Latencies, the number of increments per metric, the number of errors and transactions written
+    """
+    latencies = [[] for _ in range(sessions)]
+    increments = [dict.fromkeys(COUNT_METRICS, 0) for _ in range(sessions)]
+    errors = [0] * sessions
+    transactions = [0] * sessions
+
+    def session(number):
+        rng = random.Random(number)
+        for _ in range(events):
+            metric = rng.choice(COUNT_METRICS)
+            start = time.perf_counter()
+            client = make_client()
+            try:
+                client.increment_performance_metric(metric)
+                increments[number][metric] += 1
+                client.update_performance_metrics()
+                client.get_performance_metrics()
+            except sqlite3.OperationalError:
+                errors[number] += 1
+            latencies[number].append(time.perf_counter() - start)
+            transactions[number] += getattr(client, "transactions", 0)
+            if hasattr(client, "connection"):
+                client.connection.close()
+
+    threads = [threading.Thread(target=session, args=(number,)) for number in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    totals = {metric: sum(counts[metric] for counts in increments) for metric in COUNT_METRICS}
+    return [latency for session_latencies in latencies for latency in session_latencies], totals, sum(errors), sum(transactions)
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32], help="Numbers of concurrent sessions")
+    parser.add_argument("--events", type=int, default=200, help="Feedback events per session")
+    args = parser.parse_args()
+
+    print(f"{'store':<12} {'sessions':>8} {'events/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'writes':>7} {'errors':>7} {'lost':>5}")
+    with tempfile.TemporaryDirectory() as directory:
+        for sessions in args.sessions:
+            for name in ["per-rerun", "write-behind"]:
+                db_path = os.path.join(directory, f"{name}_{sessions}.db")
+                if name == "per-rerun":
+                    PerRerunDatabaseClient(db_path).create_performance_metrics_table()
+                    make_client = lambda: PerRerunDatabaseClient(db_path)
+                else:
+                    DatabaseClient(db_path).create_performance_metrics_table()
+                    make_client = lambda: DatabaseClient(db_path)
+                start = time.perf_counter()
+                latencies, totals, errors, writes = run_sessions(make_client, sessions, args.events)
+                seconds = time.perf_counter() - start
+                if name == "write-behind":
+                    client = DatabaseClient(db_path)
+                    client.flush()
+                    writes = client.store.flushes
+                stored = sqlite3.connect(db_path).execute(
+                    f"SELECT {', '.join(COUNT_METRICS)} FROM performance_metrics WHERE id = ?", (PERFORMANCE_METRICS_ROW_ID,)
+                ).fetchone()
+                lost = sum(totals.values()) - sum(stored)
+                print(f"{name:<12} {sessions:>8} {len(latencies) / seconds:>9.0f} {percentile(latencies, 0.5) * 1000:>8.3f} "
+                      f"{percentile(latencies, 0.99) * 1000:>8.3f} {writes:>7} {errors:>7} {lost:>5}")
+
+
+if __name__ == "__main__":
+    main()
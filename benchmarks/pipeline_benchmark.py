@@ -0,0 +1,61 @@
+"""
+Latency breakdown of the per-query construction overhead removed by the shared RAG pipeline.
+
+Before the pipeline, every query_rag call built a ChatGroq client, the prompt, the retriever,
+the stuff-documents chain and a Collection handle. This script times each of those components
+when built per query and compares the total against fetching the cached pipeline.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark --runs 20
+"""
+import argparse
+import os
+import statistics
+import time
+
+# ChatGroq validates that a key is set but no request is made by this benchmark
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from pymilvus import connections
+
+from backend.RAG import MILVUS_URI, RAGPipeline, get_pipeline_config, get_rag_pipeline, invalidate_rag_pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20, help="Number of simulated queries")
+    parser.add_argument("--uri", default=MILVUS_URI, help="Milvus Lite database holding the collection")
+    args = parser.parse_args()
+
+    connections.connect("default", uri=args.uri)
+    config = get_pipeline_config()
+
+    # Per-query construction, as query_rag used to do
+    timings = {}
+    for _ in range(args.runs):
+        pipeline = RAGPipeline(config)
+        for name, seconds in pipeline.build_timings.items():
+            timings.setdefault(name, []).append(seconds)
+
+    print(f"{'component':<20} {'mean ms':>10} {'p95 ms':>10}")
+    total = 0.0
+    for name, samples in timings.items():
+        mean = statistics.mean(samples)
+        total += mean
+        p95 = sorted(samples)[int(0.95 * (len(samples) - 1))]
+        print(f"{name:<20} {mean * 1000:>10.3f} {p95 * 1000:>10.3f}")
+    print(f"{'per-query total':<20} {total * 1000:>10.3f}")
+
+    # Shared pipeline: built once, then fetched on every query
+    invalidate_rag_pipeline()
+    get_rag_pipeline()
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        get_rag_pipeline()
+    cached = (time.perf_counter() - start) / args.runs
+    print(f"{'cached pipeline':<20} {cached * 1000:>10.3f}")
+    print(f"Saved per query: {(total - cached) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark the rate limiter at 1k requests/sec.
+
+Replays a paced stream of chat submissions from many users against the shared RateLimiter and
+against the previous approach (re-read the whole JSON file, check, rewrite it with indent=4 on
+every request), reporting per-request latency and the rate actually sustained. The requests are
+spread over several threads to mimic concurrent Streamlit sessions; a final check verifies that
+no user got more than RATE_LIMIT_MAX_REQUESTS requests through in a window.
+
+Usage:
+    python -m benchmarks.rate_limiter_benchmark --rate 1000 --seconds 5 --users 2000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from backend.ddos_protection import RATE_LIMIT_LOCKOUT, RATE_LIMIT_MAX_REQUESTS, RATE_LIMIT_WINDOW, RateLimiter
+
+
+class JsonFileRateLimiter:
+    """
+    The previous per-request JSON round trip, without Streamlit session state.
+    Concurrent sessions can read a half-written file; those reads are counted and treated as empty.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.corrupt_reads = 0
+
+    def allow(self, user_ip, now=None):
+        now = time.time() if now is None else now
+        data = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                try:
+                    data = json.load(f)
+                except ValueError:
+                    self.corrupt_reads += 1
+        user_requests = defaultdict(list, data.get('user_requests', {}))
+        lockout_time = data.get('lockout_time', {})
+        if now < lockout_time.get(user_ip, 0):
+            return False
+        user_requests[user_ip] = [timestamp for timestamp in user_requests[user_ip] if now - timestamp < RATE_LIMIT_WINDOW]
+        if len(user_requests[user_ip]) >= RATE_LIMIT_MAX_REQUESTS:
+            lockout_time[user_ip] = now + RATE_LIMIT_LOCKOUT
+            allowed = False
+        else:
+            user_requests[user_ip].append(now)
+            allowed = True
+        with open(self.path, 'w') as f:
+            json.dump({'user_requests': user_requests, 'lockout_time': lockout_time}, f, indent=4)
+        return allowed
+
+
+def replay(limiter, requests, rate, threads):
+    """
+    Send (user, offset) requests at offset / rate seconds from the start, split over threads
+    """
+    latencies = [[] for _ in range(threads)]
+    allowed = [[] for _ in range(threads)]
+    start = time.perf_counter()
+
+    def worker(index):
+        for number in range(index, len(requests), threads):
+            user_ip = requests[number]
+            delay = start + number / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            before = time.perf_counter()
+            if limiter.allow(user_ip, now=time.time()):
+                allowed[index].append((user_ip, time.time()))
+            latencies[index].append(time.perf_counter() - before)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return elapsed, sorted(latency for chunk in latencies for latency in chunk), [item for chunk in allowed for item in chunk]
+
+
+def over_limit(allowed):
+    """
+    Count users with more than RATE_LIMIT_MAX_REQUESTS allowed requests inside one window
+    """
+    by_user = defaultdict(list)
+    for user_ip, timestamp in allowed:
+        by_user[user_ip].append(timestamp)
+    violations = 0
+    for timestamps in by_user.values():
+        timestamps.sort()
+        for first, last in zip(timestamps, timestamps[RATE_LIMIT_MAX_REQUESTS:]):
+            if last - first < RATE_LIMIT_WINDOW:
+                violations += 1
+                break
+    return violations
+
+
+def report(label, elapsed, latencies, allowed, total):
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{label:<24} {total / elapsed:>8.0f} req/s sustained  p50={p50:>8.3f}ms  p99={p99:>8.3f}ms  "
+          f"allowed={len(allowed)}  users over limit={over_limit(allowed)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=1000, help="Target requests per second")
+    parser.add_argument("--seconds", type=float, default=5, help="Duration of the replay")
+    parser.add_argument("--users", type=int, default=2000, help="Number of distinct users")
+    parser.add_argument("--threads", type=int, default=8, help="Number of concurrent sessions sending requests")
+    parser.add_argument("--skip-json", action="store_true", help="Skip the per-request JSON file baseline")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # A few heavy users so the limit actually triggers
+    heavy_users = [f"heavy-{number}" for number in range(10)]
+    total = int(args.rate * args.seconds)
+    requests = [rng.choice(heavy_users) if rng.random() < 0.2 else f"user-{rng.randrange(args.users)}" for _ in range(total)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        limiters = [("shared RateLimiter", RateLimiter(
+            max_requests=RATE_LIMIT_MAX_REQUESTS,
+            window=RATE_LIMIT_WINDOW,
+            lockout=RATE_LIMIT_LOCKOUT,
+            path=os.path.join(directory, "snapshot.json"),
+            snapshot_interval=1,
+        ))]
+        if not args.skip_json:
+            limiters.append(("per-request JSON file", JsonFileRateLimiter(os.path.join(directory, "legacy.json"))))
+        print(f"{total} requests from {args.users + len(heavy_users)} users at {args.rate} req/s over {args.threads} threads")
+        for label, limiter in limiters:
+            elapsed, latencies, allowed = replay(limiter, requests, args.rate, args.threads)
+            report(label, elapsed, latencies, allowed, total)
+            if isinstance(limiter, RateLimiter):
+                limiter.save()
+            path = getattr(limiter, "path", None)
+            if path and os.path.exists(path):
+                print(f"{'':<24} state file: {os.path.getsize(path) / 1024:.1f} KiB")
+            if hasattr(limiter, "corrupt_reads"):
+                print(f"{'':<24} corrupt reads from racing sessions: {limiter.corrupt_reads}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark the Milvus and NumPy exact-search retrievers side by side.
+
+For each corpus size a synthetic corpus is inserted into a Milvus Lite collection indexed with the
+configured index (VECTOR_INDEX_TYPE), and exported to a memory-mapped embedding matrix. Each query
+in benchmarks/queries.json is then retrieved ``--repeat`` times through
+``ScoreThresholdRetriever.get_related_documents`` and ``ExactSearchRetriever.get_related_documents``,
+the calls the RAG pipeline makes. The report shows the p50 and p99 latency of both, the time it
+took to export the matrix, and the fraction of the Milvus top k the exact search also returns.
+
+Usage:
+    python -m benchmarks.retriever_benchmark --chunks 1000 5000 20000 --repeat 50
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+from pymilvus import connections
+
+import backend.RAG as RAG
+from backend.exact_search import ExactSearchRetriever, get_embedding_matrix
+from backend.retriever import ScoreThresholdRetriever
+from backend.vector_index import get_index_params
+from benchmarks.index_benchmark import QUERIES_PATH, build_collection, load_queries, synthetic_corpus, synthetic_query_embeddings
+
+
+def percentile(latencies, fraction):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+
+def time_retriever(retriever, collection, query_embeddings, repeat):
+    latencies, results = [], []
+    # get_related_documents prints every document it returns
+    with contextlib.redirect_stdout(io.StringIO()):
+        for embedding in query_embeddings:
+            retriever.get_related_documents(embedding, collection)
+        for embedding in query_embeddings:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                documents = retriever.get_related_documents(embedding, collection)
+                latencies.append(time.perf_counter() - start)
+            results.append({document.metadata["hash_id"] for document in documents})
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 5000, 20000], help="Corpus sizes to benchmark")
+    parser.add_argument("--k", type=int, default=RAG.RETRIEVER_K, help="Number of documents per retrieval")
+    parser.add_argument("--repeat", type=int, default=20, help="Times each query is retrieved for the latency percentiles")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="JSON query set")
+    parser.add_argument("--settle", type=float, default=5, help="Seconds to let Milvus Lite finish indexing in the background before searching")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    index_params = get_index_params()
+    print(f"{len(queries)} queries, k={args.k}, Milvus index {index_params['index_type']} {index_params['params']}")
+    print(f"{'chunks':>8} {'export s':>9} {'milvus p50':>11} {'milvus p99':>11} {'numpy p50':>10} {'numpy p99':>10} {'overlap':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        connections.connect("default", uri=os.path.join(directory, "retriever_benchmark.db"))
+        for chunks in args.chunks:
+            corpus = synthetic_corpus(chunks, np.random.default_rng(0))
+            query_embeddings = synthetic_query_embeddings(queries, corpus).tolist()
+            collection, _ = build_collection(f"retriever_{chunks}", corpus, index_params, args.settle)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                matrix = get_embedding_matrix(collection, directory)
+            export_seconds = time.perf_counter() - start
+
+            # No threshold, so both retrievers build all k documents
+            milvus = ScoreThresholdRetriever(k=args.k, score_threshold=0.0)
+            exact = ExactSearchRetriever(k=args.k, score_threshold=0.0, matrix=matrix)
+            milvus_latencies, milvus_results = time_retriever(milvus, collection, query_embeddings, args.repeat)
+            exact_latencies, exact_results = time_retriever(exact, collection, query_embeddings, args.repeat)
+            overlap = sum(len(a & b) for a, b in zip(milvus_results, exact_results)) / max(1, sum(len(a) for a in milvus_results))
+            print(f"{chunks:>8} {export_seconds:>9.2f} {percentile(milvus_latencies, 0.5) * 1000:>9.2f}ms "
+                  f"{percentile(milvus_latencies, 0.99) * 1000:>9.2f}ms {percentile(exact_latencies, 0.5) * 1000:>8.2f}ms "
+                  f"{percentile(exact_latencies, 0.99) * 1000:>8.2f}ms {overlap:>8.3f}")
+            collection.drop()
+
+
+if __name__ == "__main__":
+    main()
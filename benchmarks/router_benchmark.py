@@ -0,0 +1,163 @@
+"""
+Benchmark the intent router in front of the RAG pipeline: its cost per query and the LLM calls it avoids.
+
+The cost of the greeting filter is measured for the previous implementation (eight patterns rebuilt
+and searched one by one per query) and for the compiled alternation, along with the time to build
+the router (embedding the intent examples) and to classify an already embedded query.
+
+The SQA question sets of app.py (benchmarks/queries.json), plus a few greetings, are then routed
+as query_rag routes them: the greeting filter first, then the nearest intent centroid, then the
+answer cache. The report shows, per set, the queries sent down each route, the fraction of LLM
+calls avoided, and answerable questions routed away from the LLM. A second pass asks every
+question again, after the first answer of each was cached, to show the answer cache route.
+
+The greeting and off-topic routes are off by default (INTENT_ROUTER_GREETING, INTENT_ROUTER_OFF_TOPIC);
+pass --greeting and --off-topic to calibrate the threshold and margin with them on, and check that no
+answerable question is routed away from the LLM.
+
+Embeddings come from the SentenceTransformer; --hashed-embeddings uses a bag-of-words hashing
+encoder instead, which runs without the model but does not route like it.
+
+Usage:
+    python -m benchmarks.router_benchmark
+    python -m benchmarks.router_benchmark --greeting --off-topic --threshold 0.4 0.5 0.6 --margin 0.1
+"""
+import argparse
+import hashlib
+import re
+import time
+
+import numpy as np
+
+import backend.RAG as RAG
+from backend.answer_cache import SemanticAnswerCache
+from backend.intent_router import (
+    INTENT_ROUTER_FAQ_SIMILARITY, INTENT_ROUTER_GREETING, INTENT_ROUTER_MARGIN, INTENT_ROUTER_OFF_TOPIC, INTENT_ROUTER_THRESHOLD,
+    IntentRouter,
+)
+from benchmarks.index_benchmark import QUERIES_PATH, load_queries
+
+GREETINGS = [
+    "Hi",
+    "Hello, who are you?",
+    "Thanks for the help!",
+    "Good evening",
+    "What can you help me with?",
+    "Are you a real person?",
+]
+
+
+def legacy_is_filtered_query(query):
+    # The greeting filter before the intent router, for comparison
+    patterns = [
+        r"\b(hi|hello|hey|hiya|howdy|greetings|yo)\b",
+        r"who (are|r) you\??",
+        r"what('?s| is) your name\??",
+        r"what('?s| is) your role\??",
+        r"(hi|hello|hey|yo),? (who are you|what('?s| is) your name)\??",
+        r"(hi|hello|hey|yo),? (what do you do|what can you do)\??",
+        r"good (morning|afternoon|evening),? (who are you|what('?s| is) your role)\??",
+        r"(what can you do for me)\??"
+    ]
+    normalized = query.strip().lower()
+    for pattern in patterns:
+        if re.search(pattern, normalized):
+            return True
+    return False
+
+
+def hashed_encode(texts):
+    """
+    Embed texts as normalized bags of hashed words, a stand-in for the SentenceTransformer
+    """
+    embeddings = np.zeros((len(texts), RAG.EMBEDDING_DIMENSION), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            embeddings[row, int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % RAG.EMBEDDING_DIMENSION] += 1
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+def per_call_microseconds(function, arguments, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for argument in arguments:
+            function(argument)
+    return (time.perf_counter() - start) / (repeat * len(arguments)) * 1e6
+
+
+def route(router, answer_cache, query, embedding):
+    """
+    Route a query the way RAG.prepare_query does
+
+    Returns:
+        tuple: The route, the nearest intent and its similarity
+    """
+    if RAG.is_filtered_query(query):
+        return "pattern", "-", 1.0
+    name, intent, similarity = router.classify(embedding)
+    if name == "rag" and answer_cache.lookup_similar(embedding, router.faq_similarity) is not None:
+        name = "faq"
+    return name, intent, similarity
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, nargs="+", default=[INTENT_ROUTER_THRESHOLD], help="Router similarity thresholds")
+    parser.add_argument("--margin", type=float, default=INTENT_ROUTER_MARGIN, help="Lead over the closest ITS intent")
+    parser.add_argument("--faq-similarity", type=float, default=INTENT_ROUTER_FAQ_SIMILARITY, help="Answer cache route similarity")
+    parser.add_argument("--greeting", action="store_true", default=INTENT_ROUTER_GREETING, help="Turn the greeting route on")
+    parser.add_argument("--off-topic", action="store_true", default=INTENT_ROUTER_OFF_TOPIC, help="Turn the off-topic route on")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="JSON query set")
+    parser.add_argument("--hashed-embeddings", action="store_true", help="Use a hashing encoder instead of the SentenceTransformer")
+    parser.add_argument("--repeat", type=int, default=2000, help="Repetitions of the query set when timing")
+    parser.add_argument("--verbose", action="store_true", help="Print the route of every query")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    sets = {
+        "answerable": [query["query"] for query in queries if query["answerable"]],
+        "unanswerable": [query["query"] for query in queries if not query["answerable"]],
+        "greetings": GREETINGS,
+    }
+    encode = hashed_encode if args.hashed_embeddings else RAG.encode_queries
+    all_queries = [query for questions in sets.values() for query in questions]
+    encode(["warm up"])
+    embeddings = dict(zip(all_queries, np.asarray(encode(all_queries), dtype=np.float32)))
+
+    start = time.perf_counter()
+    router = IntentRouter(encode, margin=args.margin, faq_similarity=args.faq_similarity,
+                          greeting=args.greeting, off_topic=args.off_topic)
+    build_seconds = time.perf_counter() - start
+    print(f"Router cost per query over {len(all_queries)} queries:")
+    print(f"  greeting filter, eight re.search calls  {per_call_microseconds(legacy_is_filtered_query, all_queries, args.repeat):8.2f} us")
+    print(f"  greeting filter, compiled alternation    {per_call_microseconds(RAG.is_filtered_query, all_queries, args.repeat):8.2f} us")
+    print(f"  nearest intent centroid                  {per_call_microseconds(router.classify, list(embeddings.values()), args.repeat):8.2f} us")
+    print(f"  building the router ({len(router.intents)} intents)        {build_seconds * 1000:8.1f} ms, once per process")
+
+    for threshold in args.threshold:
+        router.threshold = threshold
+        print(f"\nThreshold {threshold}, margin {args.margin}, answer cache similarity {args.faq_similarity}, "
+              f"greeting route {'on' if args.greeting else 'off'}, off-topic route {'on' if args.off_topic else 'off'}")
+        print(f"{'set':<13} {'pass':<7} {'queries':>7} {'pattern':>8} {'greeting':>9} {'off_topic':>10} {'faq':>5} {'rag':>5} {'LLM calls avoided':>18}")
+        answer_cache = SemanticAnswerCache()
+        for number in ["first", "repeat"]:
+            for name, questions in sets.items():
+                counts = dict.fromkeys(["pattern", "greeting", "off_topic", "faq", "rag"], 0)
+                for query in questions:
+                    routed, intent, similarity = route(router, answer_cache, query, embeddings[query])
+                    counts[routed] += 1
+                    if routed == "rag":
+                        # Stands in for the LLM answer finalize_response caches
+                        answer_cache.store(embeddings[query], [], f"Answer to {query}", "Unknown")
+                    if args.verbose and number == "first":
+                        print(f"  {routed:<9} {intent:<24} {similarity:5.2f}  {query}")
+                    elif name == "answerable" and routed in ("greeting", "off_topic"):
+                        print(f"  answerable question routed to {routed} ({intent}, {similarity:.2f}): {query}")
+                avoided = 1 - counts["rag"] / len(questions)
+                print(f"{name:<13} {number:<7} {len(questions):>7} {counts['pattern']:>8} {counts['greeting']:>9} "
+                      f"{counts['off_topic']:>10} {counts['faq']:>5} {counts['rag']:>5} {avoided:>18.0%}")
+
+
+if __name__ == "__main__":
+    main()
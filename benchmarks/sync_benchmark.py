@@ -0,0 +1,78 @@
+"""
+Benchmark the vector store sync stage over a synthetic 10k-chunk corpus.
+
+Builds a throwaway Milvus Lite database with the vector store schema and random normalized
+embeddings (so embedding cost is excluded), then compares deleting stale chunks one
+``hash_id == '...'`` expression at a time against the batched ``delete_hashes``, and one big
+insert against bounded insert batches.
+
+Usage:
+    python -m benchmarks.sync_benchmark --chunks 10000 --stale 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from pymilvus import connections
+
+from backend.RAG import DELETE_BATCH_SIZE, EMBEDDING_DIMENSION, INSERT_BATCH_SIZE, create_collection, delete_hashes, hash_text
+
+
+def synthetic_rows(start, count, rng):
+    hash_ids = [hash_text(f"chunk {number}") for number in range(start, start + count)]
+    embeddings = rng.standard_normal((count, EMBEDDING_DIMENSION), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    texts = [f"Synthetic ITS chunk {number}" for number in range(start, start + count)]
+    titles = ["Synthetic"] * count
+    sources = [f"https://www.csusb.edu/its/page-{number // 10}" for number in range(start, start + count)]
+    return [hash_ids, list(embeddings), texts, titles, sources, [False] * count]
+
+
+def timed(label, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<36} {elapsed:>8.3f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000, help="Number of chunks in the synthetic corpus")
+    parser.add_argument("--stale", type=int, default=1000, help="Number of chunks deleted by each strategy")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        connections.connect("default", uri=os.path.join(directory, "sync_benchmark.db"))
+
+        single = create_collection("single_insert")
+        timed(f"insert {args.chunks} in one call", lambda: single.insert(synthetic_rows(0, args.chunks, rng)))
+
+        batched = create_collection("batched_insert")
+
+        def insert_batches():
+            for start in range(0, args.chunks, INSERT_BATCH_SIZE):
+                batched.insert(synthetic_rows(start, min(INSERT_BATCH_SIZE, args.chunks - start), rng))
+        timed(f"insert {args.chunks} in batches of {INSERT_BATCH_SIZE}", insert_batches)
+
+        stale = [hash_text(f"chunk {number}") for number in range(args.stale)]
+
+        def delete_one_by_one():
+            for hash_to_delete in stale:
+                single.delete(expr=f"hash_id == '{hash_to_delete}'")
+        per_hash = timed(f"delete {args.stale} one hash at a time", delete_one_by_one)
+        bulk = timed(f"delete {args.stale} in batches of {DELETE_BATCH_SIZE}", lambda: delete_hashes(batched, stale))
+        print(f"Bulk delete speedup: {per_hash / bulk:.1f}x")
+
+        for collection in (single, batched):
+            collection.flush()
+            collection.load()
+            remaining = collection.query(expr="dynamically_generated == false", output_fields=["count(*)"])[0]["count(*)"]
+            print(f"{collection.name}: {remaining} chunks remaining")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Evaluate the retriever score threshold: LLM calls avoided on unanswerable questions, and answerable
+questions wrongly turned away.
+
+Each query in benchmarks/queries.json is embedded and searched once. Then, for each threshold, the
+retrieved documents are filtered the way ScoreThresholdRetriever filters them and passed through
+RAG.build_query_context, the step that decides between the insufficient information response and a
+call to the LLM (the answer cache is cleared before each query). A query calls the LLM when at least
+one retrieved chunk reaches the threshold. The report shows, for each threshold, the fraction of
+unanswerable queries answered without the LLM and the fraction of answerable queries that still
+reach it. The row marked * is the configured RETRIEVER_SCORE_THRESHOLD.
+
+By default the real collection at RAG.MILVUS_URI is searched with queries embedded by the
+SentenceTransformer. Pass --synthetic to run against a synthetic corpus instead (answerable queries
+close to a chunk, unanswerable ones random directions); it checks the harness, not the threshold.
+
+Usage:
+    python -m benchmarks.threshold_eval
+    python -m benchmarks.threshold_eval --thresholds 0.6 0.65 0.7 0.75 --show-scores
+    python -m benchmarks.threshold_eval --synthetic
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import types
+
+import numpy as np
+from pymilvus import Collection, connections
+
+import backend.RAG as RAG
+from backend.ingestion import IngestionManifest
+from backend.retriever import ScoreThresholdRetriever
+from backend.vector_index import get_index_params
+from benchmarks.index_benchmark import QUERIES_PATH, build_collection, load_queries, synthetic_corpus, synthetic_query_embeddings
+
+DEFAULT_THRESHOLDS = [0.55, 0.6, 0.625, 0.65, 0.675, 0.7, 0.725, 0.75, 0.8]
+
+
+def calls_llm(query, query_embedding, documents, threshold):
+    documents = [document for document in documents if document.metadata["normalized_score"] >= threshold]
+    RAG.ANSWER_CACHE.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        answer, context = RAG.build_query_context(query["query"], query_embedding, documents, pipeline=types.SimpleNamespace(context_packer=None))
+    return context is not None
+
+
+def evaluate(queries, query_embeddings, collection, k, thresholds, show_scores):
+    # One search per query without a threshold; each threshold then filters the same results
+    retriever = ScoreThresholdRetriever(k=k, score_threshold=0.0)
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for embedding in query_embeddings:
+            results.append(retriever.get_related_documents(embedding, collection))
+    if show_scores:
+        for query, documents in zip(queries, results):
+            best = documents[0].metadata["normalized_score"] if documents else 0.0
+            print(f"{'answerable' if query['answerable'] else 'unanswerable':<13} {best:.3f}  {query['query']}")
+        print()
+
+    answerable = [number for number, query in enumerate(queries) if query["answerable"]]
+    unanswerable = [number for number, query in enumerate(queries) if not query["answerable"]]
+    print(f"{len(answerable)} answerable and {len(unanswerable)} unanswerable queries, k={k}")
+    print(f"{'threshold':>10} {'unanswerable LLM calls avoided':>31} {'answerable LLM calls kept':>26} {'LLM calls':>10}")
+    for threshold in sorted(set(thresholds) | {RAG.RETRIEVER_SCORE_THRESHOLD}):
+        calls = [calls_llm(query, embedding, documents, threshold) for query, embedding, documents in zip(queries, query_embeddings, results)]
+        avoided = sum(not calls[number] for number in unanswerable)
+        kept = sum(calls[number] for number in answerable)
+        marker = "*" if threshold == RAG.RETRIEVER_SCORE_THRESHOLD else " "
+        print(f"{threshold:>9.3f}{marker} {f'{avoided}/{len(unanswerable)}':>25} ({avoided / max(1, len(unanswerable)):>4.0%}) "
+              f"{f'{kept}/{len(answerable)}':>19} ({kept / max(1, len(answerable)):>4.0%}) {sum(calls):>6}/{len(calls)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=DEFAULT_THRESHOLDS, help="Normalized score thresholds to evaluate")
+    parser.add_argument("--k", type=int, default=RAG.RETRIEVER_K, help="Number of documents per retrieval")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="JSON query set")
+    parser.add_argument("--milvus-uri", default=RAG.MILVUS_URI, help="Milvus Lite database holding the ingested corpus")
+    parser.add_argument("--synthetic", action="store_true", help="Use a synthetic corpus and synthetic query embeddings")
+    parser.add_argument("--chunks", type=int, default=5000, help="Number of chunks in the synthetic corpus")
+    parser.add_argument("--show-scores", action="store_true", help="Print the best normalized score of every query")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as directory:
+            connections.connect("default", uri=os.path.join(directory, "threshold_eval.db"))
+            corpus = synthetic_corpus(args.chunks, np.random.default_rng(0))
+            collection, _ = build_collection("threshold_eval", corpus, get_index_params(), settle=2)
+            evaluate(queries, synthetic_query_embeddings(queries, corpus).tolist(), collection, args.k, args.thresholds, args.show_scores)
+        return
+
+    connections.connect("default", uri=args.milvus_uri)
+    manifest = IngestionManifest(os.path.join(os.path.dirname(args.milvus_uri), os.path.basename(RAG.INGESTION_MANIFEST_PATH)))
+    collection = Collection(manifest.data.get("active_collection", RAG.COLLECTION_NAME))
+    collection.load()
+    query_embeddings = RAG.encode_queries([query["query"] for query in queries]).tolist()
+    evaluate(queries, query_embeddings, collection, args.k, args.thresholds, args.show_scores)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,76 @@
+import atexit
+import os
 import sqlite3
+import threading
 from datetime import datetime
 
 PERFORMANCE_METRICS_ROW_ID = 1
-class DatabaseClient:
+# Seconds between flushes of the in-memory metrics to SQLite; they are also flushed at exit
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+COUNT_METRICS = ['true_positive', 'true_negative', 'false_positive', 'false_negative']
+DERIVED_METRICS = ['accuracy', 'precision', 'sensitivity', 'specificity', 'f1_score']
+METRICS_STORES = {}
+METRICS_STORES_LOCK = threading.Lock()
+
+
+def safe_divide(numerator: int, denominator: int, default: float = None):
     """
-    A class to interact with the SQLite database for storing performance metrics
+    Safely divide two numbers and return the result. If the denominator is zero, return the default value.
+
+    Args:
+        numerator (int): The numerator of the division.
+        denominator (int): The denominator of the division.
+        default (float, optional): The default value to return if the denominator is zero. Defaults to None.
+
+    Returns:
+        float: The result of the division, or None if the denominator is zero
     """
-    def __init__(self, db_path="chatbot_stats.db"):
-        self.connection = sqlite3.connect(db_path)
-        
-    def create_performance_metrics_table(self):
+    if denominator == 0:
+        return default
+    return round(numerator / denominator, 3)
+
+
+class PerformanceMetricsStore:
+    """
+    Process-wide performance metrics, kept in memory and written behind to a WAL-mode SQLite database.
+
+    Increments are applied under a lock to the in-memory row, so concurrent sessions never wait on
+    SQLite. A background thread writes the row in one transaction every ``flush_interval`` seconds
+    if it changed, and once more at exit. The row is read back at startup, so the metrics survive restarts.
+
+    Attributes:
+        db_path (str): The SQLite database file.
+        flush_interval (float): Seconds between flushes.
+        flushes (int): The number of transactions written.
+    """
+
+    def __init__(self, db_path, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flushes = 0
+        self._metrics = dict.fromkeys(COUNT_METRICS, 0)
+        self._metrics.update(dict.fromkeys(DERIVED_METRICS, 0.0))
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        # Only used by flush() under _flush_lock, from the flusher thread or at exit
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL;")
+            self._connection.execute("PRAGMA synchronous=NORMAL;")
+        self.load()
+        self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def create_table(self):
         """
-        Create a table for performance metrics if it doesn't exist
+        Create the performance metrics table and its row if they don't exist
         """
-        with self.connection:
-            self.connection.execute("DROP TABLE IF EXISTS performance_metrics;")
-            self.connection.execute('''
-            CREATE TABLE performance_metrics (
+        with self._flush_lock, self._connection:
+            self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS performance_metrics (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 true_positive INTEGER,
                 true_negative INTEGER,
@@ -29,16 +83,155 @@ class DatabaseClient:
                 f1_score REAL
             )
         ''')
+            self._connection.execute('''
+                    INSERT OR IGNORE INTO performance_metrics (id, true_positive, true_negative, false_positive, false_negative, accuracy, precision, sensitivity, specificity, f1_score)
+                    VALUES (?, 0, 0, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
+                ''', (PERFORMANCE_METRICS_ROW_ID,))
+
+    def load(self):
+        """
+        Create the performance metrics table if it doesn't exist and read its row into memory
+        """
+        self.create_table()
+        with self._flush_lock:
+            cursor = self._connection.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(f'''
+                SELECT {", ".join(COUNT_METRICS + DERIVED_METRICS)} FROM performance_metrics
+                WHERE id = ?
+            ''', (PERFORMANCE_METRICS_ROW_ID,))
+            row = dict(cursor.fetchone())
+        with self._lock:
+            self._metrics.update(row)
+
+    def increment(self, metric, increment_value=1):
+        """
+        Increment a count metric, never below zero
+
+        Args:
+            metric (str): One of COUNT_METRICS.
+            increment_value (int, optional): The amount to increment the metric by. Defaults to 1.
+        """
+        with self._lock:
+            self._metrics[metric] = max(0, self._metrics[metric] + increment_value)
+            self._dirty = True
+
+    def update_derived_metrics(self):
+        """
+        Recompute accuracy, precision, sensitivity, specificity and F1 score from the current counts
+        """
+        with self._lock:
+            tp, tn, fp, fn = (self._metrics[metric] for metric in COUNT_METRICS)
+            accuracy = safe_divide(tp + tn, tp + tn + fp + fn)
+            precision = safe_divide(tp, tp + fp)
+            sensitivity = safe_divide(tp, tp + fn)
+            specificity = safe_divide(tn, tn + fp)
+            if precision is None or sensitivity is None:
+                f1_score = None
+            else:
+                f1_score = safe_divide(2 * precision * sensitivity, precision + sensitivity)
+            self._metrics.update(accuracy=accuracy, precision=precision, sensitivity=sensitivity, specificity=specificity, f1_score=f1_score)
+            self._dirty = True
+
+    def reset(self):
+        """
+        Reset every metric to zero
+        """
+        with self._lock:
+            self._metrics.update(dict.fromkeys(COUNT_METRICS, 0))
+            self._metrics.update(dict.fromkeys(DERIVED_METRICS, 0.0))
+            self._dirty = True
+
+    def snapshot(self):
+        """
+        Get a consistent copy of the metrics
+
+        Returns:
+            dict: The count and derived metrics
+        """
+        with self._lock:
+            return dict(self._metrics)
+
+    def flush(self):
+        """
+        Write the metrics to SQLite in one transaction if they changed since the last flush
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                metrics = dict(self._metrics)
+                self._dirty = False
+            columns = COUNT_METRICS + DERIVED_METRICS
+            try:
+                with self._connection:
+                    self._connection.execute(f'''
+                        UPDATE performance_metrics
+                        SET {", ".join(f"{column} = ?" for column in columns)}
+                        WHERE id = ?
+                    ''', [metrics[column] for column in columns] + [PERFORMANCE_METRICS_ROW_ID])
+            except sqlite3.Error as e:
+                print(f"Could not flush the performance metrics to {self.db_path}: {e}")
+                with self._lock:
+                    self._dirty = True
+                return
+            self.flushes += 1
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """
+        Stop the flusher thread and write the metrics one last time
+        """
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self.flush()
+
+
+def get_metrics_store(db_path="chatbot_stats.db"):
+    """
+    Get the process-wide metrics store of a database file
+
+    Args:
+        db_path (str, optional): The SQLite database file. Defaults to "chatbot_stats.db".
+
+    Returns:
+        PerformanceMetricsStore: The shared store
+    """
+    key = os.path.abspath(db_path)
+    store = METRICS_STORES.get(key)
+    if store is None:
+        with METRICS_STORES_LOCK:
+            store = METRICS_STORES.get(key)
+            if store is None:
+                store = METRICS_STORES[key] = PerformanceMetricsStore(db_path)
+    return store
+
+
+class DatabaseClient:
+    """
+    A class to interact with the SQLite database for storing performance metrics
+
+    Cheap to create on every rerun: every client of a database file shares one PerformanceMetricsStore,
+    which keeps the metrics in memory and writes them behind to SQLite.
+    """
+    def __init__(self, db_path="chatbot_stats.db"):
+        self.store = get_metrics_store(db_path)
+
+    def create_performance_metrics_table(self):
+        """
+        Create a table for performance metrics if it doesn't exist
+        """
+        self.store.create_table()
 
     def insert_default_performance_metrics(self):
         """
-        Insert a default row of performance metrics into the database
+        Insert a default row of performance metrics into the database if it doesn't exist
         """
-        with self.connection:
-            self.connection.execute('''
-                    INSERT INTO performance_metrics (id, true_positive, true_negative, false_positive, false_negative, accuracy, precision, sensitivity, specificity, f1_score)
-                    VALUES (1, 0, 0, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
-                ''')
+        self.store.create_table()
 
     def increment_performance_metric(self, metric: str, increment_value: int = 1):
         """
@@ -49,20 +242,11 @@ class DatabaseClient:
             increment_value (int, optional): The amount to increment the metric by. Defaults to 1.
         """
 
-        valid_metrics = {'true_positive', 'true_negative', 'false_positive', 'false_negative'}
+        valid_metrics = set(COUNT_METRICS)
         if metric not in valid_metrics:
             raise ValueError(f"Invalid metric: {metric}. Valid metrics are {valid_metrics}")
 
-        # Increment a metric by a given value
-        with self.connection:
-            self.connection.execute(f'''
-                UPDATE performance_metrics
-                SET {metric} = CASE
-                    WHEN {metric} + ? < 0 THEN 0
-                    ELSE {metric} + ?
-                END
-                WHERE id = ?
-            ''', (increment_value, increment_value, PERFORMANCE_METRICS_ROW_ID))
+        self.store.increment(metric, increment_value)
 
     def safe_divide(self, numerator: int, denominator: int, default: float = None):
         """
@@ -76,36 +260,19 @@ class DatabaseClient:
         Returns:
             float: The result of the division, or None if the denominator is zero
         """
-        if denominator == 0:
-            return default
-        return round(numerator / denominator, 3)
+        return safe_divide(numerator, denominator, default)
 
 
     def update_performance_metrics(self):
         """
         Update the performance metrics based on the current values of true positive, true negative, false positive, and false negative
         """
-        metrics = self.get_performance_metrics('true_positive, true_negative, false_positive, false_negative')
-        accuracy = self.safe_divide(metrics['true_positive'] + metrics['true_negative'], metrics['true_positive'] + metrics['true_negative'] + metrics['false_positive'] + metrics['false_negative'])
-        precision = self.safe_divide(metrics['true_positive'], metrics['true_positive'] + metrics['false_positive'])
-        sensitivity = self.safe_divide(metrics['true_positive'], metrics['true_positive'] + metrics['false_negative'])
-        specificity = self.safe_divide(metrics['true_negative'], metrics['true_negative'] + metrics['false_positive'])
-        if precision is None or sensitivity is None:
-            f1_score = None
-        else:
-            f1_score = self.safe_divide(2 * precision * sensitivity, precision + sensitivity)
-
-        with self.connection:
-            self.connection.execute('''
-                UPDATE performance_metrics
-                SET accuracy = ?, precision = ?, sensitivity = ?, specificity = ?, f1_score = ?
-                WHERE id = ?
-            ''', (accuracy, precision, sensitivity, specificity, f1_score, PERFORMANCE_METRICS_ROW_ID))
+        self.store.update_derived_metrics()
 
 
     def get_performance_metrics(self, columns: str='*'):
         """
-        Get the performance metrics from the database
+        Get the performance metrics
 
         Args:
             columns (str, optional): The columns to retrieve. Defaults to '*'.
@@ -113,29 +280,19 @@ class DatabaseClient:
         Returns:
             dict: A dictionary containing the performance metrics
         """
-        allowed_columns = ["true_positive", "true_negative", "false_positive", "false_negative", "accuracy", "precision", "sensitivity", "specificity", "f1_score"]
+        metrics = self.store.snapshot()
         if columns == '*':
-            validated_columns = columns
-        else:
-            validated_columns = ", ".join([column for column in columns.split(',') if column.strip() in allowed_columns])
-        cursor = self.connection.cursor()
-        cursor.row_factory = sqlite3.Row
-        cursor.execute(f'''
-            SELECT {validated_columns} FROM performance_metrics
-            WHERE id = ?
-        ''', (PERFORMANCE_METRICS_ROW_ID,))
-        result = cursor.fetchone()
-        if not result:
-            return {}
-        return dict(result)
-    
+            return dict(id=PERFORMANCE_METRICS_ROW_ID, **metrics)
+        return {column.strip(): metrics[column.strip()] for column in columns.split(',') if column.strip() in metrics}
+
     def reset_performance_metrics(self):
         """
         Reset the performance metrics to zero
         """
-        with self.connection:
-            self.connection.execute('''
-                UPDATE performance_metrics
-                SET true_positive = 0, true_negative = 0, false_positive = 0, false_negative = 0, accuracy = 0.0, precision = 0.0, sensitivity = 0.0, specificity = 0.0, f1_score = 0.0
-                WHERE id = ?
-            ''', (PERFORMANCE_METRICS_ROW_ID,))
+        self.store.reset()
+
+    def flush(self):
+        """
+        Write the performance metrics to the database now rather than at the next flush
+        """
+        self.store.flush()
@@ -0,0 +1,136 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.crawler import CrawlManifest, IncrementalCrawler
+
+LAST_MODIFIED = "Mon, 05 Oct 2026 10:00:00 GMT"
+
+
+class Site:
+    """
+    The pages served by the fixture, by path, and the requests it received
+    """
+
+    def __init__(self):
+        self.pages = {}
+        # Pages served with Last-Modified only, so revalidating them relies on If-Modified-Since
+        self.without_etag = set()
+        self.requests = []
+
+
+def page(*links, text=""):
+    anchors = "".join(f'<a href="/its/{link}">{link}</a>' for link in links)
+    return f'<html lang="en"><head><title>ITS</title></head><body><div class="page-main-content">{text}{anchors}</div></body></html>'
+
+
+@pytest.fixture
+def site():
+    site = Site()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            site.requests.append((self.path, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+            html = site.pages.get(self.path)
+            if html is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            etag = None if self.path in site.without_etag else f'"{hashlib.md5(html.encode()).hexdigest()}"'
+            if (etag and self.headers.get("If-None-Match") == etag) or (
+                not etag and self.headers.get("If-Modified-Since") == LAST_MODIFIED
+            ):
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = html.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Last-Modified", LAST_MODIFIED)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    site.url = f"http://127.0.0.1:{server.server_address[1]}/its"
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(site, manifest):
+    crawler = IncrementalCrawler(site.url, manifest, max_depth=2, max_workers=2)
+    site.requests.clear()
+    pages = {page.url: page for page in crawler.iter_pages()}
+    # Stands in for ingestion, which records the chunks of every page it split
+    for url in pages:
+        manifest.update(url, chunk_hashes=[])
+    return pages, crawler.removed_urls()
+
+
+def test_recrawl_reuses_unchanged_pages_and_prunes_removed_ones(site, tmp_path):
+    site.pages = {
+        "/its": page("accounts", "wifi", "printing"),
+        "/its/accounts": page(text="Reset your password"),
+        "/its/wifi": page(text="Connect to eduroam"),
+        "/its/printing": page(text="Print from your laptop"),
+    }
+    site.without_etag = {"/its/wifi"}
+    manifest = CrawlManifest(str(tmp_path / "crawl_manifest.json"))
+    pages, removed = crawl(site, manifest)
+    assert {url: page.changed for url, page in pages.items()} == {
+        site.url: True,
+        f"{site.url}/accounts": True,
+        f"{site.url}/wifi": True,
+        f"{site.url}/printing": True,
+    }
+    assert removed == []
+    assert all(if_none_match is None and if_modified_since is None for _, if_none_match, if_modified_since in site.requests)
+    assert manifest.get(f"{site.url}/accounts")["etag"]
+    assert manifest.get(f"{site.url}/wifi")["last_modified"] == LAST_MODIFIED
+    manifest.save()
+
+    # The printing page is removed from the site and its link, and the accounts page changes
+    site.pages["/its"] = page("accounts", "wifi")
+    site.pages["/its/accounts"] = page(text="Reset your password online")
+    del site.pages["/its/printing"]
+    manifest = CrawlManifest(str(tmp_path / "crawl_manifest.json"))
+    pages, removed = crawl(site, manifest)
+
+    assert {url: page.changed for url, page in pages.items()} == {
+        site.url: True,
+        f"{site.url}/accounts": True,
+        f"{site.url}/wifi": False,
+    }
+    assert pages[f"{site.url}/accounts"].html == site.pages["/its/accounts"]
+    assert pages[f"{site.url}/wifi"].html is None
+    requests = {path: (if_none_match, if_modified_since) for path, if_none_match, if_modified_since in site.requests}
+    assert requests["/its/accounts"][0] is not None
+    assert requests["/its/wifi"] == (None, LAST_MODIFIED)
+    assert "/its/printing" not in requests
+    assert removed == [f"{site.url}/printing"]
+    assert manifest.get(f"{site.url}/printing") is None
+
+
+def test_pages_missing_from_the_vector_store_are_fetched_unconditionally(site):
+    site.pages = {"/its": page(text="Contact the help desk")}
+    manifest = CrawlManifest()
+    crawl(site, manifest)
+    manifest.update(site.url, chunk_hashes=["missing"])
+
+    crawler = IncrementalCrawler(site.url, manifest, max_depth=1)
+    site.requests.clear()
+    [fetched] = crawler.iter_pages(known_hashes={"other"})
+    assert site.requests == [("/its", None, None)]
+    # Reported as changed so that ingestion splits and inserts it again
+    assert fetched.changed is True
+    assert fetched.html == site.pages["/its"]
@@ -0,0 +1,96 @@
+import json
+import os
+import socket
+import tempfile
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import pytest
+
+# Keep the rate limiter snapshot out of the working directory
+os.environ.setdefault("RATE_LIMIT_DATA_PATH", os.path.join(tempfile.mkdtemp(), "user_rate_limit_data.json"))
+
+import backend.ddos_protection as ddos_protection  # noqa: E402
+
+
+class SessionState(dict):
+    # Supports the attribute access of st.session_state
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def connect(*args, **kwargs):
+        raise AssertionError("get_client_ip made an outbound connection")
+
+    monkeypatch.setattr(socket.socket, "connect", connect)
+    monkeypatch.setattr(socket, "create_connection", connect)
+    state = SessionState()
+    monkeypatch.setattr(ddos_protection.st, "session_state", state)
+    monkeypatch.setattr(ddos_protection, "TRUSTED_PROXIES", {"10.0.0.1"})
+
+    def open_session(headers, ip_address=None):
+        monkeypatch.setattr(ddos_protection.st, "context", SimpleNamespace(headers=headers, ip_address=ip_address))
+        return state
+
+    return open_session
+
+
+def test_prefers_x_real_ip(session):
+    session({"X-Real-IP": " 203.0.113.7 ", "X-Forwarded-For": "198.51.100.1"}, ip_address="10.0.0.1")
+    assert ddos_protection.get_client_ip() == "203.0.113.7"
+
+
+def test_uses_first_x_forwarded_for_hop(session):
+    session({"X-Forwarded-For": "198.51.100.1, 10.0.0.2, 10.0.0.3"}, ip_address="10.0.0.1")
+    assert ddos_protection.get_client_ip() == "198.51.100.1"
+
+
+def test_ignores_forwarded_headers_from_untrusted_peers(session):
+    session({"X-Real-IP": "203.0.113.7", "X-Forwarded-For": "198.51.100.1"}, ip_address="192.0.2.5")
+    assert ddos_protection.get_client_ip() == "192.0.2.5"
+
+
+def test_ignores_forwarded_headers_without_peer_address(session):
+    session({"X-Real-IP": "203.0.113.7"})
+    assert ddos_protection.get_client_ip() == "Unavailable"
+
+
+def test_falls_back_to_ip_address(session):
+    session({}, ip_address="192.0.2.5")
+    assert ddos_protection.get_client_ip() == "192.0.2.5"
+
+
+def test_unavailable_without_any_address(session):
+    session({})
+    assert ddos_protection.get_client_ip() == "Unavailable"
+
+
+def test_remote_ip_is_memoized_in_session_state(session, monkeypatch):
+    state = session({"X-Real-IP": "203.0.113.7"})
+    calls = []
+    monkeypatch.setattr(ddos_protection, "get_client_ip", lambda: calls.append(1) or "203.0.113.7")
+    first = ddos_protection.get_remote_ip()
+    assert ddos_protection.get_remote_ip() == first
+    assert state["hashed_remote_ip"] == first
+    assert len(calls) == 1
+
+
+def test_load_skips_users_without_timestamps(tmp_path):
+    path = tmp_path / "user_rate_limit_data.json"
+    now = time.time()
+    path.write_text(json.dumps({"user_requests": {"empty": [], "recent": [now - 1]}, "lockout_time": {}}))
+    limiter = ddos_protection.RateLimiter(path=str(path))
+    assert len(limiter) == 1
+    limiter._requests["compacted"] = deque()
+    limiter.compact(now=now)
+    assert len(limiter) == 1
+    assert limiter.allow("empty", now=now)